@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+from lib.benchmarks import bm25_benchmark, wand_benchmark, analyzer_benchmark, build_benchmark, load_benchmark, matrix_benchmark, postings_benchmark, boolean_benchmark, semantic_benchmark, ann_benchmark, quantization_benchmark, coldstart_benchmark, batch_benchmark, pooling_benchmark, backend_benchmark, hybrid_benchmark, depth_benchmark, legs_benchmark, fusion_benchmark, cache_benchmark
+from lib.search_utils import RESULT_LIMIT, BENCHMARK_DOC_COUNTS, BENCHMARK_LEGACY_MAX_DOCS, BENCHMARK_WORKERS, BENCHMARK_POSTING_DOCS, BENCHMARK_CHUNK_COUNTS, BENCHMARK_LEGACY_MAX_CHUNKS, BENCHMARK_NPROBES, BENCHMARK_QUANTIZATION_CHUNKS, BENCHMARK_BATCH_QUERIES, BENCHMARK_POOLING_CHUNKS, BENCHMARK_BACKEND_TEXTS, BENCHMARK_HYBRID_DOCS, BENCHMARK_LEG_TIMEOUT, BENCHMARK_FUSION_CANDIDATES, BENCHMARK_CACHE_LOOKUPS, SEMANTIC_MODEL, MULTIMODAL_MODEL, INFERENCE_BACKENDS
+
+import argparse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Benchmark CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    bm25_parser = subparsers.add_parser("bm25", help="Compare posting-list BM25 scoring with scoring every document")
+    bm25_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_DOC_COUNTS, help="Synthetic corpus sizes")
+    bm25_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+    bm25_parser.add_argument("--legacy-max-docs", type=int, default=BENCHMARK_LEGACY_MAX_DOCS, help="Largest corpus to run the exhaustive scorer on")
+
+    wand_parser = subparsers.add_parser("wand", help="Compare WAND-pruned top-k BM25 with exhaustive posting-list scoring")
+    wand_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_DOC_COUNTS, help="Synthetic corpus sizes")
+    wand_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    analyzer_parser = subparsers.add_parser("analyzer", help="Compare Analyzer with per-call tokenization setup")
+    analyzer_parser.add_argument("--docs", type=int, default=BENCHMARK_DOC_COUNTS[0], help="Synthetic corpus size")
+
+    build_parser = subparsers.add_parser("build", help="Measure inverted index build time across worker counts")
+    build_parser.add_argument("--docs", type=int, default=BENCHMARK_DOC_COUNTS[1], help="Synthetic corpus size")
+    build_parser.add_argument("--workers", type=int, nargs="+", default=BENCHMARK_WORKERS, help="Worker counts to build with")
+
+    load_parser = subparsers.add_parser("load", help="Compare loading the pickled index with opening the index segment")
+    load_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_DOC_COUNTS, help="Synthetic corpus sizes")
+    load_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    matrix_parser = subparsers.add_parser("matrix", help="Compare the sparse document-term matrix with a Counter per document")
+    matrix_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_DOC_COUNTS, help="Synthetic corpus sizes")
+    matrix_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    postings_parser = subparsers.add_parser("postings", help="Compare block-compressed posting lists with sets of document IDs")
+    postings_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_POSTING_DOCS, help="Synthetic corpus sizes")
+
+    boolean_parser = subparsers.add_parser("boolean", help="Compare boolean keyword search with the token-by-token union")
+    boolean_parser.add_argument("--docs", type=int, nargs="+", default=BENCHMARK_DOC_COUNTS, help="Synthetic corpus sizes")
+    boolean_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    semantic_parser = subparsers.add_parser("semantic", help="Compare matrix-product semantic search with per-embedding cosine similarity")
+    semantic_parser.add_argument("--chunks", type=int, nargs="+", default=BENCHMARK_CHUNK_COUNTS, help="Random embedding counts")
+    semantic_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+    semantic_parser.add_argument("--legacy-max-chunks", type=int, default=BENCHMARK_LEGACY_MAX_CHUNKS, help="Largest embedding count to run the per-embedding scorer on")
+
+    ann_parser = subparsers.add_parser("ann", help="Report IVF recall and queries per second against the exact scan")
+    ann_parser.add_argument("--chunks", type=int, default=BENCHMARK_CHUNK_COUNTS[1], help="Clustered random embedding count")
+    ann_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit (k of recall@k)")
+    ann_parser.add_argument("--nprobes", type=int, nargs="+", default=BENCHMARK_NPROBES, help="Lists to scan per query")
+
+    coldstart_parser = subparsers.add_parser("coldstart", help="Compare loading chunk embeddings and JSON metadata with memory-mapping the array store")
+    coldstart_parser.add_argument("--chunks", type=int, nargs="+", default=BENCHMARK_CHUNK_COUNTS, help="Random embedding counts")
+    coldstart_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    batch_parser = subparsers.add_parser("batch", help="Compare chunked search one query at a time with batched matrix-matrix scoring")
+    batch_parser.add_argument("--chunks", type=int, nargs="+", default=BENCHMARK_CHUNK_COUNTS[:2], help="Random embedding counts")
+    batch_parser.add_argument("--queries", type=int, default=BENCHMARK_BATCH_QUERIES, help="Queries to run")
+    batch_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    pooling_parser = subparsers.add_parser("pooling", help="Compare per-movie chunk pooling with segment reductions against the dict-based loop")
+    pooling_parser.add_argument("--chunks", type=int, nargs="+", default=BENCHMARK_POOLING_CHUNKS, help="Random embedding counts")
+    pooling_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    backend_parser = subparsers.add_parser("backend", help="Compare encoding latency, throughput and embedding parity across inference backends")
+    backend_parser.add_argument("--models", type=str, nargs="+", default=[SEMANTIC_MODEL, MULTIMODAL_MODEL], help="Sentence-transformer models to encode with")
+    backend_parser.add_argument("--backends", type=str, nargs="+", choices=INFERENCE_BACKENDS, default=INFERENCE_BACKENDS, help="Backends to compare; torch is always the parity reference")
+    backend_parser.add_argument("--texts", type=int, default=BENCHMARK_BACKEND_TEXTS, help="Synthetic descriptions to encode")
+
+    hybrid_parser = subparsers.add_parser("hybrid", help="Report first-query and steady-state RRF latency of a long-lived HybridSearch")
+    hybrid_parser.add_argument("--docs", type=int, default=BENCHMARK_HYBRID_DOCS, help="Synthetic corpus size")
+    hybrid_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    legs_parser = subparsers.add_parser("legs", help="Report per-leg and total hybrid latency with sequential and concurrent legs")
+    legs_parser.add_argument("--docs", type=int, default=BENCHMARK_HYBRID_DOCS, help="Synthetic corpus size")
+    legs_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+    legs_parser.add_argument("--leg-timeout", type=float, default=BENCHMARK_LEG_TIMEOUT, help="Seconds each leg gets in the timeout run")
+
+    depth_parser = subparsers.add_parser("depth", help="Compare adaptive hybrid candidate depth with fusing the full fan-out on the golden dataset")
+    depth_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    fusion_parser = subparsers.add_parser("fusion", help="Compare array-based fusion with the dict merge on long candidate lists")
+    fusion_parser.add_argument("--candidates", type=int, default=BENCHMARK_FUSION_CANDIDATES, help="Candidates per leg")
+    fusion_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    cache_parser = subparsers.add_parser("cache", help="Report hybrid result cache hit rates and latency on a stream of repeating queries")
+    cache_parser.add_argument("--docs", type=int, default=BENCHMARK_HYBRID_DOCS, help="Synthetic corpus size")
+    cache_parser.add_argument("--lookups", type=int, default=BENCHMARK_CACHE_LOOKUPS, help="Queries in the stream")
+    cache_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+
+    quantization_parser = subparsers.add_parser("quantization", help="Report memory, load time and recall of each embedding quantization mode")
+    quantization_parser.add_argument("--chunks", type=int, default=BENCHMARK_QUANTIZATION_CHUNKS, help="Clustered random embedding count")
+    quantization_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit (k of recall@k)")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "bm25":
+            print(f"{"docs":>10} {"build (s)":>10} {"legacy (ms)":>12} {"postings (ms)":>14} {"speedup":>8} {"match":>6}")
+            for row in bm25_benchmark(args.docs, args.limit, args.legacy_max_docs):
+                legacy = f"{row["legacy_ms"]:.2f}" if row["legacy_ms"] is not None else "-"
+                speedup = f"{row["legacy_ms"] / row["posting_ms"]:.0f}x" if row["legacy_ms"] is not None else "-"
+                match = row["rankings_match"] if row["rankings_match"] is not None else "-"
+                print(f"{row["documents"]:>10} {row["build_seconds"]:>10.2f} {legacy:>12} {row["posting_ms"]:>14.3f} {speedup:>8} {match!s:>6}")
+        case "wand":
+            print(f"{"docs":>10} {"exhaustive (ms)":>16} {"pruned (ms)":>12} {"postings scored":>16} {"exact":>6}")
+            for row in wand_benchmark(args.docs, args.limit):
+                print(f"{row["documents"]:>10} {row["exhaustive_ms"]:>16.3f} {row["pruned_ms"]:>12.3f} {row["postings_scored"]:>16.1%} {row["exact_matches"]:>6.0%}")
+        case "analyzer":
+            row = analyzer_benchmark(args.docs)
+            print(f"Analyzed {row["tokens"]} tokens from {row["documents"]} documents")
+            print(f"Analyzer startup: {row["startup_ms"]:.2f} ms")
+            print(f"Per token: {row["legacy_us_per_token"]:.2f} us before, {row["analyzer_us_per_token"]:.2f} us with Analyzer")
+            print(f"Stem cache hit rate: {row["stem_cache_hit_rate"]:.1%}")
+            print(f"Outputs match: {row["outputs_match"]}")
+        case "build":
+            rows = build_benchmark(args.docs, args.workers)
+            print(f"{"workers":>8} {"build (s)":>10} {"scaling":>8} {"identical":>10}")
+            for row in rows:
+                oversubscribed = " (more workers than CPUs)" if row["workers"] > row["cpus"] else ""
+                print(f"{row["workers"]:>8} {row["build_seconds"]:>10.2f} {rows[0]["build_seconds"] / row["build_seconds"]:>7.2f}x {row["identical"]!s:>10}{oversubscribed}")
+        case "load":
+            print(f"{"docs":>10} {"pickles (MB)":>13} {"segment (MB)":>13} {"pickle load (ms)":>17} {"segment load (ms)":>18} {"first query (ms)":>17} {"match":>6}")
+            for row in load_benchmark(args.docs, args.limit):
+                print(f"{row["documents"]:>10} {row["pickle_mb"]:>13.1f} {row["segment_mb"]:>13.1f} {row["pickle_load_ms"]:>17.1f} {row["segment_load_ms"]:>18.2f} {row["first_query_ms"]:>17.2f} {row["results_match"]!s:>6}")
+        case "matrix":
+            print(f"{"docs":>10} {"Counters (MB)":>14} {"CSR (MB)":>9} {"Counters (ms)":>14} {"matrix (ms)":>12} {"match":>6}")
+            for row in matrix_benchmark(args.docs, args.limit):
+                print(f"{row["documents"]:>10} {row["counter_mb"]:>14.1f} {row["csr_mb"]:>9.1f} {row["counter_ms"]:>14.3f} {row["matrix_ms"]:>12.3f} {row["rankings_match"]!s:>6}")
+        case "postings":
+            print(f"{"docs":>10} {"postings":>12} {"sets (B)":>9} {"arrays (B)":>11} {"blocks (B)":>11} {"encode (s)":>11} {"sorted sets (M/s)":>18} {"block decode (M/s)":>19} {"exact":>6}")
+            for row in postings_benchmark(args.docs):
+                print(f"{row["documents"]:>10} {row["postings"]:>12} {row["set_bytes_per_posting"]:>9.1f} {row["array_bytes_per_posting"]:>11.1f} {row["block_bytes_per_posting"]:>11.2f} {row["encode_seconds"]:>11.1f} {row["set_postings_per_second"] / 1e6:>18.1f} {row["decode_postings_per_second"] / 1e6:>19.1f} {row["decoded_exactly"]!s:>6}")
+        case "boolean":
+            print(f"{"docs":>10} {"union (ms)":>11} {"OR (ms)":>8} {"AND (ms)":>9} {"NOT (ms)":>9} {"match":>6}")
+            for row in boolean_benchmark(args.docs, args.limit):
+                print(f"{row["documents"]:>10} {row["legacy_ms"]:>11.3f} {row["or_ms"]:>8.3f} {row["and_ms"]:>9.3f} {row["not_ms"]:>9.3f} {row["or_matches"]!s:>6}")
+        case "semantic":
+            print(f"{"chunks":>10} {"normalize (ms)":>15} {"legacy (ms)":>12} {"matrix (ms)":>12} {"speedup":>8} {"match":>6}")
+            for row in semantic_benchmark(args.chunks, args.limit, args.legacy_max_chunks):
+                legacy = f"{row["legacy_ms"]:.2f}" if row["legacy_ms"] is not None else "-"
+                speedup = f"{row["legacy_ms"] / row["matrix_ms"]:.0f}x" if row["legacy_ms"] is not None else "-"
+                match = row["rankings_match"] if row["rankings_match"] is not None else "-"
+                print(f"{row["chunks"]:>10} {row["normalize_ms"]:>15.1f} {legacy:>12} {row["matrix_ms"]:>12.3f} {speedup:>8} {match!s:>6}")
+        case "ann":
+            rows = ann_benchmark(args.chunks, args.limit, args.nprobes)
+            print(f"{args.chunks} chunks in {rows[0]["lists"]} lists, built in {rows[0]["build_seconds"]:.1f} s")
+            print(f"{"nprobe":>7} {"scanned":>8} {f"recall@{args.limit}":>10} {"ms":>8} {"QPS":>8}")
+            for row in rows:
+                nprobe = row["nprobe"] if row["nprobe"] is not None else "exact"
+                print(f"{nprobe:>7} {row["scanned"]:>8.1%} {row["recall"]:>10.3f} {row["ms"]:>8.3f} {1000 / row["ms"]:>8.0f}")
+        case "coldstart":
+            print(f"{"chunks":>10} {"JSON (MB)":>10} {"arrays (MB)":>12} {"load (ms)":>10} {"mmap (ms)":>10} {"load + query (ms)":>17} {"mmap + query (ms)":>17} {"match":>6}")
+            for row in coldstart_benchmark(args.chunks, args.limit):
+                print(f"{row["chunks"]:>10} {row["legacy_metadata_mb"]:>10.1f} {row["metadata_mb"]:>12.1f} {row["legacy_load_ms"]:>10.1f} {row["mapped_load_ms"]:>10.2f} {row["legacy_first_query_ms"]:>17.1f} {row["mapped_first_query_ms"]:>17.1f} {row["results_match"]!s:>6}")
+        case "batch":
+            print(f"{"chunks":>10} {"queries":>8} {"single (QPS)":>13} {"batched (QPS)":>14} {"speedup":>8} {"match":>6}")
+            for row in batch_benchmark(args.chunks, args.queries, args.limit):
+                print(f"{row["chunks"]:>10} {row["queries"]:>8} {row["single_qps"]:>13.1f} {row["batch_qps"]:>14.1f} {row["batch_qps"] / row["single_qps"]:>7.1f}x {row["rankings_match"]:>6.0%}")
+        case "pooling":
+            print(f"{"chunks":>10} {"pooling":>10} {"dict loop (ms)":>15} {"reduceat (ms)":>14} {"speedup":>8} {"match":>6}")
+            for row in pooling_benchmark(args.chunks, args.limit):
+                match = row["rankings_match"] if row["rankings_match"] is not None else "-"
+                print(f"{row["chunks"]:>10} {row["pooling"]:>10} {row["legacy_ms"]:>15.2f} {row["ms"]:>14.3f} {row["legacy_ms"] / row["ms"]:>7.0f}x {match!s:>6}")
+        case "backend":
+            print(f"{"model":>22} {"backend":>8} {"load (s)":>9} {"query (ms)":>11} {"texts/s":>8} {"mean cosine":>12} {"min cosine":>11}")
+            for row in backend_benchmark(args.models, args.backends, args.texts):
+                print(f"{row["model"]:>22} {row["backend"]:>8} {row["load_seconds"]:>9.2f} {row["query_ms"]:>11.2f} {row["texts_per_second"]:>8.0f} {row["mean_cosine"]:>12.4f} {row["min_cosine"]:>11.4f}")
+        case "hybrid":
+            row = hybrid_benchmark(args.docs, args.limit)
+            print(f"{row["documents"]} documents, {row["chunks"]} chunks, built in {row["build_seconds"]:.1f} s")
+            print(f"First query from a cold start: {row["first_query_ms"]:.1f} ms")
+            print(f"Steady state: {row["reloading_ms"]:.2f} ms reloading the index per query, {row["steady_ms"]:.2f} ms with the loaded engine")
+            print(f"Results match: {row["results_match"]}")
+        case "legs":
+            print(f"{"mode":>11} {"BM25 (ms)":>10} {"semantic (ms)":>14} {"total (ms)":>11} {"timed out":>10} {"match":>6}")
+            for row in legs_benchmark(args.docs, args.limit, args.leg_timeout):
+                print(f"{row["mode"]:>11} {row["bm25_ms"]:>10.2f} {row["semantic_ms"]:>14.2f} {row["total_ms"]:>11.2f} {row["timed_out"]:>10.0%} {row["results_match"]:>6.0%}")
+        case "depth":
+            print(f"{"fusion":>9} {"queries":>8} {"fixed (ms)":>11} {"adaptive (ms)":>14} {"speedup":>8} {"identical":>10} {"overlap":>8}")
+            for row in depth_benchmark(args.limit):
+                print(f"{row["fusion"]:>9} {row["queries"]:>8} {row["fixed_ms"]:>11.2f} {row["adaptive_ms"]:>14.2f} {row["fixed_ms"] / row["adaptive_ms"]:>7.1f}x {row["identical"]:>10.1%} {row["overlap"]:>8.1%}")
+        case "fusion":
+            print(f"{"strategy":>9} {"candidates":>11} {"dict (ms)":>10} {"arrays (ms)":>12} {"dict blocks":>12} {"array blocks":>13} {"dict peak (KiB)":>16} {"array peak (KiB)":>17}")
+            for row in fusion_benchmark(args.candidates, args.limit):
+                legacy = lambda key, spec: format(row[key], spec) if row[key] is not None else "-"
+                print(f"{row["strategy"]:>9} {row["candidates"]:>11} {legacy("legacy_ms", ".2f"):>10} {row["ms"]:>12.2f} {legacy("legacy_blocks", "d"):>12} {row["blocks"]:>13} {legacy("legacy_peak_kib", ".0f"):>16} {row["peak_kib"]:>17.0f}")
+        case "cache":
+            print(f"{"mode":>10} {"lookups":>8} {"ms/query":>9} {"memory hits":>12} {"disk hits":>10} {"hit rate":>9} {"match":>6}")
+            for row in cache_benchmark(args.docs, args.lookups, args.limit):
+                print(f"{row["mode"]:>10} {row["lookups"]:>8} {row["ms"]:>9.3f} {row["memory_hits"]:>12} {row["disk_hits"]:>10} {row["hit_rate"]:>9.1%} {row["results_match"]:>6.0%}")
+        case "quantization":
+            print(f"{"mode":>8} {"memory (MB)":>12} {"build (s)":>10} {"load (ms)":>10} {"codes recall":>13} {"rescored recall":>16} {"ms":>8}")
+            for row in quantization_benchmark(args.chunks, args.limit):
+                print(f"{row["mode"]:>8} {row["memory_mb"]:>12.1f} {row["build_seconds"]:>10.2f} {row["load_ms"]:>10.1f} {row["codes_recall"]:>13.3f} {row["rescored_recall"]:>16.3f} {row["ms"]:>8.3f}")
+        case _:
+            parser.print_help()
+
+if __name__ == "__main__":
+    main()
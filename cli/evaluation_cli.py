@@ -9,9 +9,10 @@ def main() -> None:
     parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Number of results to evaluate (k for precision@k, recall@k)")
 
     args = parser.parse_args()
-    results = evaluate_command(args.limit)
+    results, queries_per_second = evaluate_command(args.limit)
 
-    print(f"k={args.limit}\n")
+    print(f"k={args.limit}")
+    print(f"Retrieved {len(results)} queries at {queries_per_second:.1f} queries/s\n")
     for query, result in results.items():
         precision, recall = result["precision"], result["recall"]
         f1score = (2 * (precision * recall)) / (precision + recall)
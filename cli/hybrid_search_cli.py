@@ -1,12 +1,20 @@
 #! usr/bin/env python3
 
-from lib.hybrid_search import normalize_command, weighted_command, rrf_command
+from lib.hybrid_search import normalize_command, weighted_command, rrf_command, fusion_command
 from lib.evaluation import evaluate_results
-from lib.search_utils import ALPHA, RESULT_LIMIT, RRF_K
+from lib.search_utils import ALPHA, RESULT_LIMIT, RRF_K, HYBRID_CONCURRENT, LEG_TIMEOUT, FUSION_STRATEGIES, NORMALIZATIONS
 
 import argparse
 
 
+def print_timings(timings: dict) -> None:
+    if timings["cached"]:
+        print(f"Latency: cached, total {timings["total_ms"]:.1f} ms")
+        return
+    timed_out = f", timed out: {", ".join(timings["timed_out"])}" if timings["timed_out"] else ""
+    print(f"Latency: BM25 {timings["bm25_ms"]:.1f} ms, semantic {timings["semantic_ms"]:.1f} ms, total {timings["total_ms"]:.1f} ms{timed_out}")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Hybrid Search CLI")
     subparser = parser.add_subparsers(dest="command", help="Available commands")
@@ -18,6 +26,8 @@ def main() -> None:
     weighted_search_parser.add_argument("query", type=str, help="Search query")
     weighted_search_parser.add_argument("--alpha", type=float, nargs="?", default=ALPHA, help="Weighted parameter")
     weighted_search_parser.add_argument("--limit", type=int, nargs="?", default=RESULT_LIMIT, help="Set the result limit")
+    weighted_search_parser.add_argument("--concurrent", action="store_true", default=HYBRID_CONCURRENT, help="Run the BM25 and semantic legs at the same time")
+    weighted_search_parser.add_argument("--leg-timeout", type=float, default=LEG_TIMEOUT, help="Seconds to wait for each leg when concurrent; a late leg is left out")
 
     rrf_search_parser = subparser.add_parser("rrf-search", help="Reciprocal Rank Fusion Search")
     rrf_search_parser.add_argument("query", type=str, help="Search query")
@@ -26,6 +36,18 @@ def main() -> None:
     rrf_search_parser.add_argument("--enhance", type=str, choices=["spell", "rewrite", "expand"], help="Query enhancement method")
     rrf_search_parser.add_argument("--rerank-method", type=str, choices=["individual", "batch", "cross_encoder"], help="Reranking method")
     rrf_search_parser.add_argument("--evaluate", action="store_true", default=False, help="Evaluate")
+    rrf_search_parser.add_argument("--concurrent", action="store_true", default=HYBRID_CONCURRENT, help="Run the BM25 and semantic legs at the same time")
+    rrf_search_parser.add_argument("--leg-timeout", type=float, default=LEG_TIMEOUT, help="Seconds to wait for each leg when concurrent; a late leg is left out")
+
+    fusion_search_parser = subparser.add_parser("fusion-search", help="Search with a chosen fusion strategy")
+    fusion_search_parser.add_argument("query", type=str, help="Search query")
+    fusion_search_parser.add_argument("--strategy", type=str, choices=FUSION_STRATEGIES, default="rrf", help="How the BM25 and semantic results are fused")
+    fusion_search_parser.add_argument("--normalization", type=str, choices=NORMALIZATIONS, default="minmax", help="Score normalization for weighted, combsum and combmnz")
+    fusion_search_parser.add_argument("-k", type=int, default=RRF_K, help="K parameter for rrf")
+    fusion_search_parser.add_argument("--alpha", type=float, default=ALPHA, help="BM25 weight for weighted")
+    fusion_search_parser.add_argument("--limit", type=int, default=RESULT_LIMIT, help="Set the result limit")
+    fusion_search_parser.add_argument("--concurrent", action="store_true", default=HYBRID_CONCURRENT, help="Run the BM25 and semantic legs at the same time")
+    fusion_search_parser.add_argument("--leg-timeout", type=float, default=LEG_TIMEOUT, help="Seconds to wait for each leg when concurrent; a late leg is left out")
 
     args = parser.parse_args()
 
@@ -35,16 +57,18 @@ def main() -> None:
             for score in normalized_scores:
                 print(f"* {score:.4f}")
         case "weighted-search":
-            results = weighted_command(args.query, args.alpha, args.limit)
-            for i, result in enumerate(results, 1):
+            results = weighted_command(args.query, args.alpha, args.limit, args.concurrent, args.leg_timeout)
+            print_timings(results["timings"])
+            for i, result in enumerate(results["results"], 1):
                 print(f"{i}. {result["title"]}")
                 print(f"Hybrid Score: {result["hybrid_score"]:.3f}")
                 print(f"BM25: {result["bm25_score"]:.3f}, Semantic: {result["semantic_score"]:.3f}")
                 print(f"{result["document"]}...\n")
         case "rrf-search":
-            results = rrf_command(args.query, args.k, args.enhance, args.rerank_method, args.limit)
+            results = rrf_command(args.query, args.k, args.enhance, args.rerank_method, args.limit, args.concurrent, args.leg_timeout)
             if args.enhance:
-                print(f"Enhanced query ({args.enhance}): '{args.query}' -> '{result["enhanced_query"]}'\n")
+                print(f"Enhanced query ({args.enhance}): '{args.query}' -> '{results["enhanced_query"]}'\n")
+            print_timings(results["timings"])
 
             if args.evaluate:
                 results = evaluate_results(args.query, results["reranked_results"])
@@ -60,6 +84,18 @@ def main() -> None:
                     print(f"RRF Score: {result["rrf_score"]:.3f}")
                     print(f"BM25 Rank: {result["bm25_rank"]}, Semantic Rank: {result["semantic_rank"]}")
                     print(f"{result["document"]}...\n")
+        case "fusion-search":
+            results = fusion_command(args.query, args.strategy, args.normalization, args.k, args.alpha, args.limit, args.concurrent, args.leg_timeout)
+            print_timings(results["timings"])
+            for i, result in enumerate(results["results"], 1):
+                print(f"{i}. {result["title"]}")
+                if args.strategy == "rrf":
+                    print(f"RRF Score: {result["rrf_score"]:.3f}")
+                else:
+                    print(f"Hybrid Score: {result["hybrid_score"]:.3f}")
+                    print(f"BM25: {result["bm25_score"]:.3f}, Semantic: {result["semantic_score"]:.3f}")
+                print(f"BM25 Rank: {result["bm25_rank"]}, Semantic Rank: {result["semantic_rank"]}")
+                print(f"{result["document"]}...\n")
         case _:
             parser.print_help()
 
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 from lib.keyword_search import search_movies
-from lib.inverted_index import build_command, tf_command, idf_command, tfidf_command, bm25_tf_command, bm25_idf_command, bm25_search
+from lib.inverted_index import build_command, add_command, update_command, delete_command, merge_command, convert_command, tf_command, idf_command, tfidf_command, bm25_tf_command, bm25_idf_command, bm25_search, bm25_wand_search_command
 from lib.search_utils import BM25_K1, BM25_B, RESULT_LIMIT
 
 import argparse
@@ -11,10 +11,29 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
-    subparsers.add_parser("build", help="Builds inverted index of search tokens to movie ids")
+    build_parser = subparsers.add_parser("build", help="Builds inverted index of search tokens to movie ids")
+    build_parser.add_argument("--workers", type=int, default=1, help="Number of processes to build the index with")
 
-    search_parser = subparsers.add_parser("search", help="Search movies using BM25")
-    search_parser.add_argument("query", type=str, help="Search query")
+    add_parser = subparsers.add_parser("add", help="Adds a movie to the index as a new segment")
+    add_parser.add_argument("id", type=int, help="Movie ID")
+    add_parser.add_argument("title", type=str, help="Movie title")
+    add_parser.add_argument("description", type=str, help="Movie description")
+
+    update_parser = subparsers.add_parser("update", help="Replaces an indexed movie")
+    update_parser.add_argument("id", type=int, help="Movie ID")
+    update_parser.add_argument("title", type=str, help="Movie title")
+    update_parser.add_argument("description", type=str, help="Movie description")
+
+    delete_parser = subparsers.add_parser("delete", help="Removes a movie from the index")
+    delete_parser.add_argument("id", type=int, help="Movie ID")
+
+    subparsers.add_parser("merge", help="Compacts every index segment into one")
+
+    subparsers.add_parser("convert", help="Converts the legacy pickle index files into an index segment")
+
+    search_parser = subparsers.add_parser("search", help="Search movies with a boolean keyword query")
+    search_parser.add_argument("query", type=str, help="Search query, e.g. 'space AND (alien OR robot) NOT comedy'")
+    search_parser.add_argument("limit", type=int, nargs="?", default=RESULT_LIMIT, help="Set the result limit")
 
     tf_parser = subparsers.add_parser("tf", help="Get the term frequency for given term and movie")
     tf_parser.add_argument("id", type=int, help="Movie ID")
@@ -39,17 +58,40 @@ def main() -> None:
     bm25_search_parser = subparsers.add_parser("bm25search", help="Search movies using full BM25 scoring")
     bm25_search_parser.add_argument("query", type=str, help="Search query")
     bm25_search_parser.add_argument("limit", type=int, nargs="?", default=RESULT_LIMIT, help="Set the result limit")
+    bm25_search_parser.add_argument("--pruned", action="store_true", default=False, help="Use WAND top-k retrieval")
+    bm25_search_parser.add_argument("--verify", action="store_true", default=False, help="Compare pruned results with exhaustive scoring")
 
     args = parser.parse_args()
 
     match args.command:
         case "build":
             print("Building inverted index...")
-            build_command()
+            build_command(args.workers)
             print("Inverted index built successfully.")
+        case "add":
+            add_command(args.id, args.title, args.description)
+            print(f"Added movie {args.id}.")
+        case "update":
+            update_command(args.id, args.title, args.description)
+            print(f"Updated movie {args.id}.")
+        case "delete":
+            delete_command(args.id)
+            print(f"Deleted movie {args.id}.")
+        case "merge":
+            print("Merging index segments...")
+            merge_command()
+            print("Index segments merged successfully.")
+        case "convert":
+            print("Converting pickled index...")
+            convert_command()
+            print("Index segment written successfully.")
         case "search":
             print(f"Searching for: {args.query}")
-            results = search_movies(args.query)
+            try:
+                results = search_movies(args.query, args.limit)
+            except ValueError as e:
+                print(f"Invalid query: {e}")
+                return
             for i, result in enumerate(results, 1):
                 print(f"{i}: {result}\n")
         case "tf":
@@ -70,9 +112,16 @@ def main() -> None:
             print(f"BM25 IDF score of '{args.term}': {bm25idf:.2f}")
         case "bm25search":
             print(f"Searching for: {args.query}")
-            results = bm25_search(args.query, args.limit)
-            for movie, score in results:
-                print(f"({movie["id"]}) {movie["title"]} - Score: {score:.2f}")
+            if args.pruned:
+                results, stats = bm25_wand_search_command(args.query, args.limit, args.verify)
+            else:
+                results = bm25_search(args.query, args.limit)
+            for result in results:
+                print(f"({result["id"]}) {result["title"]} - Score: {result["score"]:.2f}")
+            if args.pruned:
+                print(f"Postings scored: {stats["postings_scored"]}/{stats["postings_total"]}")
+                if args.verify:
+                    print(f"Matches exhaustive scoring: {stats["matches_exact"]}")
         case _:
             parser.print_help()
 
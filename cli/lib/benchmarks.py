@@ -0,0 +1,998 @@
+from lib.inverted_index import InvertedIndex, index_shard, bm25_tf, bm25_idf
+from lib.posting_blocks import encode_postings, decode_blocks
+from lib.ivf_index import IVFIndex
+from lib.chunked_semantic_search import ChunkedSemanticSearch
+from lib.query_cache import QueryEmbeddingCache
+from lib.quantization import QUANTIZATION_MODES, load_or_build_quantized
+from lib.model_registry import get_model_registry, get_sentence_transformer
+from lib.fusion import Fusion
+from lib.result_cache import ResultCache
+from lib.embedding_store import save_array, open_embeddings, save_chunk_metadata, load_chunk_metadata, CHUNK_METADATA_FIELDS
+from lib.search_utils import (
+    Analyzer,
+    normalize_embeddings,
+    top_k_indices,
+    get_stop_words,
+    RESULT_LIMIT,
+    BENCHMARK_QUERIES,
+    BENCHMARK_LEGACY_MAX_DOCS,
+    BENCHMARK_LEGACY_QUERIES,
+    BENCHMARK_SEED,
+    BENCHMARK_WORKERS,
+    BENCHMARK_SET_SAMPLE_TERMS,
+    BENCHMARK_LEGACY_MAX_CHUNKS,
+    BENCHMARK_NPROBES,
+    QUERY_BATCH_SIZE,
+    POOLING_METHODS,
+    pool_scores,
+    INFERENCE_BACKENDS,
+    SEMANTIC_MODEL,
+    MULTIMODAL_MODEL,
+    BENCHMARK_BACKEND_TEXTS,
+    RRF_K,
+    ALPHA,
+    BENCHMARK_LEG_TIMEOUT,
+    BENCHMARK_FUSION_CANDIDATES,
+    BENCHMARK_CACHE_LOOKUPS,
+    FUSION_STRATEGIES,
+    load_golden_dataset,
+)
+
+import os
+import time
+import string
+import json
+import pickle
+import tempfile
+import heapq
+import tracemalloc
+from itertools import islice
+from collections import Counter
+import numpy as np
+from numpy import ndarray
+from typing import Callable
+from nltk.stem import PorterStemmer
+
+
+VOCABULARY_SIZE = 20_000
+MIN_DESCRIPTION_WORDS = 30
+MAX_DESCRIPTION_WORDS = 120
+CORPUS_BATCH_SIZE = 10_000
+MAX_CHUNKS_PER_MOVIE = 8
+EMBEDDING_DIMENSIONS = 384
+EMBEDDING_CLUSTERS = 1000
+EMBEDDING_NOISE = 1.5
+
+
+def synthetic_vocabulary(size: int, rng: np.random.Generator) -> list[str]:
+    # words are kept only if stemming them twice is a no-op, so a stemmed token re-tokenizes to itself
+    stop_words = set(get_stop_words())
+    stemmer = PorterStemmer()
+    letters = np.array(list(string.ascii_lowercase))
+    vocabulary = {}
+    while len(vocabulary) < size:
+        length = int(rng.integers(4, 10))
+        word = "".join(rng.choice(letters, length))
+        stem = stemmer.stem(word)
+        if word in stop_words or stem in stop_words or stemmer.stem(stem) != stem:
+            continue
+        vocabulary[word] = None
+    return list(vocabulary)
+
+def synthetic_corpus(doc_count: int, query_count: int=BENCHMARK_QUERIES, seed: int=BENCHMARK_SEED) -> tuple[list[dict], list[str]]:
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(synthetic_vocabulary(VOCABULARY_SIZE, rng))
+    weights = 1 / np.arange(1, len(vocabulary) + 1) ** 1.1 # Zipf-like term distribution
+    weights /= weights.sum()
+
+    movies = []
+    for start in range(0, doc_count, CORPUS_BATCH_SIZE):
+        batch = min(CORPUS_BATCH_SIZE, doc_count - start)
+        lengths = rng.integers(MIN_DESCRIPTION_WORDS, MAX_DESCRIPTION_WORDS + 1, batch)
+        words = vocabulary[rng.choice(len(vocabulary), int(lengths.sum()), p=weights)]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        for i in range(batch):
+            description = words[offsets[i]:offsets[i + 1]]
+            movies.append(
+                {
+                    "id": start + i + 1,
+                    "title": " ".join(description[:3]),
+                    "description": " ".join(description)
+                }
+            )
+
+    queries = []
+    for _ in range(query_count):
+        terms = rng.choice(len(vocabulary) // 10, int(rng.integers(2, 5)), replace=False)
+        queries.append(" ".join(vocabulary[terms]))
+    return movies, queries
+
+def synthetic_postings(doc_count: int, seed: int=BENCHMARK_SEED) -> tuple[ndarray, ndarray, ndarray]:
+    # the posting lists synthetic_corpus would index to, drawn directly so millions of documents fit in memory
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, VOCABULARY_SIZE + 1) ** 1.1
+    weights /= weights.sum()
+    batches = []
+    for start in range(0, doc_count, CORPUS_BATCH_SIZE):
+        batch = min(CORPUS_BATCH_SIZE, doc_count - start)
+        lengths = rng.integers(MIN_DESCRIPTION_WORDS, MAX_DESCRIPTION_WORDS + 1, batch)
+        terms = rng.choice(VOCABULARY_SIZE, int(lengths.sum()), p=weights)
+        ordinals = np.repeat(np.arange(start, start + batch), lengths)
+        keys, frequencies = np.unique(terms * doc_count + ordinals, return_counts=True)
+        # a key and its frequency share one int64 so a single sort orders the postings by term, then ordinal
+        batches.append(keys << 8 | frequencies)
+    postings = np.concatenate(batches)
+    del batches
+    postings.sort()
+    keys = postings >> 8
+    terms, ordinals = np.divmod(keys, doc_count)
+    posting_offsets = np.searchsorted(terms, np.arange(VOCABULARY_SIZE + 1))
+    return posting_offsets, ordinals.astype(np.int32), (postings & 0xFF).astype(np.int32)
+
+def time_queries(search: Callable[[str], object], queries: list[str]) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+def legacy_tokenize_text(text: str) -> list[str]:
+    # tokenize_text before Analyzer: stop words re-read into a list and a new stemmer on every call
+    text = text.lower()
+    text = text.translate(str.maketrans("", "", string.punctuation))
+    stop_words = get_stop_words()
+    filtered_words = [word for word in text.split() if word not in stop_words]
+    stemmer = PorterStemmer()
+    return [stemmer.stem(token) for token in filtered_words]
+
+def legacy_index(movies: list[dict]) -> tuple[dict[str, set], dict[int, dict], dict[int, dict], dict[int, int]]:
+    # the index, docmap, term_frequencies and doc_lengths dicts InvertedIndex held before segments
+    index, term_frequencies, doc_lengths = index_shard([(movie["id"], f"{movie["title"]} {movie["description"]}") for movie in movies])
+    docmap = {movie["id"]: movie for movie in movies}
+    return index, docmap, term_frequencies, doc_lengths
+
+def legacy_bm25_search(legacy: tuple, query: str, limit: int) -> list[int]:
+    # the scorer bm25_search used before posting lists: every document and token, no precomputed statistics
+    index, docmap, term_frequencies, doc_lengths = legacy
+    tokenized_query = legacy_tokenize_text(query)
+    bm25_scores = {}
+    for doc_id in docmap:
+        score = 0
+        for token in tokenized_query:
+            avg_doc_length = sum(doc_lengths.values()) / len(doc_lengths)
+            tf = term_frequencies[doc_id][legacy_tokenize_text(token)[0]]
+            idf = bm25_idf(len(docmap), len(index.get(legacy_tokenize_text(token)[0], ())))
+            score += bm25_tf(tf, doc_lengths[doc_id], avg_doc_length) * idf
+        bm25_scores[doc_id] = score
+    sorted_scores = sorted(bm25_scores.items(), key=lambda x: x[1], reverse=True)
+    return [doc_id for doc_id, _ in sorted_scores[:limit]]
+
+def counter_bm25_search(legacy: tuple, query: str, limit: int) -> list[int]:
+    # the posting-list scorer over a Counter per document, before the document-term matrix
+    index, docmap, term_frequencies, doc_lengths = legacy
+    avg_doc_length = sum(doc_lengths.values()) / len(doc_lengths)
+    bm25_scores = {}
+    for token in Analyzer().analyze(query):
+        doc_ids = index.get(token, ())
+        idf = bm25_idf(len(docmap), len(doc_ids))
+        for doc_id in doc_ids:
+            score = bm25_tf(term_frequencies[doc_id][token], doc_lengths[doc_id], avg_doc_length) * idf
+            bm25_scores[doc_id] = bm25_scores.get(doc_id, 0) + score
+    ordinals = {doc_id: i for i, doc_id in enumerate(docmap)}
+    ranked_ids = sorted(bm25_scores, key=lambda doc_id: (-bm25_scores[doc_id], ordinals[doc_id]))[:limit]
+    unmatched_ids = (doc_id for doc_id in docmap if doc_id not in bm25_scores)
+    return ranked_ids + list(islice(unmatched_ids, limit - len(ranked_ids)))
+
+def legacy_search_movies(legacy: tuple, query: str, limit: int) -> list[int]:
+    # search_movies before the boolean engine: a freshly sorted copy of each token's set, unioned token by token
+    index, docmap, _, _ = legacy
+    seen, results = set(), []
+    for token in Analyzer().analyze(query):
+        for doc_id in sorted(index.get(token, ())):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            results.append(docmap[doc_id]["id"])
+            if len(results) >= limit:
+                return results
+    return results
+
+def synthetic_embeddings(count: int, seed: int=BENCHMARK_SEED, clustered: bool=False) -> ndarray:
+    # random float32 vectors the shape SEMANTIC_MODEL produces, generated in batches to keep the peak memory down
+    # clustered vectors are noisy copies of EMBEDDING_CLUSTERS topic centres, closer to real text embeddings
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((EMBEDDING_CLUSTERS, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    embeddings = np.empty((count, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for start in range(0, count, CORPUS_BATCH_SIZE * 10):
+        end = min(start + CORPUS_BATCH_SIZE * 10, count)
+        embeddings[start:end] = rng.standard_normal((end - start, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        if clustered:
+            embeddings[start:end] *= EMBEDDING_NOISE
+            embeddings[start:end] += centres[rng.integers(EMBEDDING_CLUSTERS, size=end - start)]
+    return embeddings
+
+def synthetic_chunk_metadata(chunk_count: int, seed: int=BENCHMARK_SEED) -> tuple[ndarray, ndarray, ndarray]:
+    # movies with 1 to MAX_CHUNKS_PER_MOVIE chunks each, in the order build_chunk_embeddings writes them
+    rng = np.random.default_rng(seed)
+    totals = rng.integers(1, MAX_CHUNKS_PER_MOVIE + 1, size=chunk_count)
+    totals = totals[:np.searchsorted(np.cumsum(totals), chunk_count) + 1]
+    totals[-1] -= totals.sum() - chunk_count
+    starts = np.cumsum(totals) - totals
+    movie_indices = np.repeat(np.arange(len(totals)), totals)
+    return movie_indices, np.arange(chunk_count) - np.repeat(starts, totals), np.repeat(totals, totals)
+
+def legacy_semantic_search(embeddings: ndarray, query_embedding: ndarray, limit: int) -> list[int]:
+    # SemanticSearch.search before the matrix product: cosine similarity per row, then a full sort
+    scores = []
+    for i, embedding in enumerate(embeddings):
+        dot_product = np.dot(query_embedding, embedding)
+        norm1 = np.linalg.norm(query_embedding)
+        norm2 = np.linalg.norm(embedding)
+        scores.append((dot_product / (norm1 * norm2) if norm1 and norm2 else 0, i))
+    scores.sort(key=lambda x: x[0], reverse=True)
+    return [i for _, i in scores[:limit]]
+
+def legacy_chunk_pooling(chunk_scores: ndarray, movie_indices: ndarray, limit: int) -> list[int]:
+    # ChunkedSemanticSearch.search_chunks before the segment reductions: a dict per chunk, then a max per movie
+    scores = []
+    for i, score in enumerate(chunk_scores.tolist()):
+        scores.append({"chunk_idx": i, "movie_idx": int(movie_indices[i]), "score": score})
+    movie_scores = {}
+    for chunk_score in scores:
+        movie_idx, score = chunk_score["movie_idx"], chunk_score["score"]
+        if movie_idx not in movie_scores or score > movie_scores.get(movie_idx, 0):
+            movie_scores[movie_idx] = score
+    sorted_movies = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)
+    return [movie_idx for movie_idx, _ in sorted_movies[:limit]]
+
+def legacy_normalize_results(results: list[dict]) -> list[dict]:
+    scores = [result["score"] for result in results]
+    min_score, max_score = min(scores, default=0), max(scores, default=0)
+    for result in results:
+        result["score"] = 1.0 if min_score == max_score else (result["score"] - min_score) / (max_score - min_score)
+    return results
+
+def legacy_combine_scores(bm25_results: list[dict], semantic_results: list[dict], alpha: float) -> dict[int, dict]:
+    # the dict merge hybrid search used before the fusion module; only documents in both lists get a hybrid score
+    document_scores = {}
+    for result in bm25_results:
+        document_scores[result["id"]] = {"title": result["title"], "document": result["document"], "bm25_score": result["score"], "semantic_score": 0, "hybrid_score": 0}
+    for result in semantic_results:
+        doc_id = result["id"]
+        if doc_id not in document_scores:
+            document_scores[doc_id] = {"title": result["title"], "document": result["document"], "bm25_score": 0, "semantic_score": result["score"], "hybrid_score": 0}
+        else:
+            doc = document_scores[doc_id]
+            doc["semantic_score"] = result["score"]
+            doc["hybrid_score"] = (alpha * doc["bm25_score"]) + ((1 - alpha) * doc["semantic_score"])
+    return document_scores
+
+def legacy_combine_rrf(bm25_results: list[dict], semantic_results: list[dict], k: int) -> dict[int, dict]:
+    document_ranks = {}
+    for i, doc in enumerate(bm25_results, 1):
+        document_ranks[doc["id"]] = {"id": doc["id"], "title": doc["title"], "document": doc["document"], "bm25_rank": i, "semantic_rank": None, "rrf_score": 0}
+    for i, doc in enumerate(semantic_results, 1):
+        doc_id = doc["id"]
+        if doc_id not in document_ranks:
+            document_ranks[doc_id] = {"id": doc_id, "title": doc["title"], "document": doc["document"], "bm25_rank": None, "semantic_rank": i, "rrf_score": 0}
+        else:
+            document_ranks[doc_id]["semantic_rank"] = i
+            document_ranks[doc_id]["rrf_score"] = 1 / (k + document_ranks[doc_id]["bm25_rank"]) + 1 / (k + i)
+    return document_ranks
+
+def legacy_fused_candidates(bm25_results: list[dict], semantic_results: list[dict], strategy: str) -> tuple[dict[int, dict], str]:
+    # every candidate merged into one dict, and the key its fused score is under
+    if strategy == "rrf":
+        return legacy_combine_rrf(bm25_results, semantic_results, RRF_K), "rrf_score"
+    return legacy_combine_scores(legacy_normalize_results(bm25_results), legacy_normalize_results(semantic_results), ALPHA), "hybrid_score"
+
+def legacy_top_results(documents: dict[int, dict], key: str, limit: int) -> list[dict]:
+    return [{"id": id, **doc} for id, doc in heapq.nlargest(limit, documents.items(), key=lambda x: x[1][key])]
+
+def bm25_benchmark(doc_counts: list[int], limit: int=RESULT_LIMIT, legacy_max_docs: int=BENCHMARK_LEGACY_MAX_DOCS) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        movies, queries = synthetic_corpus(doc_count)
+        index = InvertedIndex()
+        start = time.perf_counter()
+        index.build(movies)
+        build_seconds = time.perf_counter() - start
+
+        posting_ms = time_queries(lambda query: index.bm25_search(query, limit), queries)
+        legacy_ms, rankings_match = None, None
+        if doc_count <= legacy_max_docs:
+            legacy = legacy_index(movies)
+            legacy_queries = queries[:BENCHMARK_LEGACY_QUERIES]
+            legacy_ms = time_queries(lambda query: legacy_bm25_search(legacy, query, limit), legacy_queries)
+            rankings_match = all(
+                legacy_bm25_search(legacy, query, limit) == [result["id"] for result in index.bm25_search(query, limit)]
+                for query in legacy_queries
+            )
+        results.append(
+            {
+                "documents": doc_count,
+                "build_seconds": build_seconds,
+                "legacy_ms": legacy_ms,
+                "posting_ms": posting_ms,
+                "rankings_match": rankings_match
+            }
+        )
+    return results
+
+def wand_benchmark(doc_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        movies, queries = synthetic_corpus(doc_count)
+        index = InvertedIndex()
+        index.build(movies)
+
+        exhaustive_ms = time_queries(lambda query: index.bm25_search(query, limit), queries)
+        pruned_ms = time_queries(lambda query: index.bm25_wand_search(query, limit), queries)
+        postings_total, postings_scored, exact_matches = 0, 0, 0
+        for query in queries:
+            _, stats = index.bm25_wand_search(query, limit, verify=True)
+            postings_total += stats["postings_total"]
+            postings_scored += stats["postings_scored"]
+            exact_matches += stats["matches_exact"]
+        results.append(
+            {
+                "documents": doc_count,
+                "exhaustive_ms": exhaustive_ms,
+                "pruned_ms": pruned_ms,
+                "postings_scored": postings_scored / postings_total if postings_total else 0,
+                "exact_matches": exact_matches / len(queries)
+            }
+        )
+    return results
+
+def analyzer_benchmark(doc_count: int) -> dict:
+    movies, _ = synthetic_corpus(doc_count)
+    texts = [f"{movie["title"]} {movie["description"]}" for movie in movies]
+
+    start = time.perf_counter()
+    analyzer = Analyzer()
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    legacy_tokens = [legacy_tokenize_text(text) for text in texts]
+    legacy_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    tokens = analyzer.analyze_many(texts)
+    analyzer_seconds = time.perf_counter() - start
+
+    token_count = sum(len(text.split()) for text in texts)
+    cache_info = analyzer.stem.cache_info()
+    return {
+        "documents": doc_count,
+        "tokens": token_count,
+        "startup_ms": startup_ms,
+        "legacy_us_per_token": legacy_seconds * 1e6 / token_count,
+        "analyzer_us_per_token": analyzer_seconds * 1e6 / token_count,
+        "stem_cache_hit_rate": cache_info.hits / (cache_info.hits + cache_info.misses),
+        "outputs_match": legacy_tokens == tokens
+    }
+
+def build_benchmark(doc_count: int, workers: list[int]=BENCHMARK_WORKERS) -> list[dict]:
+    # worker counts above the CPUs this process may run on measure pool overhead, not scaling
+    movies, _ = synthetic_corpus(doc_count)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    serial = None
+    results = []
+    for worker_count in workers:
+        index = InvertedIndex()
+        start = time.perf_counter()
+        index.build(movies, workers=worker_count)
+        build_seconds = time.perf_counter() - start
+        if serial is None:
+            serial = InvertedIndex()
+            serial.build(movies)
+        results.append(
+            {
+                "workers": worker_count,
+                "cpus": cpus,
+                "build_seconds": build_seconds,
+                "identical": (
+                    index.segments[0].sections.keys() == serial.segments[0].sections.keys()
+                    and all(np.array_equal(array, serial.segments[0].sections[name]) for name, array in index.segments[0].sections.items())
+                    and list(index.docmap) == list(serial.docmap)
+                )
+            }
+        )
+    return results
+
+def load_benchmark(doc_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        movies, queries = synthetic_corpus(doc_count)
+        with tempfile.TemporaryDirectory() as directory:
+            index = InvertedIndex()
+            for name in ("manifest_path", "index_path", "docmap_path", "term_frequencies_path", "doc_lengths_path"):
+                setattr(index, name, os.path.join(directory, os.path.basename(getattr(index, name))))
+            index.build(movies)
+            index.save()
+            pickle_paths = [index.index_path, index.docmap_path, index.term_frequencies_path, index.doc_lengths_path]
+            for path, data in zip(pickle_paths, legacy_index(movies)):
+                with open(path, "wb") as f:
+                    pickle.dump(data, f)
+
+            start = time.perf_counter()
+            for path in pickle_paths:
+                with open(path, "rb") as f:
+                    pickle.load(f)
+            pickle_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            loaded = InvertedIndex()
+            loaded.manifest_path = index.manifest_path
+            loaded.load()
+            segment_ms = (time.perf_counter() - start) * 1000
+            loaded.bm25_search(queries[0], limit)
+            first_query_ms = (time.perf_counter() - start) * 1000
+
+            results.append(
+                {
+                    "documents": doc_count,
+                    "pickle_mb": sum(os.path.getsize(path) for path in pickle_paths) / 2**20,
+                    "segment_mb": os.path.getsize(index.segments[0].path) / 2**20,
+                    "pickle_load_ms": pickle_ms,
+                    "segment_load_ms": segment_ms,
+                    "first_query_ms": first_query_ms,
+                    "results_match": loaded.bm25_search(queries[1], limit) == index.bm25_search(queries[1], limit)
+                }
+            )
+    return results
+
+def matrix_benchmark(doc_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        movies, queries = synthetic_corpus(doc_count)
+        tokenized_texts = Analyzer().analyze_many(f"{movie["title"]} {movie["description"]}" for movie in movies)
+        tracemalloc.start()
+        term_frequencies = {movie["id"]: Counter(tokens) for movie, tokens in zip(movies, tokenized_texts)}
+        counter_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del term_frequencies, tokenized_texts
+
+        index = InvertedIndex()
+        index.build(movies)
+        segment = index.segments[0]
+        csr_bytes = segment.row_offsets.nbytes + segment.row_term_ids.nbytes + segment.row_frequencies.nbytes
+        legacy = legacy_index(movies)
+        counter_ms = time_queries(lambda query: counter_bm25_search(legacy, query, limit), queries)
+        matrix_ms = time_queries(lambda query: index.bm25_search(query, limit), queries)
+        results.append(
+            {
+                "documents": doc_count,
+                "counter_mb": counter_bytes / 2**20,
+                "csr_mb": csr_bytes / 2**20,
+                "counter_ms": counter_ms,
+                "matrix_ms": matrix_ms,
+                "rankings_match": all(
+                    counter_bm25_search(legacy, query, limit) == [result["id"] for result in index.bm25_search(query, limit)]
+                    for query in queries
+                )
+            }
+        )
+    return results
+
+def postings_benchmark(doc_counts: list[int], sample_terms: int=BENCHMARK_SET_SAMPLE_TERMS) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        posting_offsets, ordinals, frequencies = synthetic_postings(doc_count)
+        posting_count = len(ordinals)
+        start = time.perf_counter()
+        encoded = encode_postings(posting_offsets, ordinals, frequencies)
+        encode_seconds = time.perf_counter() - start
+
+        # sets are measured on every sample_terms-th term, the most frequent term included
+        sampled = range(0, len(posting_offsets) - 1, sample_terms)
+        sampled_postings = sum(int(posting_offsets[term + 1] - posting_offsets[term]) for term in sampled)
+        tracemalloc.start()
+        sets = [set(ordinals[posting_offsets[term]:posting_offsets[term + 1]].tolist()) for term in sampled]
+        set_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for term_set in sets:
+            sorted(term_set)
+        set_seconds = time.perf_counter() - start
+        del sets
+
+        start = time.perf_counter()
+        for term in sampled:
+            decode_blocks(encoded, encoded["block_offsets"][term], encoded["block_offsets"][term + 1])
+        decode_seconds = time.perf_counter() - start
+
+        matches = True
+        for term in sampled:
+            term_ordinals, term_frequencies = decode_blocks(encoded, encoded["block_offsets"][term], encoded["block_offsets"][term + 1])
+            first, last = posting_offsets[term], posting_offsets[term + 1]
+            matches &= np.array_equal(term_ordinals, ordinals[first:last]) and np.array_equal(term_frequencies, frequencies[first:last])
+        results.append(
+            {
+                "documents": doc_count,
+                "postings": posting_count,
+                "set_bytes_per_posting": set_bytes / sampled_postings,
+                "array_bytes_per_posting": (ordinals.nbytes + frequencies.nbytes) / posting_count,
+                "block_bytes_per_posting": sum(array.nbytes for array in encoded.values()) / posting_count,
+                "encode_seconds": encode_seconds,
+                "set_postings_per_second": sampled_postings / set_seconds,
+                "decode_postings_per_second": sampled_postings / decode_seconds,
+                "decoded_exactly": bool(matches)
+            }
+        )
+    return results
+
+def boolean_benchmark(doc_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    results = []
+    for doc_count in doc_counts:
+        movies, queries = synthetic_corpus(doc_count)
+        index = InvertedIndex()
+        index.build(movies)
+        legacy = legacy_index(movies)
+        and_queries = [" AND ".join(query.split()[:2]) for query in queries]
+        not_queries = [f"{query.split()[0]} NOT {query.split()[1]}" for query in queries]
+        legacy_ms = time_queries(lambda query: legacy_search_movies(legacy, query, limit), queries)
+        or_ms = time_queries(lambda query: index.boolean_search(query, limit), queries)
+        and_ms = time_queries(lambda query: index.boolean_search(query, limit), and_queries)
+        not_ms = time_queries(lambda query: index.boolean_search(query, limit), not_queries)
+        results.append(
+            {
+                "documents": doc_count,
+                "legacy_ms": legacy_ms,
+                "or_ms": or_ms,
+                "and_ms": and_ms,
+                "not_ms": not_ms,
+                # the legacy union returns documents token by token, so only the matched set is comparable
+                "or_matches": all(
+                    set(legacy_search_movies(legacy, query, doc_count)) == {document["id"] for document in index.boolean_search(query, doc_count)}
+                    for query in queries
+                )
+            }
+        )
+    return results
+
+def semantic_benchmark(chunk_counts: list[int], limit: int=RESULT_LIMIT, legacy_max_chunks: int=BENCHMARK_LEGACY_MAX_CHUNKS) -> list[dict]:
+    results = []
+    for chunk_count in chunk_counts:
+        embeddings = synthetic_embeddings(chunk_count)
+        query_embeddings = synthetic_embeddings(BENCHMARK_QUERIES, BENCHMARK_SEED + 1)
+        start = time.perf_counter()
+        normalized = normalize_embeddings(embeddings)
+        normalize_ms = (time.perf_counter() - start) * 1000
+
+        def search(i: int) -> list[int]:
+            return top_k_indices(normalized @ normalize_embeddings(query_embeddings[i]), limit).tolist()
+        matrix_ms = time_queries(search, range(len(query_embeddings)))
+        legacy_ms, rankings_match = None, None
+        if chunk_count <= legacy_max_chunks:
+            legacy_queries = range(BENCHMARK_LEGACY_QUERIES)
+            legacy_ms = time_queries(lambda i: legacy_semantic_search(embeddings, query_embeddings[i], limit), legacy_queries)
+            rankings_match = all(legacy_semantic_search(embeddings, query_embeddings[i], limit) == search(i) for i in legacy_queries)
+        del embeddings, normalized
+        results.append(
+            {
+                "chunks": chunk_count,
+                "normalize_ms": normalize_ms,
+                "legacy_ms": legacy_ms,
+                "matrix_ms": matrix_ms,
+                "rankings_match": rankings_match
+            }
+        )
+    return results
+
+def coldstart_benchmark(chunk_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    # time from nothing loaded to the first chunked query's results, for the JSON and np.load store and the memory-mapped one
+    results = []
+    for chunk_count in chunk_counts:
+        query = normalize_embeddings(synthetic_embeddings(1, BENCHMARK_SEED + 1)[0])
+        with tempfile.TemporaryDirectory() as directory:
+            embeddings_path = os.path.join(directory, "chunk_embeddings.npy")
+            legacy_metadata_path = os.path.join(directory, "chunk_metadata.json")
+            metadata_path = os.path.join(directory, "chunk_metadata.npy")
+            save_array(embeddings_path, normalize_embeddings(synthetic_embeddings(chunk_count)))
+            columns = synthetic_chunk_metadata(chunk_count)
+            save_chunk_metadata(metadata_path, *columns)
+            with open(legacy_metadata_path, "w") as f:
+                chunks = [dict(zip(CHUNK_METADATA_FIELDS, values)) for values in zip(*(column.tolist() for column in columns))]
+                json.dump({"chunks": chunks, "total_chunks": chunk_count}, f, indent=2)
+                del chunks
+
+            def first_query(embeddings: ndarray, movie_indices: ndarray) -> list[int]:
+                starts = np.flatnonzero(np.diff(movie_indices, prepend=-1))
+                movie_scores = np.maximum.reduceat(embeddings @ query, starts)
+                return movie_indices[starts][top_k_indices(movie_scores, limit)].tolist()
+
+            start = time.perf_counter()
+            with open(embeddings_path, "rb") as f:
+                embeddings = normalize_embeddings(np.load(f))
+            with open(legacy_metadata_path, "r") as f:
+                movie_indices = np.array([chunk["movie_idx"] for chunk in json.load(f)["chunks"]], dtype=np.int64)
+            legacy_load_ms = (time.perf_counter() - start) * 1000
+            legacy_results = first_query(embeddings, movie_indices)
+            legacy_first_query_ms = (time.perf_counter() - start) * 1000
+            del embeddings, movie_indices
+
+            start = time.perf_counter()
+            embeddings = open_embeddings(embeddings_path)
+            movie_indices = load_chunk_metadata(metadata_path)[0]
+            mapped_load_ms = (time.perf_counter() - start) * 1000
+            mapped_results = first_query(embeddings, movie_indices)
+            mapped_first_query_ms = (time.perf_counter() - start) * 1000
+
+            results.append(
+                {
+                    "chunks": chunk_count,
+                    "legacy_metadata_mb": os.path.getsize(legacy_metadata_path) / 2**20,
+                    "metadata_mb": os.path.getsize(metadata_path) / 2**20,
+                    "legacy_load_ms": legacy_load_ms,
+                    "mapped_load_ms": mapped_load_ms,
+                    "legacy_first_query_ms": legacy_first_query_ms,
+                    "mapped_first_query_ms": mapped_first_query_ms,
+                    "results_match": legacy_results == mapped_results
+                }
+            )
+            del embeddings, movie_indices
+    return results
+
+def batch_benchmark(chunk_counts: list[int], query_count: int, limit: int=RESULT_LIMIT) -> list[dict]:
+    # chunked scoring one query at a time against search_chunks_many's batches of QUERY_BATCH_SIZE
+    queries = normalize_embeddings(synthetic_embeddings(query_count, BENCHMARK_SEED + 1))
+    results = []
+    for chunk_count in chunk_counts:
+        embeddings = normalize_embeddings(synthetic_embeddings(chunk_count))
+        movie_indices = synthetic_chunk_metadata(chunk_count)[0]
+        starts = np.flatnonzero(np.diff(movie_indices, prepend=-1))
+
+        start = time.perf_counter()
+        single = [top_k_indices(np.maximum.reduceat(embeddings @ query, starts), limit).tolist() for query in queries]
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = []
+        for batch_start in range(0, query_count, QUERY_BATCH_SIZE):
+            movie_scores = np.maximum.reduceat(queries[batch_start:batch_start + QUERY_BATCH_SIZE] @ embeddings.T, starts, axis=1)
+            batched.extend(top_k_indices(scores, limit).tolist() for scores in movie_scores)
+        batch_seconds = time.perf_counter() - start
+        del embeddings
+
+        results.append(
+            {
+                "chunks": chunk_count,
+                "queries": query_count,
+                "single_qps": query_count / single_seconds,
+                "batch_qps": query_count / batch_seconds,
+                "rankings_match": sum(a == b for a, b in zip(single, batched)) / query_count
+            }
+        )
+    return results
+
+def pooling_benchmark(chunk_counts: list[int], limit: int=RESULT_LIMIT) -> list[dict]:
+    # aggregation alone: chunk scores are computed up front, then pooled per movie and ranked
+    queries = normalize_embeddings(synthetic_embeddings(BENCHMARK_QUERIES, BENCHMARK_SEED + 1))
+    results = []
+    for chunk_count in chunk_counts:
+        embeddings = normalize_embeddings(synthetic_embeddings(chunk_count))
+        movie_indices = synthetic_chunk_metadata(chunk_count)[0]
+        starts = np.flatnonzero(np.diff(movie_indices, prepend=-1))
+        chunk_scores = queries @ embeddings.T
+        del embeddings
+
+        legacy = [legacy_chunk_pooling(scores, movie_indices, limit) for scores in chunk_scores]
+        legacy_ms = time_queries(lambda scores: legacy_chunk_pooling(scores, movie_indices, limit), chunk_scores)
+        for pooling in POOLING_METHODS:
+            search = lambda scores: top_k_indices(pool_scores(scores, starts, pooling), limit)
+            results.append(
+                {
+                    "chunks": chunk_count,
+                    "pooling": pooling,
+                    "legacy_ms": legacy_ms,
+                    "ms": time_queries(search, chunk_scores),
+                    "rankings_match": [search(scores).tolist() for scores in chunk_scores] == legacy if pooling == "max" else None
+                }
+            )
+    return results
+
+def backend_benchmark(model_names: list[str]=[SEMANTIC_MODEL, MULTIMODAL_MODEL], backends: list[str]=INFERENCE_BACKENDS, text_count: int=BENCHMARK_BACKEND_TEXTS) -> list[dict]:
+    # query latency is one text per encode call; throughput encodes the synthetic descriptions in the model's default batches
+    # parity is the cosine similarity of each description's embedding to the torch one
+    movies, queries = synthetic_corpus(text_count)
+    texts = [movie["description"] for movie in movies]
+    results = []
+    for model_name in model_names:
+        reference = None
+        for backend in ["torch"] + [backend for backend in backends if backend != "torch"]:
+            model = get_sentence_transformer(model_name, backend)
+            model.encode(queries[:1])
+            start = time.perf_counter()
+            embeddings = normalize_embeddings(model.encode(texts))
+            seconds = time.perf_counter() - start
+            reference = embeddings if reference is None else reference
+            parity = np.sum(embeddings * reference, axis=1)
+            if backend in backends:
+                results.append(
+                    {
+                        "model": model_name,
+                        "backend": backend,
+                        "load_seconds": get_model_registry().load_seconds[("sentence_transformer", model_name, backend)],
+                        "query_ms": time_queries(lambda query: model.encode([query]), queries),
+                        "texts_per_second": text_count / seconds,
+                        "mean_cosine": float(parity.mean()),
+                        "min_cosine": float(parity.min())
+                    }
+                )
+            get_model_registry().unload("sentence_transformer", model_name, backend)
+    return results
+
+def synthetic_hybrid_components(directory: str) -> tuple[ChunkedSemanticSearch, InvertedIndex]:
+    # the two halves of a HybridSearch with every file, including the query cache, kept in directory
+    semantic_search, index = ChunkedSemanticSearch(), InvertedIndex()
+    for component in (semantic_search, index):
+        for name in vars(component):
+            if name.endswith("_path"):
+                setattr(component, name, os.path.join(directory, os.path.basename(getattr(component, name))))
+    semantic_search.query_cache = QueryEmbeddingCache(semantic_search.model_name, path=os.path.join(directory, "query_embeddings.npy"))
+    return semantic_search, index
+
+def hybrid_benchmark(doc_count: int, limit: int=RESULT_LIMIT) -> dict:
+    # RRF queries against a long-lived HybridSearch, timed from construction to the first results and then per query
+    # the reloading column reopens the index before every query, as _bm25_search used to
+    # imported here, since hybrid_search sets up the Gemini client the other benchmarks do not need
+    from lib.hybrid_search import HybridSearch
+
+    movies, queries = synthetic_corpus(doc_count)
+    with tempfile.TemporaryDirectory() as directory:
+        components = lambda: synthetic_hybrid_components(directory)
+        start = time.perf_counter()
+        HybridSearch(movies, *components())
+        build_seconds = time.perf_counter() - start
+
+        # a cold process: the model, the chunk embeddings and the index segments all load before the first query
+        get_model_registry().unload()
+        start = time.perf_counter()
+        engine = HybridSearch(movies, *components())
+        first = engine.rrf_search(queries[0], RRF_K, limit=limit)
+        first_query_ms = (time.perf_counter() - start) * 1000
+
+        engine.rrf_search_many(queries, RRF_K, limit=limit)
+        steady = [engine.rrf_search(query, RRF_K, limit=limit) for query in queries]
+        steady_ms = time_queries(lambda query: engine.rrf_search(query, RRF_K, limit=limit), queries)
+
+        def reloading_search(query: str) -> list[dict]:
+            engine.idx.load()
+            return engine.rrf_search(query, RRF_K, limit=limit)
+
+        reloading_ms = time_queries(reloading_search, queries)
+        return {
+            "documents": doc_count,
+            "chunks": len(engine.semantic_search.chunk_embeddings),
+            "build_seconds": build_seconds,
+            "first_query_ms": first_query_ms,
+            "reloading_ms": reloading_ms,
+            "steady_ms": steady_ms,
+            "results_match": steady == [reloading_search(query) for query in queries] and first == steady[0]
+        }
+
+def legs_benchmark(doc_count: int, limit: int=RESULT_LIMIT, leg_timeout: float=BENCHMARK_LEG_TIMEOUT) -> list[dict]:
+    # per-leg and total RRF latency with the legs run one after the other, concurrently, and concurrently with a timeout
+    from lib.hybrid_search import HybridSearch
+
+    movies, queries = synthetic_corpus(doc_count)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = HybridSearch(movies, *synthetic_hybrid_components(directory))
+        engine.rrf_search_many(queries, RRF_K, limit=limit)
+        expected = None
+        results = []
+        for mode, concurrent, timeout in (("sequential", False, None), ("concurrent", True, None), ("timeout", True, leg_timeout)):
+            engine.concurrent, engine.leg_timeout = concurrent, timeout
+            timings, found = [], []
+            for query in queries:
+                found.append(engine.rrf_search(query, RRF_K, limit=limit))
+                timings.append(engine.timings)
+            expected = expected or found
+            results.append(
+                {
+                    "mode": mode,
+                    "bm25_ms": sum(timing["bm25_ms"] for timing in timings) / len(queries),
+                    "semantic_ms": sum(timing["semantic_ms"] for timing in timings) / len(queries),
+                    "total_ms": sum(timing["total_ms"] for timing in timings) / len(queries),
+                    "timed_out": sum(bool(timing["timed_out"]) for timing in timings) / len(queries),
+                    "results_match": sum(a == b for a, b in zip(found, expected)) / len(queries)
+                }
+            )
+        engine.close()
+    return results
+
+def depth_benchmark(limit: int=RESULT_LIMIT, queries: list[str] | None=None, engine: object | None=None) -> list[dict]:
+    # adaptive candidate depth against fusing the full limit * LIMIT_MULTIPLIER rankings, on the golden dataset queries by default
+    from lib.hybrid_search import get_hybrid_search
+
+    queries = queries if queries is not None else [test_case["query"] for test_case in load_golden_dataset()]
+    engine = engine or get_hybrid_search()
+    engine.rrf_search_many(queries, RRF_K, limit=limit)
+    results = []
+    for strategy in FUSION_STRATEGIES:
+        fusion = Fusion(strategy)
+        fixed = lambda query: engine.fused_search(query, fusion, limit, adaptive=False)
+        adaptive = lambda query: engine.fused_search(query, fusion, limit)
+        fixed_ids = [[result["id"] for result in fixed(query)] for query in queries]
+        adaptive_ids = [[result["id"] for result in adaptive(query)] for query in queries]
+        results.append(
+            {
+                "fusion": strategy,
+                "queries": len(queries),
+                "fixed_ms": time_queries(fixed, queries),
+                "adaptive_ms": time_queries(adaptive, queries),
+                "identical": sum(a == b for a, b in zip(fixed_ids, adaptive_ids)) / len(queries),
+                "overlap": sum(len(set(a) & set(b)) for a, b in zip(fixed_ids, adaptive_ids)) / max(sum(len(a) for a in fixed_ids), 1)
+            }
+        )
+    return results
+
+def fusion_benchmark(candidates: int=BENCHMARK_FUSION_CANDIDATES, limit: int=RESULT_LIMIT, seed: int=BENCHMARK_SEED) -> list[dict]:
+    # fusing two legs of candidates results each, half of them shared, down to limit formatted results
+    # the dict version gets the legs as the result dicts search used to pass it; the array version gets doc ID and score
+    # arrays and looks documents up only for the final results
+    # blocks counts the allocations held once every candidate is fused, peak_kib the most memory traced during one call
+    rng = np.random.default_rng(seed)
+    movies, _ = synthetic_corpus(candidates * 3 // 2, query_count=1, seed=seed)
+    docmap = {movie["id"]: movie for movie in movies}
+    ids = np.array([movie["id"] for movie in movies], dtype=np.int64)
+    shared = rng.permutation(len(ids))
+    bm25_ids, semantic_ids = ids[shared[:candidates]], ids[shared[len(ids) - candidates:]]
+    bm25_scores = np.sort(rng.gamma(2.0, 2.0, candidates))[::-1]
+    semantic_scores = np.sort(rng.uniform(0.1, 0.8, candidates))[::-1]
+    legs = [(bm25_ids, bm25_scores), (semantic_ids, semantic_scores)]
+    leg_results = [
+        [{"id": doc_id, "title": docmap[doc_id]["title"], "document": docmap[doc_id]["description"], "score": round(float(score), 3)} for doc_id, score in zip(leg_ids.tolist(), leg_scores.tolist())]
+        for leg_ids, leg_scores in legs
+    ]
+
+    def measure(fuse: Callable[[], object], select: Callable[[object], list[dict]]) -> tuple[float, int, float]:
+        select(fuse())
+        ms = time_queries(lambda _: select(fuse()), range(BENCHMARK_QUERIES))
+        tracemalloc.start()
+        candidates = fuse()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        select(candidates)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return ms, blocks, peak / 1024
+
+    results = []
+    for strategy in FUSION_STRATEGIES:
+        fusion = Fusion(strategy)
+
+        def array_results(candidates: tuple[ndarray, ndarray, ndarray, ndarray]) -> list[dict]:
+            doc_ids, _, _, fused = candidates
+            top = top_k_indices(fused, limit)
+            return [{"id": doc_id, "title": docmap[doc_id]["title"], "document": docmap[doc_id]["description"], "score": score} for doc_id, score in zip(doc_ids[top].tolist(), fused[top].tolist())]
+
+        ms, blocks, peak_kib = measure(lambda: fusion.fuse(legs, [bm25_scores, semantic_scores]), array_results)
+        legacy_ms = legacy_blocks = legacy_peak_kib = None
+        if strategy in ("rrf", "weighted"):
+            legacy_ms, legacy_blocks, legacy_peak_kib = measure(lambda: legacy_fused_candidates(*leg_results, strategy), lambda candidates: legacy_top_results(*candidates, limit))
+        results.append(
+            {
+                "strategy": strategy,
+                "candidates": candidates,
+                "legacy_ms": legacy_ms,
+                "ms": ms,
+                "legacy_blocks": legacy_blocks,
+                "blocks": blocks,
+                "legacy_peak_kib": legacy_peak_kib,
+                "peak_kib": peak_kib
+            }
+        )
+    return results
+
+def cache_benchmark(doc_count: int, lookups: int=BENCHMARK_CACHE_LOOKUPS, limit: int=RESULT_LIMIT, seed: int=BENCHMARK_SEED) -> list[dict]:
+    # RRF lookups drawn from the synthetic queries with Zipf-like popularity, without the cache, with both tiers,
+    # and from the disk tier alone as a fresh process would see it; the last row rebuilds the index first
+    from lib.hybrid_search import HybridSearch
+
+    movies, queries = synthetic_corpus(doc_count, seed=seed)
+    popularity = 1 / np.arange(1, len(queries) + 1)
+    stream = [queries[i] for i in np.random.default_rng(seed).choice(len(queries), lookups, p=popularity / popularity.sum()).tolist()]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = HybridSearch(movies, *synthetic_hybrid_components(directory))
+        search = lambda query: engine.rrf_search(query, RRF_K, limit=limit)
+        expected = {query: search(query) for query in queries}
+
+        def run(mode: str, cache: ResultCache | None) -> dict:
+            engine.result_cache = cache
+            start = time.perf_counter()
+            found = [search(query) for query in stream]
+            ms = (time.perf_counter() - start) * 1000 / lookups
+            stats = cache.stats() if cache is not None else {"memory_hits": 0, "disk_hits": 0, "hit_rate": 0.0}
+            return {
+                "mode": mode,
+                "lookups": lookups,
+                "ms": ms,
+                "memory_hits": stats["memory_hits"],
+                "disk_hits": stats["disk_hits"],
+                "hit_rate": stats["hit_rate"],
+                "results_match": sum(result == expected[query] for query, result in zip(stream, found)) / lookups
+            }
+
+        cache_path = os.path.join(directory, "results")
+        results = [run("uncached", None), run("two-tier", ResultCache(path=cache_path)), run("disk only", ResultCache(size=0, path=cache_path))]
+        # a rebuild rewrites the manifest, so every entry of the old index misses
+        time.sleep(0.01)
+        engine.idx.build(movies)
+        engine.idx.save()
+        results.append(run("rebuilt", ResultCache(path=cache_path)))
+    return results
+
+def ann_benchmark(chunk_count: int, limit: int=RESULT_LIMIT, nprobes: list[int]=BENCHMARK_NPROBES) -> list[dict]:
+    # the last BENCHMARK_QUERIES clustered vectors are held out as queries
+    embeddings = normalize_embeddings(synthetic_embeddings(chunk_count + BENCHMARK_QUERIES, clustered=True))
+    queries, embeddings = embeddings[chunk_count:], embeddings[:chunk_count]
+    index = IVFIndex()
+    start = time.perf_counter()
+    index.build(embeddings)
+    build_seconds = time.perf_counter() - start
+
+    exact = [set(index.search(embeddings, query, limit, len(index.centroids))[0].tolist()) for query in queries]
+    exact_ms = time_queries(lambda query: index.search(embeddings, query, limit, len(index.centroids)), queries)
+    results = [{"nprobe": None, "lists": len(index.centroids), "build_seconds": build_seconds, "scanned": 1.0, "recall": 1.0, "ms": exact_ms}]
+    for nprobe in nprobes:
+        if nprobe >= len(index.centroids):
+            break
+        found = [set(index.search(embeddings, query, limit, nprobe)[0].tolist()) for query in queries]
+        results.append(
+            {
+                "nprobe": nprobe,
+                "lists": len(index.centroids),
+                "build_seconds": build_seconds,
+                "scanned": sum(len(index.candidates(query, nprobe)) for query in queries) / (len(queries) * chunk_count),
+                "recall": sum(len(approximate & truth) for approximate, truth in zip(found, exact)) / sum(len(truth) for truth in exact),
+                "ms": time_queries(lambda query: index.search(embeddings, query, limit, nprobe), queries)
+            }
+        )
+    return results
+
+def quantization_benchmark(chunk_count: int, limit: int=RESULT_LIMIT, modes: list[str]=QUANTIZATION_MODES) -> list[dict]:
+    # the last BENCHMARK_QUERIES clustered vectors are held out as queries; recall is against the float32 top-k
+    embeddings = normalize_embeddings(synthetic_embeddings(chunk_count + BENCHMARK_QUERIES, clustered=True))
+    queries, embeddings = embeddings[chunk_count:], embeddings[:chunk_count]
+    exact = [set(top_k_indices(embeddings @ query, limit).tolist()) for query in queries]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "chunk_embeddings.npy")
+        np.save(path, embeddings)
+        for mode in modes:
+            start = time.perf_counter()
+            if mode != "float32":
+                load_or_build_quantized(np.load(path, mmap_mode="r"), path, mode)
+            build_seconds = time.perf_counter() - start
+
+            # a cold start reads what SemanticSearch.load reads for the mode
+            start = time.perf_counter()
+            if mode == "float32":
+                loaded = normalize_embeddings(np.load(path))
+                memory_bytes = loaded.nbytes
+                search = lambda query: top_k_indices(loaded @ query, limit)
+                approximate_search = search
+            else:
+                quantized = load_or_build_quantized(np.load(path, mmap_mode="r"), path, mode)
+                memory_bytes = quantized.nbytes
+                search = lambda query: quantized.search(query, limit)[0]
+                approximate_search = lambda query: top_k_indices(quantized.scores(query), limit)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            def recall(search: Callable[[ndarray], ndarray]) -> float:
+                found = [set(search(query).tolist()) for query in queries]
+                return sum(len(approximate & truth) for approximate, truth in zip(found, exact)) / sum(len(truth) for truth in exact)
+
+            results.append(
+                {
+                    "mode": mode,
+                    "memory_mb": memory_bytes / 2**20,
+                    "build_seconds": build_seconds,
+                    "load_ms": load_ms,
+                    "codes_recall": recall(approximate_search),
+                    "rescored_recall": recall(search),
+                    "ms": time_queries(search, queries)
+                }
+            )
+    return results
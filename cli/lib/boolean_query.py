@@ -0,0 +1,212 @@
+import re
+import math
+import numpy as np
+from bisect import bisect_left
+from heapq import heapify, heapreplace
+
+
+QUERY_TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+OPERATORS = {"AND", "OR", "NOT"}
+MAX_RUN_BLOCKS = 64
+
+
+def parse_query(query: str) -> tuple:
+    # grammar: query = and (["OR"] and)*, and = not (("AND" not) | ("NOT" not))*, not = "NOT" not | "(" query ")" | term
+    # adjacent terms without an operator are ORed, which matches plain keyword search; "a NOT b" reads as "a AND NOT b"
+    tokens = QUERY_TOKEN_PATTERN.findall(query)
+    position = 0
+
+    def peek() -> str | None:
+        return tokens[position] if position < len(tokens) else None
+
+    def take() -> str:
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or() -> tuple:
+        children = [parse_and()]
+        while peek() is not None and peek() != ")":
+            if peek() == "OR":
+                take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and() -> tuple:
+        children = [parse_not()]
+        while peek() in ("AND", "NOT"):
+            if peek() == "AND":
+                take()
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not() -> tuple:
+        token = peek()
+        if token is None:
+            raise ValueError("Query ends where a term was expected")
+        if token == "NOT":
+            take()
+            return ("not", parse_not())
+        if token == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis")
+            take()
+            return node
+        if token == ")" or token in OPERATORS:
+            raise ValueError(f"Unexpected '{token}'")
+        return ("term", take())
+
+    if not tokens:
+        raise ValueError("Query is empty")
+    node = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected '{peek()}'")
+    return node
+
+
+def keyword_query(query: str) -> tuple:
+    # the OR of the query's terms, operators and parentheses dropped, for text that does not parse as a boolean query
+    terms = [("term", token) for token in QUERY_TOKEN_PATTERN.findall(query) if token not in OPERATORS and token not in ("(", ")")]
+    if not terms:
+        raise ValueError("Query has no search terms")
+    return terms[0] if len(terms) == 1 else ("or", terms)
+
+
+class TermCursor:
+    def __init__(self, blocks: "TermBlocks") -> None:
+        self.blocks = blocks # block skip data and decoder for one term's postings
+        self.size = blocks.size # most documents the cursor can match
+        self.ordinals: list[int] = [] # decoded ordinals of the current run of blocks
+        self.position = 0
+        self.next_block = 0 # first block not decoded yet
+        self.run_blocks = 1 # blocks to decode next; doubles so a full scan needs few decode calls
+        self.__fill()
+
+    def __fill(self) -> None:
+        # decodes runs of blocks until one has a live posting or the blocks run out
+        while self.position >= len(self.ordinals) and self.next_block < len(self.blocks.block_last):
+            end = min(self.next_block + self.run_blocks, len(self.blocks.block_last))
+            self.ordinals, self.position = self.blocks.decode(self.next_block, end), 0
+            self.next_block = end
+            self.run_blocks = min(self.run_blocks * 2, MAX_RUN_BLOCKS)
+
+    def current(self) -> float:
+        return self.ordinals[self.position] if self.position < len(self.ordinals) else math.inf
+
+    def advance_to(self, ordinal: float) -> None:
+        if not self.ordinals or self.ordinals[-1] < ordinal:
+            # the skip data finds the first block that can hold the target without decoding the ones before it
+            self.next_block = int(np.searchsorted(self.blocks.block_last, ordinal)) if ordinal < math.inf else len(self.blocks.block_last)
+            self.ordinals, self.position, self.run_blocks = [], 0, 1
+            self.__fill()
+        # galloping search: double the step until it passes the target, then bisect the last step
+        step, low = 1, self.position
+        while low + step < len(self.ordinals) and self.ordinals[low + step] < ordinal:
+            low += step
+            step *= 2
+        self.position = bisect_left(self.ordinals, ordinal, low, min(low + step + 1, len(self.ordinals)))
+        self.__fill()
+
+    def next(self) -> None:
+        self.position += 1
+        self.__fill()
+
+
+class AllCursor:
+    def __init__(self, live: list[int] | range) -> None:
+        self.live = live # sorted ordinals of every live document
+        self.size = len(live)
+        self.position = 0
+
+    def current(self) -> float:
+        return self.live[self.position] if self.position < len(self.live) else math.inf
+
+    def advance_to(self, ordinal: float) -> None:
+        self.position = bisect_left(self.live, ordinal, self.position)
+
+    def next(self) -> None:
+        self.position += 1
+
+
+class AndCursor:
+    def __init__(self, children: list) -> None:
+        # the rarest child leads, so the others are galloped past the most documents
+        self.children = sorted(children, key=lambda child: child.size)
+        self.size = self.children[0].size
+        self.__align()
+
+    def __align(self) -> None:
+        leader = self.children[0]
+        while leader.current() < math.inf:
+            target = leader.current()
+            for child in self.children[1:]:
+                child.advance_to(target)
+                if child.current() != target:
+                    leader.advance_to(child.current())
+                    break
+            else:
+                return
+
+    def current(self) -> float:
+        return self.children[0].current()
+
+    def advance_to(self, ordinal: float) -> None:
+        self.children[0].advance_to(ordinal)
+        self.__align()
+
+    def next(self) -> None:
+        self.children[0].next()
+        self.__align()
+
+
+class OrCursor:
+    def __init__(self, children: list) -> None:
+        # k-way merge over a min-heap of (current ordinal, child index)
+        self.children = children
+        self.size = sum(child.size for child in children)
+        self.heap = [(child.current(), i) for i, child in enumerate(children)]
+        heapify(self.heap)
+
+    def current(self) -> float:
+        return self.heap[0][0]
+
+    def advance_to(self, ordinal: float) -> None:
+        while self.heap[0][0] < ordinal:
+            child = self.children[self.heap[0][1]]
+            child.advance_to(ordinal)
+            heapreplace(self.heap, (child.current(), self.heap[0][1]))
+
+    def next(self) -> None:
+        ordinal = self.current()
+        while self.heap[0][0] == ordinal and ordinal < math.inf:
+            child = self.children[self.heap[0][1]]
+            child.next()
+            heapreplace(self.heap, (child.current(), self.heap[0][1]))
+
+
+class DifferenceCursor:
+    def __init__(self, include, exclude) -> None:
+        self.include = include # documents that may match
+        self.exclude = exclude # documents removed from include
+        self.size = include.size
+        self.__skip_excluded()
+
+    def __skip_excluded(self) -> None:
+        while self.include.current() < math.inf:
+            self.exclude.advance_to(self.include.current())
+            if self.exclude.current() != self.include.current():
+                return
+            self.include.next()
+
+    def current(self) -> float:
+        return self.include.current()
+
+    def advance_to(self, ordinal: float) -> None:
+        self.include.advance_to(ordinal)
+        self.__skip_excluded()
+
+    def next(self) -> None:
+        self.include.next()
+        self.__skip_excluded()
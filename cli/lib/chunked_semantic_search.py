@@ -1,92 +1,258 @@
-from lib.semantic_search import SemanticSearch, semantic_chunk, cosine_similarity
-from lib.search_utils import MODEL_NAME, CACHE, SCORE_PRECISION, DOCUMENT_PREVIEW_LENGTH, load_movies
+from lib.semantic_search import SemanticSearch, semantic_chunk
+from lib.ivf_index import IVFIndex
+from lib.quantization import QuantizedEmbeddings, load_or_build_quantized
+from lib.embedding_store import save_array, open_embeddings, save_chunk_metadata, load_chunk_metadata, text_fingerprints, load_fingerprints, fingerprint_rows, fill_embeddings
+from lib.search_utils import SEMANTIC_MODEL, INFERENCE_BACKEND, CACHE, SCORE_PRECISION, DOCUMENT_PREVIEW_LENGTH, IVF_MIN_CHUNKS, MAX_CHUNK_SIZE, SENTENCE_OVERLAP, EMBEDDING_QUANTIZATION, RESCORE_MULTIPLIER, QUERY_BATCH_SIZE, EMBEDDING_BATCH_SIZE, CHECKPOINT_INTERVAL, CHUNK_POOLING, load_movies, top_k_indices, pool_scores
 
 import os
 import json
+import hashlib
 import numpy as np
 from numpy import ndarray
+from typing import Iterator
+from itertools import batched, chain, islice
 
 
 class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name: str=MODEL_NAME) -> None:
-        super().__init__(model_name)
-        self.chunk_embeddings: ndarray[ndarray] | None = None # array of embedded chunks
-        self.chunk_metadata: list[dict] | None = None # list of chunk metadata
+    def __init__(self, model_name: str=SEMANTIC_MODEL, quantization: str=EMBEDDING_QUANTIZATION, backend: str=INFERENCE_BACKEND) -> None:
+        super().__init__(model_name, quantization, backend)
+        self.chunk_embeddings: ndarray | None = None # L2-normalized float32 matrix of embedded chunks, one row per chunk; memory-mapped once saved
+        self.chunk_quantized: QuantizedEmbeddings | None = None # compressed copy of chunk_embeddings, None in float32 mode
+        self.chunk_movie_indices: ndarray = np.empty(0, dtype=np.int32) # movie index of each chunk
+        self.chunk_indices: ndarray = np.empty(0, dtype=np.int32) # position of each chunk within its movie's description
+        self.chunk_totals: ndarray = np.empty(0, dtype=np.int32) # number of chunks in each chunk's movie
+        self.chunk_movies: ndarray = np.empty(0, dtype=np.int64) # movie index of each run of chunks
+        self.chunk_movie_starts: ndarray = np.empty(0, dtype=np.int64) # first chunk of each run
+        self.chunk_fingerprints: ndarray = np.empty(0, dtype=np.uint64) # content hash of each chunk's text
+        self.document_fingerprints: ndarray = np.empty(0, dtype=np.uint64) # content hash of each description the chunks were cut from
+        self.document_ids: ndarray = np.empty(0, dtype=np.int64) # doc ID of each movie index
+        self.resumed_count = 0 # chunk embeddings kept from an interrupted build
+        self.ivf_index = IVFIndex() # approximate nearest-neighbour lists over chunk_embeddings, unbuilt for small collections
         self.chunk_embeddings_path = os.path.join(CACHE, "chunk_embeddings.npy")
-        self.metadata_path = os.path.join(CACHE, "chunk_metadata.json")
+        self.metadata_path = os.path.join(CACHE, "chunk_metadata.npy")
+        self.chunk_fingerprints_path = os.path.join(CACHE, "chunk_fingerprints.npy")
+        self.document_fingerprints_path = os.path.join(CACHE, "chunk_document_fingerprints.npy")
+        self.ivf_path = os.path.join(CACHE, "chunk_ivf.npz")
+        self.partial_path = os.path.join(CACHE, "chunk_embeddings.partial.npy")
+        self.checkpoint_path = os.path.join(CACHE, "chunk_embeddings.checkpoint.json")
+
+    def __document_fingerprints(self) -> ndarray:
+        # chunking settings are part of the key, since changing them changes every chunk
+        return text_fingerprints([doc["description"] for doc in self.documents], f"{self.model_name}:{MAX_CHUNK_SIZE}:{SENTENCE_OVERLAP}")
+
+    def __document_chunks(self) -> Iterator[tuple[int, list[str]]]:
+        # movie index and chunks of every document with a description, chunked one document at a time
+        for movie_idx, doc in enumerate(self.documents):
+            if doc["description"].strip():
+                yield movie_idx, semantic_chunk(doc["description"])
 
     def build_chunk_embeddings(self, documents: list[dict]) -> ndarray[ndarray]:
+        # streams chunks through the encoder in batches into a partial file on disk, so peak memory stays at one batch
+        # chunks whose fingerprint is already saved keep their stored vector; only new or edited ones are encoded
         self.documents = documents
-        all_chunks = []
-        metadata = []
         for doc in self.documents:
             self.docmap[doc["id"]] = doc
-            if not doc["description"].strip():
-                continue
-            description_chunks = semantic_chunk(doc["description"])
-            for chunk in description_chunks:
-                all_chunks.append(chunk)
-                metadata.append(
-                    {
-                        "movie_idx": self.documents.index(doc),
-                        "chunk_idx": description_chunks.index(chunk),
-                        "total_chunks": len(description_chunks)
-                    }
-                )
-        self.chunk_embeddings = self.model.encode(all_chunks, show_progress_bar=True)
-        self.chunk_metadata = metadata
-        self.save_chunks(all_chunks)
+        self.document_ids = np.array([doc["id"] for doc in documents], dtype=np.int64)
+        movie_indices, chunk_indices, chunk_totals, fingerprints = [], [], [], []
+        for movie_idx, description_chunks in self.__document_chunks():
+            movie_indices.append(np.full(len(description_chunks), movie_idx, dtype=np.int32))
+            chunk_indices.append(np.arange(len(description_chunks), dtype=np.int32))
+            chunk_totals.append(np.full(len(description_chunks), len(description_chunks), dtype=np.int32))
+            fingerprints.append(text_fingerprints(description_chunks, self.model_name))
+        self.chunk_movie_indices = np.concatenate(movie_indices or [np.empty(0, dtype=np.int32)])
+        self.chunk_indices = np.concatenate(chunk_indices or [np.empty(0, dtype=np.int32)])
+        self.chunk_totals = np.concatenate(chunk_totals or [np.empty(0, dtype=np.int32)])
+        self.chunk_fingerprints = np.concatenate(fingerprints or [np.empty(0, dtype=np.uint64)])
+        self.document_fingerprints = self.__document_fingerprints()
+        self.__stream_chunk_embeddings()
+        self.chunk_embeddings = open_embeddings(self.chunk_embeddings_path)
+        self.__group_chunks()
+        self.__build_ivf()
+        self.save_chunks()
+        # reopened from disk, so the freshly built process shares pages like any other
+        self.load_chunks()
         return self.chunk_embeddings
+
+    def __stream_chunk_embeddings(self) -> None:
+        # rows are written to partial_path in order; every CHECKPOINT_INTERVAL batches the finished row count is recorded,
+        # and a later build of the same chunks resumes from there
+        os.makedirs(CACHE, exist_ok=True)
+        previous, previous_fingerprints = None, load_fingerprints(self.chunk_fingerprints_path)
+        if os.path.exists(self.chunk_embeddings_path):
+            previous = open_embeddings(self.chunk_embeddings_path)
+        if previous is None or len(previous) != len(previous_fingerprints):
+            previous_fingerprints = np.empty(0, dtype=np.uint64)
+        rows = fingerprint_rows(self.chunk_fingerprints, previous_fingerprints)
+
+        checkpoint = {
+            "chunks": len(self.chunk_fingerprints),
+            "dimensions": self.model.get_sentence_embedding_dimension(),
+            "fingerprint": hashlib.blake2b(self.chunk_fingerprints.tobytes()).hexdigest(),
+            "completed": 0
+        }
+        saved = {}
+        if os.path.exists(self.checkpoint_path) and os.path.exists(self.partial_path):
+            with open(self.checkpoint_path, "r") as f:
+                saved = json.load(f)
+        if all(saved.get(key) == checkpoint[key] for key in ("chunks", "dimensions", "fingerprint")):
+            checkpoint["completed"] = saved["completed"]
+            partial = np.load(self.partial_path, mmap_mode="r+")
+        else:
+            partial = np.lib.format.open_memmap(self.partial_path, mode="w+", dtype=np.float32, shape=(checkpoint["chunks"], checkpoint["dimensions"]))
+        self.resumed_count = completed = checkpoint["completed"]
+        self.reused_count = 0
+
+        chunks = islice(chain.from_iterable(description_chunks for _, description_chunks in self.__document_chunks()), completed, None)
+        for batch_number, batch in enumerate(batched(chunks, EMBEDDING_BATCH_SIZE), 1):
+            end = completed + len(batch)
+            partial[completed:end], reused = fill_embeddings(list(batch), rows[completed:end], previous, self.model.encode)
+            self.reused_count += reused
+            completed = end
+            if batch_number % CHECKPOINT_INTERVAL == 0:
+                partial.flush()
+                checkpoint["completed"] = completed
+                self.__save_checkpoint(checkpoint)
+        partial.flush()
+        del partial
+        self.encoded_count = len(self.chunk_fingerprints) - self.resumed_count - self.reused_count
+
+        # the old fingerprints go first, so a crash before save_chunks can never pair them with the new vectors
+        for path in (self.document_fingerprints_path, self.chunk_fingerprints_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.replace(self.partial_path, self.chunk_embeddings_path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def __save_checkpoint(self, checkpoint: dict) -> None:
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
     
     def load_or_create_chunk_embeddings(self, documents: list[dict]) -> ndarray[ndarray]:
         self.documents = documents
         for doc in self.documents:
             self.docmap[doc["id"]] = doc
+        self.document_ids = np.array([doc["id"] for doc in documents], dtype=np.int64)
+        # unchanged descriptions mean unchanged chunks, so the common case never re-chunks
         if os.path.exists(self.chunk_embeddings_path) and os.path.exists(self.metadata_path):
-            self.load_chunks()
-            return self.chunk_embeddings
+            if np.array_equal(load_fingerprints(self.document_fingerprints_path), self.__document_fingerprints()):
+                self.load_chunks()
+                return self.chunk_embeddings
         return self.build_chunk_embeddings(documents)
         
-    def save_chunks(self, all_chunks: list[str]) -> None:
-        with open(self.chunk_embeddings_path, "wb") as f:
-            np.save(f, self.chunk_embeddings)
-        with open(self.metadata_path, "w") as f:
-            json.dump(
-                {
-                    "chunks": self.chunk_metadata,
-                    "total_chunks": len(all_chunks)
-                },
-                f,
-                indent=2
-            )
+    def save_chunks(self) -> None:
+        # chunk_embeddings is already on disk; the document fingerprints are written last since they mark the build complete
+        os.makedirs(CACHE, exist_ok=True)
+        if self.ivf_index.is_built():
+            self.ivf_index.save(self.ivf_path)
+        save_chunk_metadata(self.metadata_path, self.chunk_movie_indices, self.chunk_indices, self.chunk_totals)
+        save_array(self.chunk_fingerprints_path, self.chunk_fingerprints)
+        save_array(self.document_fingerprints_path, self.document_fingerprints)
     
     def load_chunks(self) -> None:
-        with open(self.chunk_embeddings_path, "rb") as f:
-            self.chunk_embeddings = np.load(f)
-        with open(self.metadata_path, "r") as f:
-            data = json.load(f)
-            self.chunk_metadata = data["chunks"]
-
-    def search_chunks(self, query: str, limit: int) -> list[dict]:
-        query_embedding = self.generate_embedding(query)
-        chunk_scores = []
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            score = cosine_similarity(query_embedding, chunk_embedding)
-            chunk_scores.append(
-                {
-                    "chunk_idx": i,
-                    "movie_idx": self.chunk_metadata[i]["movie_idx"],
-                    "score": score
-                }
-            )
-        movie_scores = {}
-        for chunk_score in chunk_scores:
-            movie_idx, score = chunk_score["movie_idx"], chunk_score["score"]
-            if movie_idx not in movie_scores or score > movie_scores.get(movie_idx, 0):
-                movie_scores[movie_idx] = score
-        sorted_movies = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)
+        # embeddings and metadata are memory-mapped; pages are read as searches touch them
+        self.chunk_embeddings = open_embeddings(self.chunk_embeddings_path)
+        if self.quantization != "float32":
+            # the codes are searched in memory; the float32 rows are only touched for rescoring
+            self.chunk_quantized = load_or_build_quantized(self.chunk_embeddings, self.chunk_embeddings_path, self.quantization)
+        self.chunk_movie_indices, self.chunk_indices, self.chunk_totals = load_chunk_metadata(self.metadata_path)
+        self.chunk_fingerprints = load_fingerprints(self.chunk_fingerprints_path)
+        self.document_fingerprints = load_fingerprints(self.document_fingerprints_path)
+        self.__group_chunks()
+        if os.path.exists(self.ivf_path):
+            self.ivf_index.load(self.ivf_path)
+        if self.ivf_index.list_offsets[-1] != len(self.chunk_embeddings):
+            # missing, or built for a different set of chunks
+            self.__build_ivf()
+            if self.ivf_index.is_built():
+                self.ivf_index.save(self.ivf_path)
+
+    def __group_chunks(self) -> None:
+        # chunks are written movie by movie, so each movie's chunks form one run
+        self.chunk_movie_starts = np.flatnonzero(np.diff(self.chunk_movie_indices, prepend=-1))
+        self.chunk_movies = self.chunk_movie_indices[self.chunk_movie_starts]
+
+    def __build_ivf(self) -> None:
+        self.ivf_index = IVFIndex()
+        if len(self.chunk_embeddings) >= IVF_MIN_CHUNKS:
+            self.ivf_index.build(self.chunk_embeddings)
+
+    def __chunk_scores(self, query_embedding: ndarray, rows: ndarray | None) -> ndarray:
+        # scores of every chunk or the given rows, approximate when quantized
+        if self.chunk_quantized is not None:
+            return self.chunk_quantized.scores(query_embedding, rows)
+        return (self.chunk_embeddings if rows is None else self.chunk_embeddings[rows]) @ query_embedding
+
+    def __movie_scores(self, query_embedding: ndarray, limit: int, nprobe: int | None, exact: bool, pooling: str) -> tuple[ndarray, ndarray]:
+        # movie indices and scores, where a movie's chunk scores are pooled into one
+        # with IVF only the probed chunks of a movie are pooled
+        nprobe = nprobe if nprobe is not None else self.ivf_index.nprobe
+        rows, movies, starts = None, self.chunk_movies, self.chunk_movie_starts
+        if not exact and self.ivf_index.is_built() and nprobe < len(self.ivf_index.centroids):
+            candidates = self.ivf_index.candidates(query_embedding, nprobe)
+            movie_indices = self.chunk_movie_indices[candidates]
+            candidate_starts = np.flatnonzero(np.diff(movie_indices, prepend=-1))
+            # too few movies among the probed lists falls back to the exact scan
+            if len(candidate_starts) >= max(limit, 1):
+                rows, movies, starts = candidates, movie_indices[candidate_starts], candidate_starts
+        chunk_scores = self.__chunk_scores(query_embedding, rows)
+        if not len(chunk_scores):
+            return movies, chunk_scores
+        movie_scores = pool_scores(chunk_scores, starts, pooling)
+        if self.chunk_quantized is None:
+            return movies, movie_scores
+
+        # the best movies on the codes are rescored from their full-precision chunks
+        shortlist = np.sort(top_k_indices(movie_scores, limit * RESCORE_MULTIPLIER))
+        if not len(shortlist):
+            return movies[shortlist], movie_scores[shortlist]
+        counts = np.diff(np.append(starts, len(chunk_scores)))[shortlist]
+        offsets = np.concatenate(([0], np.cumsum(counts[:-1])))
+        positions = np.repeat(starts[shortlist] - offsets, counts) + np.arange(counts.sum())
+        exact_scores = self.chunk_quantized.exact_scores(query_embedding, positions if rows is None else rows[positions])
+        return movies[shortlist], pool_scores(exact_scores, offsets, pooling)
+
+    def __batch_movie_scores(self, query_embeddings: ndarray, limit: int, nprobe: int | None, exact: bool, pooling: str) -> list[tuple[ndarray, ndarray]]:
+        # one matrix-matrix product covers the batch when every chunk is scored at full precision
+        # IVF probes and quantized codes pick different rows per query, so those go one query at a time
+        nprobe = nprobe if nprobe is not None else self.ivf_index.nprobe
+        probes = not exact and self.ivf_index.is_built() and nprobe < len(self.ivf_index.centroids)
+        if probes or self.chunk_quantized is not None or not len(self.chunk_embeddings):
+            return [self.__movie_scores(query_embedding, limit, nprobe, exact, pooling) for query_embedding in query_embeddings]
+        movie_scores = pool_scores(query_embeddings @ self.chunk_embeddings.T, self.chunk_movie_starts, pooling)
+        return [(self.chunk_movies, scores) for scores in movie_scores]
+
+    def fingerprint(self) -> str:
+        # names the searchable state: the descriptions the chunks were cut from and everything that decides their scores
+        digest = hashlib.blake2b(f"{self.model_name}:{self.backend}:{self.quantization}:{self.ivf_index.nprobe}".encode(), digest_size=8)
+        digest.update(self.document_fingerprints.tobytes())
+        return digest.hexdigest()
+
+    def search_chunks(self, query: str, limit: int, nprobe: int | None=None, exact: bool=False, pooling: str=CHUNK_POOLING) -> list[dict]:
+        return self.search_chunks_many([query], limit, nprobe, exact, pooling)[0]
+
+    def search_chunks_many(self, queries: list[str], limit: int, nprobe: int | None=None, exact: bool=False, pooling: str=CHUNK_POOLING) -> list[list[dict]]:
+        return [self.__chunk_results(movie_indices, movie_scores) for movie_indices, movie_scores in self.__rank_movies(queries, limit, nprobe, exact, pooling)]
+
+    def rank_chunks_many(self, queries: list[str], limit: int, nprobe: int | None=None, exact: bool=False, pooling: str=CHUNK_POOLING) -> list[tuple[ndarray, ndarray]]:
+        # doc IDs and scores in search_chunks_many order, without formatting the documents
+        return [(self.document_ids[movie_indices], movie_scores) for movie_indices, movie_scores in self.__rank_movies(queries, limit, nprobe, exact, pooling)]
+
+    def __rank_movies(self, queries: list[str], limit: int, nprobe: int | None, exact: bool, pooling: str) -> list[tuple[ndarray, ndarray]]:
+        # movie indices and scores of each query's top limit movies, best first
+        query_embeddings = self.generate_query_embeddings(queries)
+        rankings = []
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            for movie_indices, movie_scores in self.__batch_movie_scores(query_embeddings[start:start + QUERY_BATCH_SIZE], limit, nprobe, exact, pooling):
+                rows = top_k_indices(movie_scores, limit)
+                rankings.append((movie_indices[rows], movie_scores[rows]))
+        return rankings
+
+    def __chunk_results(self, movie_indices: ndarray, movie_scores: ndarray) -> list[dict]:
         results = []
-        for movie_idx, score in sorted_movies[:limit]:
+        for movie_idx, score in zip(movie_indices.tolist(), movie_scores.tolist()):
             document = self.documents[movie_idx]
             results.append(
                 {
@@ -103,10 +269,12 @@ def embed_chunks() -> None:
     chunked_semantic_search = ChunkedSemanticSearch()
     movies = load_movies()
     chunk_embeddings = chunked_semantic_search.load_or_create_chunk_embeddings(movies)
+    if chunked_semantic_search.reused_count or chunked_semantic_search.encoded_count or chunked_semantic_search.resumed_count:
+        print(f"Resumed {chunked_semantic_search.resumed_count} chunk embeddings, reused {chunked_semantic_search.reused_count}, encoded {chunked_semantic_search.encoded_count}")
     print(f"Generated {len(chunk_embeddings)} chunked embeddings")
 
-def search_chunked_command(query: str, limit: int) -> list[dict]:
-    chunked_semantic_search = ChunkedSemanticSearch()
+def search_chunked_command(query: str, limit: int, nprobe: int | None=None, exact: bool=False, quantization: str=EMBEDDING_QUANTIZATION, pooling: str=CHUNK_POOLING) -> list[dict]:
+    chunked_semantic_search = ChunkedSemanticSearch(quantization=quantization)
     movies = load_movies()
     chunked_semantic_search.load_or_create_chunk_embeddings(movies)
-    return chunked_semantic_search.search_chunks(query, limit)
+    return chunked_semantic_search.search_chunks(query, limit, nprobe, exact, pooling)
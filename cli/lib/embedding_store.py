@@ -0,0 +1,78 @@
+from lib.search_utils import normalize_embeddings
+
+import os
+import hashlib
+import numpy as np
+from numpy import ndarray
+from typing import Callable
+
+
+NORMALIZATION_CHECK_ROWS = 16
+NORMALIZATION_TOLERANCE = 1e-3
+CHUNK_METADATA_FIELDS = ["movie_idx", "chunk_idx", "total_chunks"]
+FINGERPRINT_BYTES = 8
+
+
+def save_array(path: str, array: ndarray) -> None:
+    # written beside the old file and renamed over it, so processes mapping the old file keep a consistent copy
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+def open_embeddings(path: str) -> ndarray:
+    # memory-maps the embedding matrix so search processes share the page cache instead of each reading a copy
+    # files from before embeddings were saved normalized are normalized and rewritten once
+    embeddings = np.load(path, mmap_mode="r")
+    norms = np.linalg.norm(embeddings[:NORMALIZATION_CHECK_ROWS], axis=1)
+    if embeddings.dtype != np.float32 or np.any(np.abs(norms[norms > 0] - 1) > NORMALIZATION_TOLERANCE):
+        save_array(path, normalize_embeddings(embeddings))
+        embeddings = np.load(path, mmap_mode="r")
+    return embeddings
+
+def save_chunk_metadata(path: str, movie_indices: ndarray, chunk_indices: ndarray, chunk_totals: ndarray) -> None:
+    # one int32 row per CHUNK_METADATA_FIELDS entry, one column per chunk
+    save_array(path, np.stack((movie_indices, chunk_indices, chunk_totals)).astype(np.int32))
+
+def load_chunk_metadata(path: str) -> tuple[ndarray, ndarray, ndarray]:
+    metadata = np.load(path, mmap_mode="r")
+    return metadata[0], metadata[1], metadata[2]
+
+def text_fingerprints(texts: list[str], salt: str) -> ndarray:
+    # 64-bit BLAKE2b digest of each text, keyed by whatever else decides its vector, such as the model name
+    key = hashlib.blake2b(salt.encode()).digest()
+    digests = b"".join(hashlib.blake2b(text.encode(), digest_size=FINGERPRINT_BYTES, key=key).digest() for text in texts)
+    return np.frombuffer(digests, dtype=np.uint64).copy()
+
+def load_fingerprints(path: str) -> ndarray:
+    return np.load(path) if os.path.exists(path) else np.empty(0, dtype=np.uint64)
+
+def fingerprint_rows(fingerprints: ndarray, previous_fingerprints: ndarray) -> ndarray:
+    # row of previous_fingerprints holding each fingerprint, or -1 where there is none
+    rows = np.full(len(fingerprints), -1, dtype=np.int64)
+    if len(previous_fingerprints):
+        order = np.argsort(previous_fingerprints, kind="stable")
+        positions = np.minimum(np.searchsorted(previous_fingerprints[order], fingerprints), len(order) - 1)
+        found = previous_fingerprints[order][positions] == fingerprints
+        rows[found] = order[positions[found]]
+    return rows
+
+def fill_embeddings(texts: list[str], rows: ndarray, previous_embeddings: ndarray | None, encode: Callable[[list[str]], ndarray]) -> tuple[ndarray, int]:
+    # copies previous_embeddings[row] for every text with a row and encodes the rest
+    # returns the normalized embeddings and how many rows were reused
+    found = rows >= 0
+    missing = np.flatnonzero(~found)
+    encoded = normalize_embeddings(encode([texts[i] for i in missing.tolist()])) if len(missing) else None
+    dimensions = encoded.shape[1] if encoded is not None else previous_embeddings.shape[1] if previous_embeddings is not None else 0
+    embeddings = np.empty((len(texts), dimensions), dtype=np.float32)
+    if encoded is not None:
+        embeddings[missing] = encoded
+    if found.any():
+        embeddings[np.flatnonzero(found)] = previous_embeddings[rows[found]]
+    return embeddings, int(found.sum())
+
+def reuse_embeddings(texts: list[str], fingerprints: ndarray, previous_embeddings: ndarray | None, previous_fingerprints: ndarray, encode: Callable[[list[str]], ndarray]) -> tuple[ndarray, int]:
+    # copies the vector of every text whose fingerprint is already stored and encodes only the rest
+    if previous_embeddings is None or len(previous_embeddings) != len(previous_fingerprints):
+        previous_fingerprints = np.empty(0, dtype=np.uint64)
+    return fill_embeddings(texts, fingerprint_rows(fingerprints, previous_fingerprints), previous_embeddings, encode)
@@ -1,8 +1,9 @@
-from lib.search_utils import load_movies, load_golden_dataset, RRF_K, LLM_MODEL
-from lib.hybrid_search import HybridSearch
+from lib.search_utils import load_golden_dataset, RRF_K, LLM_MODEL
+from lib.hybrid_search import get_hybrid_search
 
 import os
 import json
+import time
 from dotenv import load_dotenv
 from google import genai
 
@@ -47,14 +48,15 @@ def evaluate_results(query: str, documents: list[dict]) -> list[dict]:
 
     return results
 
-def evaluate_command(limit: int) -> dict[str, dict]:
-    movies = load_movies()
+def evaluate_command(limit: int) -> tuple[dict[str, dict], float]:
     golden_dataset = load_golden_dataset()
 
-    hybrid_search = HybridSearch(movies)
+    hybrid_search = get_hybrid_search()
+    start = time.perf_counter()
+    batch_results = hybrid_search.rrf_search_many([test_case["query"] for test_case in golden_dataset], RRF_K, limit=limit)
+    seconds = time.perf_counter() - start
     results = {}
-    for test_case in golden_dataset:
-        case_results = hybrid_search.rrf_search(test_case["query"], RRF_K, limit=limit)
+    for test_case, case_results in zip(golden_dataset, batch_results):
         case_results.sort(key=lambda x: x["rrf_score"], reverse=True)
         titles = [doc["title"] for doc in case_results]
         relevant_docs = [title for title in titles if title in test_case["relevant_docs"]]
@@ -64,5 +66,5 @@ def evaluate_command(limit: int) -> dict[str, dict]:
             "retrieved": titles,
             "relevant": relevant_docs
         }
-    return results
+    return results, len(golden_dataset) / seconds if seconds else 0.0
 
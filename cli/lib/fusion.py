@@ -0,0 +1,102 @@
+from lib.search_utils import RRF_K, ALPHA, FUSION_STRATEGIES, NORMALIZATIONS
+
+import numpy as np
+from numpy import ndarray
+
+
+def align_legs(legs: list[tuple[ndarray, ndarray]]) -> tuple[ndarray, ndarray, ndarray]:
+    # the union of the legs' doc IDs in order of first appearance, with each one's 1-based rank and score per leg
+    # rank 0 and score nan mark a leg that did not list the doc
+    ids = np.concatenate([leg_ids for leg_ids, _ in legs]) if legs else np.empty(0, dtype=np.int64)
+    unique_ids, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    positions = np.empty(len(order), dtype=np.intp)
+    positions[order] = np.arange(len(order))
+    doc_ids = unique_ids[order]
+    ranks = np.zeros((len(legs), len(doc_ids)), dtype=np.int64)
+    scores = np.full((len(legs), len(doc_ids)), np.nan)
+    offset = 0
+    for leg, (leg_ids, leg_scores) in enumerate(legs):
+        columns = positions[inverse[offset:offset + len(leg_ids)]]
+        ranks[leg, columns] = np.arange(1, len(leg_ids) + 1)
+        scores[leg, columns] = leg_scores
+        offset += len(leg_ids)
+    return doc_ids, ranks, scores
+
+
+class Fusion:
+    def __init__(self, strategy: str="rrf", normalization: str="minmax", k: int=RRF_K, alpha: float=ALPHA) -> None:
+        if strategy not in FUSION_STRATEGIES:
+            raise ValueError(f"Unknown fusion strategy: {strategy}")
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization: {normalization}")
+        self.strategy = strategy
+        self.normalization = normalization # how score-based strategies put the legs' scores on one scale; unused by rrf
+        self.k = k # rrf rank offset
+        self.weights = np.array([alpha, 1 - alpha]) if strategy == "weighted" else np.ones(2) # per leg, BM25 first
+
+    def normalize(self, scores: ndarray, reference: ndarray) -> ndarray:
+        # statistics come from reference, the leg's full candidate list, so any prefix of it normalizes the same way
+        if not len(reference):
+            return scores
+        match self.normalization:
+            case "minmax":
+                low, high = reference.min(), reference.max()
+                return np.ones_like(scores) if high == low else (scores - low) / (high - low)
+            case "zscore":
+                std = reference.std()
+                return np.zeros_like(scores) if std == 0 else (scores - reference.mean()) / std
+
+    def contributions(self, ranks: ndarray, scores: ndarray, references: list[ndarray]) -> ndarray:
+        # each leg's score for each doc on the fused scale, before weighting; 0 where the leg did not list it
+        present = ranks > 0
+        if self.strategy == "rrf":
+            contributions = np.where(present, 1 / (self.k + ranks), 0)
+        else:
+            contributions = np.stack([self.normalize(scores[leg], references[leg]) for leg in range(len(references))]) if len(references) else scores
+            contributions = np.where(present, contributions, 0)
+        return contributions
+
+    def combine(self, contributions: ndarray, hits: ndarray) -> ndarray:
+        # hits is how many legs listed each doc
+        fused = (contributions * self.weights[:len(contributions), None]).sum(axis=0)
+        return fused * hits if self.strategy == "combmnz" else fused
+
+    def fuse(self, legs: list[tuple[ndarray, ndarray]], references: list[ndarray]) -> tuple[ndarray, ndarray, ndarray, ndarray]:
+        # doc IDs, ranks, per-leg contributions and fused scores of every doc listed by any leg
+        doc_ids, ranks, scores = align_legs(legs)
+        contributions = self.contributions(ranks, scores, references)
+        return doc_ids, ranks, contributions, self.combine(contributions, (ranks > 0).sum(axis=0))
+
+    def unseen_contribution(self, leg: int, reference: ndarray, depth: int) -> float:
+        # the most the leg can add, weighted, to a doc it ranks below depth; contributions only fall with rank,
+        # and a doc outside the reference list altogether gets 0
+        if self.strategy == "rrf":
+            contribution = 1 / (self.k + depth + 1)
+        else:
+            contribution = float(self.normalize(reference[depth:depth + 1], reference)[0])
+        return max(contribution * float(self.weights[leg]), 0.0)
+
+    def is_final(self, ranks: ndarray, fused: ndarray, top: ndarray, references: list[ndarray], depth: int, limit: int) -> bool:
+        # threshold algorithm: every top doc must be scored by every leg, and the last of them must beat the best score
+        # any other doc could still reach once the legs go past depth
+        open_legs = [leg for leg, reference in enumerate(references) if len(reference) > depth]
+        if not open_legs:
+            return True
+        if len(top) < limit or (self.strategy == "combmnz" and self.normalization == "zscore"):
+            # negative z-scores make more hits worth less, so there is no useful bound
+            return False
+        unseen = np.array([self.unseen_contribution(leg, references[leg], depth) for leg in open_legs])
+        missing = ranks[open_legs] == 0
+        if missing[:, top].any():
+            return False
+        gains = (missing * unseen[:, None]).sum(axis=0)
+        upper, unseen_upper = fused + gains, unseen.sum()
+        if self.strategy == "combmnz":
+            # fused is the sum times the hits, and a missing leg adds to both
+            hits = (ranks > 0).sum(axis=0)
+            upper = (fused / hits + gains) * (hits + missing.sum(axis=0))
+            unseen_upper *= len(open_legs)
+        others = np.ones(len(fused), dtype=bool)
+        others[top] = False
+        return bool(fused[top[-1]] > max(upper[others].max(initial=-np.inf), unseen_upper))
@@ -1,71 +1,194 @@
 from lib.inverted_index import InvertedIndex
 from lib.chunked_semantic_search import ChunkedSemanticSearch
-from lib.search_utils import LIMIT_MULTIPLIER, SEARCH_MULTIPLIER, RESULT_LIMIT, load_movies
+from lib.fusion import Fusion
+from lib.result_cache import ResultCache, get_result_cache
+from lib.search_utils import LIMIT_MULTIPLIER, SEARCH_MULTIPLIER, RESULT_LIMIT, SCORE_PRECISION, CANDIDATE_DEPTH_START, CANDIDATE_DEPTH_GROWTH, HYBRID_CONCURRENT, LEG_TIMEOUT, LEG_WORKERS, load_movies, top_k_indices
 from lib.query_enhancement import enhance_query
 from lib.reranking import rerank_results
 
 import os
-from typing import Optional
+import time
+import numpy as np
+from numpy import ndarray
+from functools import cache
+from typing import Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
 
 
 class HybridSearch:
-    def __init__(self, documents: list[dict]) -> None:
+    def __init__(self, documents: list[dict], semantic_search: ChunkedSemanticSearch | None=None, idx: InvertedIndex | None=None, concurrent: bool=HYBRID_CONCURRENT, leg_timeout: float | None=LEG_TIMEOUT, result_cache: ResultCache | None=None) -> None:
+        # everything is loaded here once; queries only read the loaded state
         self.documents = documents
-        self.semantic_search = ChunkedSemanticSearch()
+        self.concurrent = concurrent # run the BM25 and semantic legs on executor threads instead of one after the other
+        self.leg_timeout = leg_timeout # seconds a query waits for its legs when concurrent; None waits for both
+        self.executor: ThreadPoolExecutor | None = None # leg threads, started with the first concurrent query
+        self.timings: dict[str, Any] = {} # bm25_ms, semantic_ms, total_ms, timed out legs and whether the last search was cached
+        self.result_cache = result_cache # rrf_search and weighted_search results by query, parameters and fingerprint; None turns caching off
+        self.semantic_search = semantic_search or ChunkedSemanticSearch()
         self.semantic_search.load_or_create_chunk_embeddings(documents)
+        self.semantic_fingerprint = self.semantic_search.fingerprint()
 
-        self.idx = InvertedIndex()
-        if not os.path.exists(self.idx.index_path):
-            self.idx.build()
+        self.idx = idx or InvertedIndex()
+        if not os.path.exists(self.idx.manifest_path):
+            self.idx.build(documents)
             self.idx.save()
-        
+        self.index_version: int | None = None # manifest modification time of the loaded index
+        self.__refresh_index()
+
+    def __refresh_index(self) -> InvertedIndex:
+        # one stat per query; the segments are reopened only when the manifest was rewritten, e.g. by a build in another process
+        # a reload swaps in a new index instead of loading over the old one, so legs still reading the old segments,
+        # including ones past their timeout, keep a consistent snapshot; returns the index the query should read
+        version = os.stat(self.idx.manifest_path).st_mtime_ns
+        if version != self.index_version:
+            idx = InvertedIndex()
+            idx.manifest_path = self.idx.manifest_path
+            idx.load()
+            self.idx, self.index_version = idx, version
+        return self.idx
+
+    def fingerprint(self) -> str:
+        # changes whenever the index is rebuilt or updated, so cached results of the old index stop matching
+        self.__refresh_index()
+        return f"{self.index_version}:{self.semantic_fingerprint}"
+
     def _bm25_search(self, query: str, limit: int) -> list[dict]:
-        self.idx.load()
-        return self.idx.bm25_search(query, limit)
+        return self.__refresh_index().bm25_search(query, limit)
     
-    def weighted_search(self, query: str, alpha: float, limit: int) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * LIMIT_MULTIPLIER)
-        semantic_results = self.semantic_search.search_chunks(query, limit * LIMIT_MULTIPLIER)
-        bm25_normalized = normalize_results(bm25_results)
-        semantic_normalized = normalize_results(semantic_results)
-        document_scores = combine_scores(bm25_normalized, semantic_normalized, alpha)
-        sorted_docs = sorted(document_scores.items(), key=lambda x: x[1]["hybrid_score"], reverse=True)
-        
+    def __run_legs(self, bm25_leg: Callable[[], Any], semantic_leg: Callable[[], Any], empty: Any) -> tuple[Any, Any]:
+        # returns both legs' results, with empty standing in for a leg that missed leg_timeout, and adds to timings
+        # a leg past its timeout cannot be interrupted; it finishes on its thread and its results are dropped
+        # its executor is then retired, so later legs start on fresh threads instead of queueing behind it
+        def timed(leg: Callable[[], Any]) -> tuple[Any, float]:
+            start = time.perf_counter()
+            return leg(), (time.perf_counter() - start) * 1000
+
+        if not self.concurrent:
+            (bm25_results, bm25_ms), (semantic_results, semantic_ms) = timed(bm25_leg), timed(semantic_leg)
+            self.timings["bm25_ms"] += bm25_ms
+            self.timings["semantic_ms"] += semantic_ms
+            return bm25_results, semantic_results
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=LEG_WORKERS, thread_name_prefix="hybrid-leg")
+        futures = {"bm25": self.executor.submit(timed, bm25_leg), "semantic": self.executor.submit(timed, semantic_leg)}
+        wait(futures.values(), timeout=self.leg_timeout)
         results = []
-        for id, doc in sorted_docs[:limit]:
-            results.append(
-                {
-                    "id": id,
-                    "title": doc["title"],
-                    "document": doc["document"],
-                    "bm25_score": doc["bm25_score"],
-                    "semantic_score": doc["semantic_score"],
-                    "hybrid_score": doc["hybrid_score"]
-                }
-            )
+        for leg, future in futures.items():
+            if future.done():
+                leg_results, ms = future.result()
+                self.timings[f"{leg}_ms"] += ms
+            else:
+                leg_results = empty
+                self.timings[f"{leg}_ms"] += self.leg_timeout * 1000
+                self.timings["timed_out"].append(leg)
+            results.append(leg_results)
+        if self.timings["timed_out"]:
+            self.close()
+        return results[0], results[1]
+
+    def __start_timings(self) -> float:
+        self.timings = {"bm25_ms": 0.0, "semantic_ms": 0.0, "total_ms": 0.0, "timed_out": [], "cached": False}
+        return time.perf_counter()
+
+    def __finish_timings(self, start: float) -> None:
+        self.timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def candidate_depths(self, limit: int) -> list[int]:
+        # candidates fetched per leg in each round, growing up to the old fixed fan-out of limit * LIMIT_MULTIPLIER
+        max_depth = limit * LIMIT_MULTIPLIER
+        depths, depth = [], max(limit * CANDIDATE_DEPTH_START, 1)
+        while depth < max_depth:
+            depths.append(depth)
+            depth *= CANDIDATE_DEPTH_GROWTH
+        return depths + [max_depth]
+
+    def fused_search(self, query: str, fusion: Fusion, limit: int=RESULT_LIMIT, count: int | None=None, adaptive: bool=True) -> list[dict]:
+        return self.fused_search_many([query], fusion, limit, count, adaptive)[0]
+
+    def fused_search_many(self, queries: list[str], fusion: Fusion, limit: int=RESULT_LIMIT, count: int | None=None, adaptive: bool=True) -> list[list[dict]]:
+        # each leg ranks limit * LIMIT_MULTIPLIER candidates per query once, as arrays of doc IDs and scores
+        # rounds fuse growing prefixes of those rankings until fusion.is_final shows the top count cannot change,
+        # and only those count documents are looked up and formatted
+        # a leg that times out counts as empty, so the other leg's results come back alone
+        start = self.__start_timings()
+        idx = self.__refresh_index()
+        count = count or limit
+        max_depth = limit * LIMIT_MULTIPLIER
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        bm25_rankings, semantic_rankings = self.__run_legs(
+            lambda: [idx.bm25_ranking(query, max_depth) for query in queries],
+            lambda: self.semantic_search.rank_chunks_many(queries, max_depth),
+            [empty for _ in queries]
+        )
+        depths = self.candidate_depths(limit) if adaptive else [max_depth]
+        results = []
+        for rankings in zip(bm25_rankings, semantic_rankings):
+            references = [scores for _, scores in rankings]
+            for depth in depths:
+                doc_ids, ranks, contributions, fused = fusion.fuse([(ids[:depth], scores[:depth]) for ids, scores in rankings], references)
+                top = top_k_indices(fused, count)
+                if fusion.is_final(ranks, fused, top, references, depth, count):
+                    break
+            results.append(self.__fused_results(idx, fusion, doc_ids[top], ranks[:, top], contributions[:, top], fused[top]))
+        self.__finish_timings(start)
         return results
-    
-    def rrf_search(self, query:str, k: int, rerank_method: Optional[str]=None, limit: int=RESULT_LIMIT) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * LIMIT_MULTIPLIER)
-        semantic_results = self.semantic_search.search_chunks(query, limit * LIMIT_MULTIPLIER)
-        document_ranks = combine_rrf(bm25_results, semantic_results, k)
-        sorted_docs = sorted(document_ranks.items(), key=lambda x: x[1]["rrf_score"], reverse=True)
-        search_limit = limit * SEARCH_MULTIPLIER if rerank_method else limit
 
+    def __fused_results(self, idx: InvertedIndex, fusion: Fusion, doc_ids: ndarray, ranks: ndarray, contributions: ndarray, fused: ndarray) -> list[dict]:
+        # rrf results carry the legs' ranks; score-based ones also carry the legs' normalized scores, 0 where unlisted
         results = []
-        for id, doc in sorted_docs[:search_limit]:
-            results.append(
-                {
-                    "id": id,
-                    "title": doc["title"],
-                    "document": doc["document"],
-                    "bm25_rank": doc["bm25_rank"],
-                    "semantic_rank": doc["semantic_rank"],
-                    "rrf_score": doc["rrf_score"]
-                }
-            )
+        for i, doc_id in enumerate(doc_ids.tolist()):
+            document = self.semantic_search.docmap.get(doc_id) or idx.docmap[doc_id]
+            result = {
+                "id": doc_id,
+                "title": document["title"],
+                "document": document["description"],
+                "bm25_rank": int(ranks[0, i]) or None,
+                "semantic_rank": int(ranks[1, i]) or None
+            }
+            if fusion.strategy == "rrf":
+                result["rrf_score"] = float(fused[i])
+            else:
+                result["bm25_score"] = round(float(contributions[0, i]), SCORE_PRECISION)
+                result["semantic_score"] = round(float(contributions[1, i]), SCORE_PRECISION)
+                result["hybrid_score"] = float(fused[i])
+            results.append(result)
         return results
-    
+
+    def cached_search(self, kind: str, query: str, params: dict[str, Any], search: Callable[[], Any]) -> Any:
+        # search's value from result_cache when this index already answered kind, query and params, otherwise computed and cached
+        # results with a timed out leg are partial, so they are returned but not cached
+        if self.result_cache is None:
+            return search()
+        start = time.perf_counter()
+        key = self.result_cache.key(kind, query, self.fingerprint(), params)
+        results = self.result_cache.get(key)
+        if results is not None:
+            self.__start_timings()
+            self.timings["cached"] = True
+            self.__finish_timings(start)
+            return results
+        results = search()
+        if not self.timings["timed_out"]:
+            self.result_cache.put(key, results)
+        return results
+
+    def weighted_search(self, query: str, alpha: float, limit: int) -> list[dict]:
+        return self.cached_search("weighted", query, {"alpha": alpha, "limit": limit}, lambda: self.fused_search(query, Fusion("weighted", alpha=alpha), limit))
+
+    def rrf_search(self, query:str, k: int, rerank_method: Optional[str]=None, limit: int=RESULT_LIMIT) -> list[dict]:
+        return self.cached_search("rrf", query, {"k": k, "rerank_method": rerank_method, "limit": limit}, lambda: self.rrf_search_many([query], k, rerank_method, limit)[0])
+
+    def rrf_search_many(self, queries: list[str], k: int, rerank_method: Optional[str]=None, limit: int=RESULT_LIMIT) -> list[list[dict]]:
+        # reranking picks from limit * SEARCH_MULTIPLIER fused results
+        search_limit = limit * SEARCH_MULTIPLIER if rerank_method else limit
+        return self.fused_search_many(queries, Fusion("rrf", k=k), limit, search_limit)
+
 
 def normalize_command(scores: list[float]) -> list[float]:
     if not scores:
@@ -77,96 +200,52 @@ def normalize_command(scores: list[float]) -> list[float]:
         normalized_scores = [(score - min_score) / (max_score - min_score) for score in scores]
     return normalized_scores
 
-def normalize_results(results: list[dict]) -> list[dict]:
-    scores = [result["score"] for result in results]
-    normalized_scores = normalize_command(scores)
-    for i, result in enumerate(results):
-        result["score"] = normalized_scores[i]
-    return results
-
-def combine_scores(bm25_results: list[dict], semantic_results: list[dict], alpha: float) -> dict[int, dict]:
-    document_scores = {}
-    for result in bm25_results:
-            doc_id = result["id"]
-            document_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "bm25_score": result["score"],
-                "semantic_score": 0,
-                "hybrid_score": 0
-            }
-        
-    for result in semantic_results:
-        doc_id = result["id"]
-        if doc_id not in document_scores:
-                document_scores[doc_id] = {
-                "title": result["title"],
-                "document": result["document"],
-                "bm25_score": 0,
-                "semantic_score": result["score"],
-                "hybrid_score": 0
-            }
-        else:
-            doc = document_scores[doc_id]
-            doc["semantic_score"] = result["score"]
-            doc["hybrid_score"] = (alpha * doc["bm25_score"]) + ((1 - alpha) * doc["semantic_score"])
-
-    return document_scores
-
-def combine_rrf(bm25_results: list[dict], semantic_results: list[dict], k: int) -> dict[int, dict]:
-    document_ranks = {}
-
-    for i, doc in enumerate(bm25_results, 1):
-        doc_id = doc["id"]
-        document_ranks[doc_id] = {
-            "id": doc_id,
-            "title": doc["title"],
-            "document": doc["document"],
-            "bm25_rank": i,
-            "semantic_rank": None,
-            "rrf_score": 0
-        }
-    
-    for i, doc in enumerate(semantic_results, 1):
-        doc_id = doc["id"]
-        if doc_id not in document_ranks:
-            document_ranks[doc_id] = {
-                "id": doc_id,
-                "title": doc["title"],
-                "document": doc["document"],
-                "bm25_rank": None,
-                "semantic_rank": i,
-                "rrf_score": 0
-            }
-        else:
-            document_ranks[doc_id]["semantic_rank"] = i
-            bm25_rrf = 1 / (k + document_ranks[doc_id]["bm25_rank"])
-            semantic_rrf = 1 / (k + i)
-            document_ranks[doc_id]["rrf_score"] = bm25_rrf + semantic_rrf
-    
-    return document_ranks
-
+@cache
+def get_hybrid_search() -> HybridSearch:
+    # one engine per process over the movie dataset, shared by every command that searches it
+    return HybridSearch(load_movies(), result_cache=get_result_cache())
 
-def weighted_command(query: str, alpha: float, limit: int) -> list[dict]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-    return hybrid_search.weighted_search(query, alpha, limit)
-
-def rrf_command(query: str, k: int, enhance: Optional[str], rerank_method: Optional[str], limit: int) -> list[dict]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-    
-    enhanced_query = None
-    if enhance:
-        enhanced_query = enhance_query(query, method=enhance)
+def weighted_command(query: str, alpha: float, limit: int, concurrent: bool=HYBRID_CONCURRENT, leg_timeout: float | None=LEG_TIMEOUT) -> dict[str, Any]:
+    hybrid_search = get_hybrid_search()
+    hybrid_search.concurrent, hybrid_search.leg_timeout = concurrent, leg_timeout
+    results = hybrid_search.weighted_search(query, alpha, limit)
+    return {
+        "results": results,
+        "timings": hybrid_search.timings
+    }
+
+def fusion_command(query: str, strategy: str, normalization: str, k: int, alpha: float, limit: int, concurrent: bool=HYBRID_CONCURRENT, leg_timeout: float | None=LEG_TIMEOUT) -> dict[str, Any]:
+    hybrid_search = get_hybrid_search()
+    hybrid_search.concurrent, hybrid_search.leg_timeout = concurrent, leg_timeout
+    params = {"strategy": strategy, "normalization": normalization, "k": k, "alpha": alpha, "limit": limit}
+    results = hybrid_search.cached_search("fusion", query, params, lambda: hybrid_search.fused_search(query, Fusion(strategy, normalization, k, alpha), limit))
+    return {
+        "results": results,
+        "timings": hybrid_search.timings
+    }
 
-    results = hybrid_search.rrf_search(query, k, rerank_method, limit)
-    results.sort(key=lambda x: x["rrf_score"], reverse=True)
+def rrf_command(query: str, k: int, enhance: Optional[str], rerank_method: Optional[str], limit: int, concurrent: bool=HYBRID_CONCURRENT, leg_timeout: float | None=LEG_TIMEOUT) -> dict[str, Any]:
+    hybrid_search = get_hybrid_search()
+    hybrid_search.concurrent, hybrid_search.leg_timeout = concurrent, leg_timeout
     
-    reranked_results = rerank_results(query, rerank_method, results)
+    def search() -> dict[str, Any]:
+        enhanced_query = None
+        if enhance:
+            enhanced_query = enhance_query(query, method=enhance)
+
+        results = hybrid_search.rrf_search(query, k, rerank_method, limit)
+        results.sort(key=lambda x: x["rrf_score"], reverse=True)
+
+        reranked_results = rerank_results(query, rerank_method, results)
+        return {
+            "enhanced_query": enhanced_query,
+            "original_results": results,
+            "reranked_results": reranked_results[:limit]
+        }
 
+    # the query enhancement and LLM reranking calls are cached along with the results
+    response = hybrid_search.cached_search("rrf_command", query, {"k": k, "enhance": enhance, "rerank_method": rerank_method, "limit": limit}, search)
     return {
-        "enhanced_query": enhanced_query,
-        "original_results": results,
-        "reranked_results": reranked_results[:limit]
+        **response,
+        "timings": hybrid_search.timings
     }
\ No newline at end of file
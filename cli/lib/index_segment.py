@@ -0,0 +1,298 @@
+from lib.search_utils import SEGMENT_ALIGNMENT
+from lib.posting_blocks import encode_postings, decode_blocks
+
+import os
+import json
+import mmap
+import numpy as np
+from numpy import ndarray
+from collections.abc import Mapping, Iterator
+
+
+SEGMENT_MAGIC = b"RSEGMENT"
+SEGMENT_VERSION = 4
+HEADER_LENGTH_BYTES = 8
+
+
+class IndexSegment:
+    def __init__(self, sections: dict[str, ndarray]) -> None:
+        self.sections = sections # mapping section names to arrays, possibly views over an mmap
+        self.buffer: mmap.mmap | None = None # backing memory map when opened from disk
+        self.path: str | None = None # file the segment was opened from or saved to
+        self.documents: Mapping[int, dict] | None = None # mapping document IDs to documents until they are saved
+        self.term_bytes = sections["term_bytes"] # UTF-8 terms in sorted order, concatenated
+        self.term_offsets = sections["term_offsets"] # start of each term in term_bytes, plus the end
+        self.posting_offsets = sections["posting_offsets"] # start of each term's postings, plus the end
+        self.block_offsets = sections["block_offsets"] # first posting block of each term, plus the end
+        self.block_last = sections["block_last"] # last ordinal in each posting block, for skipping whole blocks
+        self.row_offsets = sections["row_offsets"] # start of each document's terms, plus the end (CSR indptr)
+        self.row_term_ids = sections["row_term_ids"] # sorted term IDs per document (CSR indices)
+        self.row_frequencies = sections["row_frequencies"] # term frequency per document term (CSR data)
+        self.doc_lengths = sections["doc_lengths"] # token length per document ordinal
+        self.doc_ids = sections["doc_ids"] # document ID per document ordinal
+        self.sorted_doc_ids = sections["sorted_doc_ids"] # document IDs in ascending order
+        self.sorted_doc_ordinals = sections["sorted_doc_ordinals"] # ordinal of each entry in sorted_doc_ids
+        self.deleted_ids = sections["deleted_ids"] # document IDs this segment deletes from older segments
+        self.doc_bytes = sections.get("doc_bytes") # JSON documents, concatenated
+        self.doc_offsets = sections.get("doc_offsets") # start of each document in doc_bytes, plus the end
+
+    @classmethod
+    def from_postings(
+        cls,
+        terms: list[str],
+        posting_offsets: ndarray,
+        posting_ordinals: ndarray,
+        posting_frequencies: ndarray,
+        doc_lengths: ndarray,
+        doc_ids: ndarray,
+        documents: Mapping[int, dict],
+        deleted_ids: ndarray | None=None
+    ) -> "IndexSegment":
+        encoded_terms = [term.encode() for term in terms]
+        posting_offsets = np.asarray(posting_offsets, dtype=np.int64)
+        posting_ordinals = np.asarray(posting_ordinals, dtype=np.int32)
+        posting_frequencies = np.asarray(posting_frequencies, dtype=np.int32)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+
+        # the postings are the CSC layout of the document-term matrix; transpose them into CSR
+        posting_term_ids = np.repeat(np.arange(len(terms), dtype=np.int32), np.diff(posting_offsets))
+        row_order = np.lexsort((posting_term_ids, posting_ordinals))
+        row_lengths = np.bincount(posting_ordinals, minlength=len(doc_ids))
+
+        sorted_doc_ordinals = np.argsort(doc_ids, kind="stable").astype(np.int32)
+        segment = cls(
+            {
+                "term_bytes": np.frombuffer(b"".join(encoded_terms), dtype=np.uint8),
+                "term_offsets": np.concatenate(([0], np.cumsum([len(term) for term in encoded_terms]))).astype(np.int64),
+                "posting_offsets": posting_offsets,
+                **encode_postings(posting_offsets, posting_ordinals, posting_frequencies),
+                "row_offsets": np.concatenate(([0], np.cumsum(row_lengths))).astype(np.int64),
+                "row_term_ids": posting_term_ids[row_order],
+                "row_frequencies": posting_frequencies[row_order],
+                "doc_lengths": np.asarray(doc_lengths, dtype=np.int32),
+                "doc_ids": doc_ids,
+                "sorted_doc_ids": doc_ids[sorted_doc_ordinals],
+                "sorted_doc_ordinals": sorted_doc_ordinals,
+                "deleted_ids": np.asarray(deleted_ids if deleted_ids is not None else [], dtype=np.int64)
+            }
+        )
+        segment.documents = documents
+        return segment
+
+    @classmethod
+    def from_index(
+        cls,
+        index: dict[str, set],
+        term_frequencies: dict[int, dict],
+        doc_lengths: dict[int, int],
+        documents: Mapping[int, dict],
+        deleted_ids: list[int] | None=None
+    ) -> "IndexSegment":
+        doc_ids = list(documents)
+        ordinals = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        terms = sorted(index) # code point order is also UTF-8 byte order
+        posting_offsets, posting_ordinals, posting_frequencies = [0], [], []
+        for term in terms:
+            term_ordinals = sorted(ordinals[doc_id] for doc_id in index[term])
+            posting_ordinals.extend(term_ordinals)
+            posting_frequencies.extend(term_frequencies[doc_ids[ordinal]][term] for ordinal in term_ordinals)
+            posting_offsets.append(len(posting_ordinals))
+        return cls.from_postings(
+            terms,
+            posting_offsets,
+            posting_ordinals,
+            posting_frequencies,
+            [doc_lengths.get(doc_id, 0) for doc_id in doc_ids],
+            doc_ids,
+            documents,
+            deleted_ids
+        )
+
+    @classmethod
+    def merge(cls, segments: list["IndexSegment"], live_masks: list[ndarray | None], deleted_ids: ndarray) -> "IndexSegment":
+        # rewrites the live documents of adjacent segments, oldest first, as one segment without re-tokenizing
+        segment_terms = [segment.terms() for segment in segments]
+        vocabulary = sorted(set().union(*segment_terms))
+        term_lookup = {term: i for i, term in enumerate(vocabulary)}
+        ordinals, term_ids, frequencies, doc_lengths, doc_ids, documents = [], [], [], [], [], {}
+        base = 0
+        for segment, terms, live in zip(segments, segment_terms, live_masks):
+            live_ordinals = np.flatnonzero(live) if live is not None else np.arange(segment.doc_count)
+            merged_ordinals = np.full(segment.doc_count, -1, dtype=np.int64)
+            merged_ordinals[live_ordinals] = base + np.arange(len(live_ordinals))
+            merged_term_ids = np.array([term_lookup[term] for term in terms], dtype=np.int64)
+            segment_ordinals, segment_frequencies = segment.block_postings(0, len(segment.block_last))
+            posting_ordinals = merged_ordinals[segment_ordinals]
+            posting_term_ids = np.repeat(merged_term_ids, np.diff(segment.posting_offsets))
+            keep = posting_ordinals >= 0
+            ordinals.append(posting_ordinals[keep])
+            term_ids.append(posting_term_ids[keep])
+            frequencies.append(segment_frequencies[keep])
+            doc_lengths.append(segment.doc_lengths[live_ordinals])
+            doc_ids.append(segment.doc_ids[live_ordinals])
+            for ordinal in live_ordinals.tolist():
+                documents[int(segment.doc_ids[ordinal])] = segment.document(ordinal)
+            base += len(live_ordinals)
+
+        ordinals, term_ids, frequencies = np.concatenate(ordinals), np.concatenate(term_ids), np.concatenate(frequencies)
+        order = np.lexsort((ordinals, term_ids))
+        term_counts = np.bincount(term_ids, minlength=len(vocabulary))
+        return cls.from_postings(
+            vocabulary,
+            np.concatenate(([0], np.cumsum(term_counts))),
+            ordinals[order],
+            frequencies[order],
+            np.concatenate(doc_lengths),
+            np.concatenate(doc_ids),
+            documents,
+            deleted_ids
+        )
+
+    @classmethod
+    def open(cls, path: str) -> "IndexSegment":
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"Not an index segment: {path}")
+        header_start = len(SEGMENT_MAGIC) + HEADER_LENGTH_BYTES
+        header_length = int.from_bytes(buffer[len(SEGMENT_MAGIC):header_start], "little")
+        header = json.loads(buffer[header_start:header_start + header_length])
+        if header["version"] != SEGMENT_VERSION:
+            raise ValueError(f"Unsupported index segment version {header["version"]}, rebuild the index: {path}")
+        data_start = align(header_start + header_length)
+        sections = {
+            name: np.frombuffer(buffer, dtype=section["dtype"], count=section["count"], offset=data_start + section["offset"])
+            for name, section in header["sections"].items()
+        }
+        segment = cls(sections)
+        segment.buffer = buffer
+        segment.path = path
+        return segment
+
+    def save(self, path: str) -> None:
+        sections = dict(self.sections)
+        if self.doc_bytes is None:
+            encoded_docs = [json.dumps(self.documents[doc_id]).encode() for doc_id in self.doc_ids.tolist()]
+            sections["doc_bytes"] = np.frombuffer(b"".join(encoded_docs), dtype=np.uint8)
+            sections["doc_offsets"] = np.concatenate(([0], np.cumsum([len(doc) for doc in encoded_docs]))).astype(np.int64)
+
+        # section offsets are relative to the first aligned byte after the header
+        header = {"version": SEGMENT_VERSION, "sections": {}}
+        offset = 0
+        for name, array in sections.items():
+            header["sections"][name] = {"dtype": array.dtype.str, "count": len(array), "offset": offset}
+            offset = align(offset + array.nbytes)
+        encoded_header = json.dumps(header).encode()
+        data_start = align(len(SEGMENT_MAGIC) + HEADER_LENGTH_BYTES + len(encoded_header))
+
+        # written beside the final path and renamed into place, so a crash never leaves a partial segment under that name
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(SEGMENT_MAGIC)
+            f.write(len(encoded_header).to_bytes(HEADER_LENGTH_BYTES, "little"))
+            f.write(encoded_header)
+            for name, array in sections.items():
+                f.write(b"\0" * (data_start + header["sections"][name]["offset"] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.write(b"\0" * (data_start + offset - f.tell()))
+        os.replace(temp_path, path)
+        self.path = path
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def term_count(self) -> int:
+        return len(self.term_offsets) - 1
+
+    def term(self, term_id: int) -> str:
+        return self.term_bytes[self.term_offsets[term_id]:self.term_offsets[term_id + 1]].tobytes().decode()
+
+    def terms(self) -> list[str]:
+        term_bytes = self.term_bytes.tobytes()
+        offsets = self.term_offsets.tolist()
+        return [term_bytes[start:end].decode() for start, end in zip(offsets, offsets[1:])]
+
+    def term_id(self, term: str) -> int:
+        encoded = term.encode()
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            candidate = self.term_bytes[self.term_offsets[mid]:self.term_offsets[mid + 1]].tobytes()
+            if candidate < encoded:
+                low = mid + 1
+            elif candidate > encoded:
+                high = mid
+            else:
+                return mid
+        return -1
+
+    def doc_frequencies(self) -> ndarray:
+        return np.diff(self.posting_offsets)
+
+    def postings(self, term_id: int, min_ordinal: int=0) -> tuple[ndarray, ndarray]:
+        # decodes the term's blocks, skipping those that end before min_ordinal
+        start, end = int(self.block_offsets[term_id]), int(self.block_offsets[term_id + 1])
+        start += int(np.searchsorted(self.block_last[start:end], min_ordinal))
+        ordinals, frequencies = self.block_postings(start, end)
+        if len(ordinals) and ordinals[0] < min_ordinal:
+            keep = ordinals >= min_ordinal
+            return ordinals[keep], frequencies[keep]
+        return ordinals, frequencies
+
+    def block_postings(self, start: int, end: int) -> tuple[ndarray, ndarray]:
+        return decode_blocks(self.sections, start, end)
+
+    def term_frequency(self, ordinal: int, term_id: int) -> int:
+        start, end = self.row_offsets[ordinal], self.row_offsets[ordinal + 1]
+        i = start + int(np.searchsorted(self.row_term_ids[start:end], term_id))
+        return int(self.row_frequencies[i]) if i < end and self.row_term_ids[i] == term_id else 0
+
+    def ordinal(self, doc_id: int) -> int:
+        i = int(np.searchsorted(self.sorted_doc_ids, doc_id))
+        if i < self.doc_count and self.sorted_doc_ids[i] == doc_id:
+            return int(self.sorted_doc_ordinals[i])
+        return -1
+
+    def document(self, ordinal: int) -> dict:
+        if self.doc_bytes is None:
+            return self.documents[int(self.doc_ids[ordinal])]
+        return json.loads(self.doc_bytes[self.doc_offsets[ordinal]:self.doc_offsets[ordinal + 1]].tobytes())
+
+
+class StoredDocuments(Mapping):
+    # live documents across segments: a newer segment's copy or tombstone hides older copies
+    def __init__(self, segments: list[IndexSegment], live_masks: list[ndarray | None]) -> None:
+        self.segments = segments
+        self.live_masks = live_masks
+
+    def locate(self, doc_id: int) -> tuple[int, int] | None:
+        for i in reversed(range(len(self.segments))):
+            ordinal = self.segments[i].ordinal(doc_id)
+            if ordinal >= 0:
+                live = self.live_masks[i]
+                return (i, ordinal) if live is None or live[ordinal] else None
+        return None
+
+    def __getitem__(self, doc_id: int) -> dict:
+        location = self.locate(doc_id)
+        if location is None:
+            raise KeyError(doc_id)
+        segment, ordinal = location
+        return self.segments[segment].document(ordinal)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return isinstance(doc_id, int) and self.locate(doc_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for segment, live in zip(self.segments, self.live_masks):
+            doc_ids = segment.doc_ids if live is None else segment.doc_ids[live]
+            yield from doc_ids.tolist()
+
+    def __len__(self) -> int:
+        return sum(segment.doc_count if live is None else int(live.sum()) for segment, live in zip(self.segments, self.live_masks))
+
+
+def align(offset: int) -> int:
+    return -(-offset // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT
@@ -1,86 +1,161 @@
-from lib.search_utils import load_movies, tokenize_text, CACHE, BM25_K1, BM25_B, SCORE_PRECISION
+from lib.search_utils import Analyzer, load_movies, get_analyzer, top_k_indices, CACHE, BM25_K1, BM25_B, SCORE_PRECISION, PRUNING_TOLERANCE, BUILD_SHARDS_PER_WORKER, MERGE_FACTOR
+from lib.index_segment import IndexSegment, StoredDocuments
+from lib.boolean_query import parse_query, keyword_query, TermCursor, AllCursor, AndCursor, OrCursor, DifferenceCursor
 
 import os
+import json
 import pickle
 import math
+import numpy as np
+from numpy import ndarray
+from heapq import heappush, heapreplace
+from bisect import bisect_left
+from itertools import islice
 from collections import defaultdict, Counter
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
 
 
 class InvertedIndex:
     def __init__(self) -> None:
-        self.index: defaultdict[str, set] = defaultdict(set) # mapping tokens to sets of document IDs 
-        self.docmap: dict[int, dict] = {} # mapping document IDs to document objects
-        self.term_frequencies: defaultdict[int, Counter] = defaultdict(Counter) # mapping document IDs to token counter
-        self.doc_lengths: dict[int, int] = {} # mapping document IDs to token length
+        self.segments: list[IndexSegment] = [] # index segments, oldest first; newer copies and tombstones hide older documents
+        self.live_masks: list[ndarray | None] = [] # live documents per segment, None when every document is live
+        self.docmap: Mapping[int, dict] = {} # mapping live document IDs to document objects
+        self.segment_bases: ndarray = np.zeros(1, dtype=np.int64) # first global ordinal of each segment, plus the end
+        self.doc_ids: ndarray = np.empty(0, dtype=np.int64) # document ID per global ordinal
+        self.doc_lengths: ndarray = np.empty(0, dtype=np.int32) # token length per global ordinal
+        self.live: ndarray | None = None # live flag per global ordinal, None when every document is live
+        self.doc_count: int = 0 # number of live documents
+        self.avg_doc_length: float = 0 # average token length of live documents, precomputed at build/load time
+        self.postings_cache: dict[str, tuple[list[int], list[float], float]] = {} # mapping tokens to sorted ordinals, BM25 scores and max score
+        self.generation: int = 0 # last segment file number handed out
+        self.manifest_path = os.path.join(CACHE, "index_manifest.json")
         self.index_path = os.path.join(CACHE, "index.pkl")
         self.docmap_path = os.path.join(CACHE, "docmap.pkl")
         self.term_frequencies_path = os.path.join(CACHE, "term_frequencies.pkl")
         self.doc_lengths_path = os.path.join(CACHE, "doc_lengths.pkl")
+        self.analyzer: Analyzer = get_analyzer()
 
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokenized_text = tokenize_text(text)
-        for token in set(tokenized_text):
-            self.index[token].add(doc_id)
-        self.term_frequencies[doc_id].update(tokenized_text)
-        self.doc_lengths[doc_id] = len(tokenized_text)
+    def __compute_statistics(self) -> None:
+        # walks the segments newest first so each one sees the documents and tombstones written after it
+        live_masks, hidden = [], np.empty(0, dtype=np.int64)
+        for segment in reversed(self.segments):
+            live = ~np.isin(segment.doc_ids, hidden) if len(hidden) else None
+            live_masks.append(None if live is None or live.all() else live)
+            hidden = np.concatenate((hidden, segment.doc_ids, segment.deleted_ids))
+        self.live_masks = live_masks[::-1]
+        self.docmap = StoredDocuments(self.segments, self.live_masks)
+        self.segment_bases = np.concatenate(([0], np.cumsum([segment.doc_count for segment in self.segments]))).astype(np.int64)
+        self.doc_ids = np.concatenate([segment.doc_ids for segment in self.segments]) if self.segments else np.empty(0, dtype=np.int64)
+        self.doc_lengths = np.concatenate([segment.doc_lengths for segment in self.segments]) if self.segments else np.empty(0, dtype=np.int32)
+        if any(live is not None for live in self.live_masks):
+            self.live = np.concatenate([live if live is not None else np.ones(segment.doc_count, dtype=bool) for segment, live in zip(self.segments, self.live_masks)])
+        else:
+            self.live = None
+        live_lengths = self.doc_lengths if self.live is None else self.doc_lengths[self.live]
+        self.doc_count = len(live_lengths)
+        self.avg_doc_length = int(live_lengths.sum()) / self.doc_count if self.doc_count else 0
+        self.postings_cache = {}
 
-    def __get_avg_doc_length(self) -> float:
-        if not self.doc_lengths or len(self.doc_lengths) == 0:
-            return 0
-        total = 0
-        for length in self.doc_lengths.values():
-            total += length
-        return total / len(self.doc_lengths)
+    def __analyze_term(self, term: str) -> str:
+        token = self.analyzer.analyze(term)
+        if len(token) != 1:
+            raise ValueError("Term must be a single token")
+        return token[0]
+
+    def __postings(self, token: str) -> tuple[ndarray, ndarray]:
+        # live global ordinals and term frequencies of one term, gathered across segments in ordinal order
+        ordinals, frequencies = [], []
+        for i, segment in enumerate(self.segments):
+            term_id = segment.term_id(token)
+            if term_id < 0:
+                continue
+            segment_ordinals, segment_frequencies = segment.postings(term_id)
+            live = self.live_masks[i]
+            if live is not None:
+                keep = live[segment_ordinals]
+                segment_ordinals, segment_frequencies = segment_ordinals[keep], segment_frequencies[keep]
+            ordinals.append(segment_ordinals + self.segment_bases[i])
+            frequencies.append(segment_frequencies)
+        if not ordinals:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(ordinals), np.concatenate(frequencies)
+
+    def __posting_scores(self, token: str) -> tuple[ndarray, ndarray]:
+        # one column of the document-term matrix, scored with vectorized BM25
+        ordinals, frequencies = self.__postings(token)
+        idf = bm25_idf(self.doc_count, len(ordinals))
+        return ordinals, bm25_tf(frequencies, self.doc_lengths[ordinals], self.avg_doc_length) * idf
+
+    def __get_postings(self, token: str) -> tuple[list[int], list[float], float] | None:
+        if token in self.postings_cache:
+            return self.postings_cache[token]
+        ordinals, scores = self.__posting_scores(token)
+        if not len(ordinals):
+            return None
+        self.postings_cache[token] = (ordinals.tolist(), scores.tolist(), float(scores.max()))
+        return self.postings_cache[token]
+
+    def __score_tokens(self, tokens: list[str]) -> ndarray:
+        ordinals, scores = [], []
+        for token in tokens:
+            term_ordinals, term_scores = self.__posting_scores(token)
+            ordinals.append(term_ordinals)
+            scores.append(term_scores)
+        # bincount adds the gathered columns per document in query token order
+        # it returns integers when no token has postings, and those cannot hold the -inf of deleted documents
+        total = len(self.doc_ids)
+        if ordinals:
+            bm25_scores = np.bincount(np.concatenate(ordinals), weights=np.concatenate(scores), minlength=total).astype(np.float64, copy=False)
+        else:
+            bm25_scores = np.zeros(total)
+        if self.live is not None:
+            bm25_scores[~self.live] = -np.inf
+        return bm25_scores
+
+    def __document(self, ordinal: int) -> dict:
+        i = int(np.searchsorted(self.segment_bases, ordinal, side="right")) - 1
+        return self.segments[i].document(ordinal - int(self.segment_bases[i]))
 
     def get_documents(self, term: str) -> list[int]:
-        doc_ids = self.index.get(term, set())
-        return sorted(list(doc_ids))
+        ordinals, _ = self.__postings(term)
+        return sorted(self.doc_ids[ordinals].tolist())
     
     def get_tf(self, doc_id: int, term: str) -> int:
-        token = tokenize_text(term)
-        if len(token) != 1:
-            raise ValueError("Term must be a single token")
-        counter = self.term_frequencies.get(doc_id, Counter())
-        return counter[token[0]]
+        token = self.__analyze_term(term)
+        location = self.docmap.locate(doc_id)
+        if location is None:
+            return 0
+        segment, ordinal = self.segments[location[0]], location[1]
+        term_id = segment.term_id(token)
+        if term_id < 0:
+            return 0
+        return segment.term_frequency(ordinal, term_id)
     
     def get_idf(self, term: str) -> float:
-        token = tokenize_text(term)
-        if len(token) != 1:
-            raise ValueError("Term must be a single token")
-        matches = self.index[token[0]]
-        return math.log((len(self.docmap) + 1) / (len(matches) + 1))
+        doc_freq = len(self.__postings(self.__analyze_term(term))[0])
+        return math.log((self.doc_count + 1) / (doc_freq + 1))
     
     def get_bm25_tf(self, doc_id: int, term: str, k1: float=BM25_K1, b: float=BM25_B) -> float:
-        doc_length = self.doc_lengths.get(doc_id, 0)
-        avg_doc_length = self.__get_avg_doc_length()
-        length_norm = (1 - b) + (b * (doc_length / avg_doc_length)) if avg_doc_length > 0 else 1
+        location = self.docmap.locate(doc_id)
+        doc_length = int(self.segments[location[0]].doc_lengths[location[1]]) if location is not None else 0
         tf = self.get_tf(doc_id, term)
-        return (tf * (k1 + 1) / (tf + k1 * length_norm))
+        return bm25_tf(tf, doc_length, self.avg_doc_length, k1, b)
     
     def get_bm25_idf(self, term: str) -> float:
-        token = tokenize_text(term)
-        if len(token) != 1:
-            raise ValueError("Term must be a single token")
-        matches = self.index[token[0]]
-        return math.log((len(self.docmap) - len(matches) + 0.5) / (len(matches) + 0.5) + 1)
+        doc_freq = len(self.__postings(self.__analyze_term(term))[0])
+        return bm25_idf(self.doc_count, doc_freq)
     
     def bm25(self, doc_id: int, term: str) -> float:
         tf = self.get_bm25_tf(doc_id, term)
         idf = self.get_bm25_idf(term)
         return tf * idf
     
-    def bm25_search(self, query: str, limit: int) -> list[dict]:
-        tokenized_query = tokenize_text(query)
-        bm25_scores = {}
-        for id in self.docmap:
-            score = 0
-            for token in tokenized_query:
-                score += self.bm25(id, token)
-            bm25_scores[id] = score
-        sorted_scores = sorted(bm25_scores.items(), key=lambda x: x[1], reverse=True)
+    def __format_results(self, ranked_ordinals: Iterable[int], bm25_scores: ndarray | dict[int, float]) -> list[dict]:
         results = []
-        for id, score in sorted_scores[:limit]:
-            document = self.docmap[id]
+        for ordinal in ranked_ordinals:
+            document = self.__document(ordinal)
+            score = float(bm25_scores[ordinal])
             results.append(
                 {
                     "id": document["id"],
@@ -91,38 +166,327 @@ class InvertedIndex:
             )
         return results
 
+    def bm25_search(self, query: str, limit: int) -> list[dict]:
+        tokenized_query = self.analyzer.analyze(query)
+        bm25_scores = self.__score_tokens(tokenized_query)
+        # documents without any query term keep a score of 0 and rank after every match, in ordinal order
+        return self.__format_results(top_k_indices(bm25_scores, min(limit, self.doc_count)).tolist(), bm25_scores)
+
+    def bm25_ranking(self, query: str, limit: int) -> tuple[ndarray, ndarray]:
+        # doc IDs and scores in bm25_search order, without reading the stored documents
+        bm25_scores = self.__score_tokens(self.analyzer.analyze(query))
+        ordinals = top_k_indices(bm25_scores, min(limit, self.doc_count))
+        return self.doc_ids[ordinals], bm25_scores[ordinals]
+
+    def bm25_wand_search(self, query: str, limit: int, verify: bool=False) -> tuple[list[dict], dict]:
+        tokenized_query = self.analyzer.analyze(query)
+        limit = min(limit, self.doc_count)
+        cursors = []
+        for token, count in Counter(tokenized_query).items():
+            postings = self.__get_postings(token)
+            if postings is not None:
+                cursors.append(PostingCursor(token, *postings, count))
+        postings_total = sum(len(cursor.ordinals) for cursor in cursors)
+
+        top_k: list[tuple[float, int]] = [] # min-heap of (score, -ordinal) for the best documents so far
+        postings_scored = 0
+        while cursors and limit > 0:
+            cursors.sort(key=PostingCursor.current)
+            threshold = top_k[0][0] if len(top_k) >= limit else None
+            pivot, upper_bound = None, 0
+            for i, cursor in enumerate(cursors):
+                upper_bound += cursor.upper_bound
+                if threshold is None or upper_bound + PRUNING_TOLERANCE > threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_ordinal = cursors[pivot].current()
+            if cursors[0].current() == pivot_ordinal:
+                contributions = {}
+                for cursor in cursors:
+                    if cursor.current() == pivot_ordinal:
+                        contributions[cursor.token] = cursor.scores[cursor.position]
+                        cursor.position += 1
+                score = 0
+                for token in tokenized_query:
+                    score += contributions.get(token, 0)
+                postings_scored += len(contributions)
+                entry = (score, -pivot_ordinal)
+                if len(top_k) < limit:
+                    heappush(top_k, entry)
+                elif entry > top_k[0]:
+                    heapreplace(top_k, entry)
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.advance_to(pivot_ordinal)
+            cursors = [cursor for cursor in cursors if not cursor.exhausted()]
+
+        bm25_scores = {-ordinal: score for score, ordinal in top_k}
+        ranked_ordinals = [-ordinal for _, ordinal in sorted(top_k, reverse=True)]
+        if len(ranked_ordinals) < limit:
+            # live documents without any query term still rank, with a score of 0, after every match
+            live_ordinals = range(len(self.doc_ids)) if self.live is None else np.flatnonzero(self.live).tolist()
+            unmatched = (ordinal for ordinal in live_ordinals if ordinal not in bm25_scores)
+            ranked_ordinals.extend(islice(unmatched, limit - len(ranked_ordinals)))
+            bm25_scores.update((ordinal, 0) for ordinal in ranked_ordinals if ordinal not in bm25_scores)
+        results = self.__format_results(ranked_ordinals, bm25_scores)
+        stats = {
+            "postings_total": postings_total,
+            "postings_scored": postings_scored,
+            "matches_exact": results == self.bm25_search(query, limit) if verify else None
+        }
+        return results, stats
+
+    def __query_cursor(self, node: tuple) -> TermCursor | AllCursor | AndCursor | OrCursor | DifferenceCursor | None:
+        # terms that analyze to nothing, such as stop words, drop out of the query
+        match node:
+            case ("term", text):
+                tokens = dict.fromkeys(self.analyzer.analyze(text))
+                cursors = [TermCursor(TermBlocks(self.segments, self.live_masks, self.segment_bases, token)) for token in tokens]
+                if not cursors:
+                    return None
+                return cursors[0] if len(cursors) == 1 else OrCursor(cursors)
+            case ("not", child):
+                excluded = self.__query_cursor(child)
+                return DifferenceCursor(self.__all_cursor(), excluded) if excluded is not None else None
+            case ("or", children):
+                cursors = [cursor for cursor in map(self.__query_cursor, children) if cursor is not None]
+                if not cursors:
+                    return None
+                return cursors[0] if len(cursors) == 1 else OrCursor(cursors)
+            case ("and", children):
+                included = [cursor for child in children if child[0] != "not" and (cursor := self.__query_cursor(child)) is not None]
+                excluded = [cursor for child in children if child[0] == "not" and (cursor := self.__query_cursor(child[1])) is not None]
+                if not included and not excluded:
+                    return None
+                cursor = AndCursor(included) if included else self.__all_cursor()
+                if excluded:
+                    cursor = DifferenceCursor(cursor, excluded[0] if len(excluded) == 1 else OrCursor(excluded))
+                return cursor
+
+    def __all_cursor(self) -> AllCursor:
+        return AllCursor(range(len(self.doc_ids)) if self.live is None else np.flatnonzero(self.live).tolist())
+
+    def boolean_search(self, query: str, limit: int) -> list[dict]:
+        # matches come back in index order, and the cursors stop as soon as limit documents match
+        # malformed boolean syntax, such as "romeo AND" or a stray ")", searches the terms as plain keywords
+        try:
+            node = parse_query(query)
+        except ValueError:
+            node = keyword_query(query)
+        cursor = self.__query_cursor(node)
+        results = []
+        while cursor is not None and len(results) < limit and cursor.current() < math.inf:
+            results.append(self.__document(int(cursor.current())))
+            cursor.next()
+        return results
+
     
-    def build(self) -> None:
-        movies = load_movies()
+    def build(self, documents: list[dict] | None=None, workers: int=1) -> None:
+        movies = documents if documents is not None else load_movies()
+        texts = [(movie["id"], f"{movie["title"]} {movie["description"]}") for movie in movies]
+        if workers > 1:
+            # contiguous shards, merged in corpus order, so the result is identical to a serial build
+            shard_size = max(1, math.ceil(len(texts) / (workers * BUILD_SHARDS_PER_WORKER)))
+            shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                index, term_frequencies, doc_lengths = merge_shards(executor.map(index_shard, shards))
+        else:
+            index, term_frequencies, doc_lengths = index_shard(texts)
+        docmap = {}
         for movie in movies:
-            self.__add_document(movie["id"], f"{movie["title"]} {movie["description"]}")
-            self.docmap[movie["id"]] = movie
-    
+            docmap[movie["id"]] = movie
+        self.segments = [IndexSegment.from_index(index, term_frequencies, doc_lengths, docmap)]
+        self.__compute_statistics()
+
+    def __append_segment(self, documents: list[dict], deleted_ids: list[int]) -> None:
+        # every change is written as a new segment; save() folds the unsaved ones together
+        docmap = {document["id"]: document for document in documents}
+        index, term_frequencies, doc_lengths = index_shard([(doc_id, f"{document["title"]} {document["description"]}") for doc_id, document in docmap.items()])
+        self.segments.append(IndexSegment.from_index(index, term_frequencies, doc_lengths, docmap, deleted_ids))
+        self.__compute_statistics()
+
+    def add_documents(self, documents: list[dict]) -> None:
+        existing = [document["id"] for document in documents if document["id"] in self.docmap]
+        if existing:
+            raise ValueError(f"Documents already indexed: {existing}")
+        self.__append_segment(documents, [])
+
+    def add_document(self, document: dict) -> None:
+        self.add_documents([document])
+
+    def update_document(self, document: dict) -> None:
+        if document["id"] not in self.docmap:
+            raise KeyError(document["id"])
+        # the new copy hides the old one until a merge drops it
+        self.__append_segment([document], [])
+
+    def delete_document(self, doc_id: int) -> None:
+        if doc_id not in self.docmap:
+            raise KeyError(doc_id)
+        self.__append_segment([], [doc_id])
+
+    def __merge_segments(self, start: int, end: int) -> None:
+        # tombstones only matter while older segments remain beneath the merged one
+        deleted_ids = np.unique(np.concatenate([segment.deleted_ids for segment in self.segments[start:end]])) if start > 0 else None
+        merged = IndexSegment.merge(self.segments[start:end], self.live_masks[start:end], deleted_ids)
+        self.segments[start:end] = [merged]
+        self.__compute_statistics()
+
+    def __merge_tier(self) -> bool:
+        # merges the first run of at least MERGE_FACTOR adjacent segments within the same size tier
+        live_counts = [segment.doc_count if live is None else int(live.sum()) for segment, live in zip(self.segments, self.live_masks)]
+        tiers = [int(math.log(max(count, 1), MERGE_FACTOR)) for count in live_counts]
+        start = 0
+        for end in range(1, len(tiers) + 1):
+            if end == len(tiers) or tiers[end] != tiers[start]:
+                if end - start >= MERGE_FACTOR:
+                    self.__merge_segments(start, end)
+                    return True
+                start = end
+        return False
+
+    def merge(self) -> None:
+        if self.segments:
+            self.__merge_segments(0, len(self.segments))
+
     def save(self) -> None:
-        os.makedirs(CACHE, exist_ok=True)
-        with open(self.index_path, "wb") as f:
-            pickle.dump(self.index, f)
-        with open(self.docmap_path, "wb") as f:
-            pickle.dump(self.docmap, f)
-        with open(self.term_frequencies_path, "wb") as f:
-            pickle.dump(self.term_frequencies, f)
-        with open(self.doc_lengths_path, "wb") as f:
-            pickle.dump(self.doc_lengths, f)
+        unsaved = [i for i, segment in enumerate(self.segments) if segment.path is None]
+        if len(unsaved) > 1:
+            self.__merge_segments(unsaved[0], len(self.segments))
+        while self.__merge_tier():
+            pass
+
+        directory = os.path.dirname(self.manifest_path)
+        os.makedirs(directory, exist_ok=True)
+        manifest = self.__read_manifest() if os.path.exists(self.manifest_path) else {"generation": 0, "segments": []}
+        previous = manifest["segments"]
+        # numbering continues past the live manifest even after build(), so a save never rewrites a segment readers may have mapped
+        self.generation = max(self.generation, manifest["generation"])
+        for i, segment in enumerate(self.segments):
+            if segment.path is None:
+                self.generation += 1
+                path = os.path.join(directory, f"index_{self.generation}.seg")
+                segment.save(path)
+                self.segments[i] = IndexSegment.open(path)
+        self.__compute_statistics()
+        names = [os.path.basename(segment.path) for segment in self.segments]
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"generation": self.generation, "segments": names}, f)
+        os.replace(temp_path, self.manifest_path)
+        for name in set(previous) - set(names):
+            os.remove(os.path.join(directory, name))
+
+    def __read_manifest(self) -> dict:
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
 
     def load(self) -> None:
+        manifest = self.__read_manifest()
+        directory = os.path.dirname(self.manifest_path)
+        self.generation = manifest["generation"]
+        self.segments = [IndexSegment.open(os.path.join(directory, name)) for name in manifest["segments"]]
+        self.__compute_statistics()
+
+    def load_pickles(self) -> None:
+        # reads the index.pkl/docmap.pkl/term_frequencies.pkl/doc_lengths.pkl files written before segments
         with open(self.index_path, "rb") as f:
-            self.index = pickle.load(f)
+            index = pickle.load(f)
         with open(self.docmap_path, "rb") as f:
-            self.docmap = pickle.load(f)
+            docmap = pickle.load(f)
         with open(self.term_frequencies_path, "rb") as f:
-            self.term_frequencies = pickle.load(f)
+            term_frequencies = pickle.load(f)
         with open(self.doc_lengths_path, "rb") as f:
-            self.doc_lengths = pickle.load(f)
+            doc_lengths = pickle.load(f)
+        self.segments = [IndexSegment.from_index(index, term_frequencies, doc_lengths, docmap)]
+        self.__compute_statistics()
+
+
+class PostingCursor:
+    def __init__(self, token: str, ordinals: list[int], scores: list[float], max_score: float, count: int=1) -> None:
+        self.token = token
+        self.ordinals = ordinals # sorted docmap positions of documents containing the token
+        self.scores = scores # BM25 score of the token for each posting
+        self.upper_bound = max_score * count # most the token can add to any document's score
+        self.position = 0
+
+    def current(self) -> float:
+        return self.ordinals[self.position] if self.position < len(self.ordinals) else math.inf
+
+    def exhausted(self) -> bool:
+        return self.position >= len(self.ordinals)
+
+    def advance_to(self, ordinal: int) -> None:
+        self.position = bisect_left(self.ordinals, ordinal, self.position)
+
+
+class TermBlocks:
+    def __init__(self, segments: list[IndexSegment], live_masks: list[ndarray | None], segment_bases: ndarray, token: str) -> None:
+        self.parts: list[tuple[IndexSegment, ndarray | None, int, int, int]] = [] # segment, live mask, ordinal base, first term block, first global block
+        block_last, self.size = [], 0
+        for segment, live, base in zip(segments, live_masks, segment_bases.tolist()):
+            term_id = segment.term_id(token)
+            if term_id < 0:
+                continue
+            start, end = int(segment.block_offsets[term_id]), int(segment.block_offsets[term_id + 1])
+            self.parts.append((segment, live, base, start, sum(len(last) for last in block_last)))
+            block_last.append(segment.block_last[start:end].astype(np.int64) + base)
+            self.size += int(segment.posting_offsets[term_id + 1] - segment.posting_offsets[term_id])
+        self.block_last = np.concatenate(block_last) if block_last else np.empty(0, dtype=np.int64) # last global ordinal per block, across segments
+
+    def decode(self, start: int, end: int) -> list[int]:
+        # live global ordinals of blocks [start, end), which may span segments
+        ordinals = []
+        for i, (segment, live, base, term_start, first_block) in enumerate(self.parts):
+            last_block = self.parts[i + 1][4] if i + 1 < len(self.parts) else len(self.block_last)
+            low, high = max(start, first_block), min(end, last_block)
+            if low >= high:
+                continue
+            segment_ordinals, _ = segment.block_postings(term_start + low - first_block, term_start + high - first_block)
+            if live is not None:
+                segment_ordinals = segment_ordinals[live[segment_ordinals]]
+            ordinals.extend((segment_ordinals + base).tolist())
+        return ordinals
+
+
+def bm25_tf(tf: int, doc_length: int, avg_doc_length: float, k1: float=BM25_K1, b: float=BM25_B) -> float:
+    length_norm = (1 - b) + (b * (doc_length / avg_doc_length)) if avg_doc_length > 0 else 1
+    return (tf * (k1 + 1) / (tf + k1 * length_norm))
+
+def bm25_idf(doc_count: int, doc_freq: int) -> float:
+    return math.log((doc_count - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+
+def index_shard(documents: list[tuple[int, str]]) -> tuple[dict[str, set], dict[int, Counter], dict[int, int]]:
+    index: defaultdict[str, set] = defaultdict(set) # mapping tokens to sets of document IDs
+    term_frequencies: defaultdict[int, Counter] = defaultdict(Counter) # mapping document IDs to token counter
+    doc_lengths: dict[int, int] = {} # mapping document IDs to token length
+    tokenized_texts = get_analyzer().analyze_many(text for _, text in documents)
+    for (doc_id, _), tokenized_text in zip(documents, tokenized_texts):
+        for token in set(tokenized_text):
+            index[token].add(doc_id)
+        term_frequencies[doc_id].update(tokenized_text)
+        doc_lengths[doc_id] = len(tokenized_text)
+    return index, term_frequencies, doc_lengths
+
+def merge_shards(shards: Iterable[tuple[dict[str, set], dict[int, Counter], dict[int, int]]]) -> tuple[dict[str, set], dict[int, Counter], dict[int, int]]:
+    index: defaultdict[str, set] = defaultdict(set)
+    term_frequencies: defaultdict[int, Counter] = defaultdict(Counter)
+    doc_lengths: dict[int, int] = {}
+    for shard_index, shard_term_frequencies, shard_doc_lengths in shards:
+        for token, doc_ids in shard_index.items():
+            index[token].update(doc_ids)
+        for doc_id, counter in shard_term_frequencies.items():
+            term_frequencies[doc_id].update(counter)
+        doc_lengths.update(shard_doc_lengths)
+    return index, term_frequencies, doc_lengths
 
 
-def build_command() -> None:
+def build_command(workers: int=1) -> None:
     inverted_index = InvertedIndex()
-    inverted_index.build()
+    inverted_index.build(workers=workers)
     inverted_index.save()
 
 def tf_command(doc_id: int, term: str) -> int:
@@ -152,7 +516,41 @@ def bm25_idf_command(term: str) -> float:
     movies.load()
     return movies.get_bm25_idf(term)
 
-def bm25_search(query: str, limit: int) -> list[tuple]:
+def bm25_search(query: str, limit: int) -> list[dict]:
     movies = InvertedIndex()
     movies.load()
     return movies.bm25_search(query, limit)
+
+def add_command(doc_id: int, title: str, description: str) -> None:
+    movies = InvertedIndex()
+    movies.load()
+    movies.add_document({"id": doc_id, "title": title, "description": description})
+    movies.save()
+
+def update_command(doc_id: int, title: str, description: str) -> None:
+    movies = InvertedIndex()
+    movies.load()
+    movies.update_document({"id": doc_id, "title": title, "description": description})
+    movies.save()
+
+def delete_command(doc_id: int) -> None:
+    movies = InvertedIndex()
+    movies.load()
+    movies.delete_document(doc_id)
+    movies.save()
+
+def merge_command() -> None:
+    movies = InvertedIndex()
+    movies.load()
+    movies.merge()
+    movies.save()
+
+def convert_command() -> None:
+    inverted_index = InvertedIndex()
+    inverted_index.load_pickles()
+    inverted_index.save()
+
+def bm25_wand_search_command(query: str, limit: int, verify: bool) -> tuple[list[dict], dict]:
+    movies = InvertedIndex()
+    movies.load()
+    return movies.bm25_wand_search(query, limit, verify)
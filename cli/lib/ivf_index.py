@@ -0,0 +1,80 @@
+from lib.search_utils import IVF_NPROBE, IVF_LIST_FACTOR, IVF_KMEANS_ITERATIONS, IVF_TRAINING_SAMPLE, normalize_embeddings, top_k_indices
+
+import math
+import numpy as np
+from numpy import ndarray
+
+
+ASSIGNMENT_BATCH_SIZE = 8192
+KMEANS_SEED = 0
+
+
+class IVFIndex:
+    def __init__(self, nprobe: int=IVF_NPROBE) -> None:
+        self.centroids: ndarray = np.empty((0, 0), dtype=np.float32) # unit-length k-means centroids, one row per list
+        self.list_offsets: ndarray = np.zeros(1, dtype=np.int64) # start of each list in list_ids, plus the end
+        self.list_ids: ndarray = np.empty(0, dtype=np.int64) # embedding rows grouped by list, ascending within a list
+        self.nprobe = nprobe # lists scanned per query; more lists trade latency for recall
+
+    def is_built(self) -> bool:
+        return len(self.centroids) > 0
+
+    def build(self, embeddings: ndarray, list_count: int | None=None, seed: int=KMEANS_SEED) -> None:
+        # spherical k-means on a sample, then every normalized embedding joins the list of its nearest centroid
+        rng = np.random.default_rng(seed)
+        if list_count is None:
+            list_count = max(1, round(IVF_LIST_FACTOR * math.sqrt(len(embeddings))))
+        list_count = min(list_count, len(embeddings))
+        sample = embeddings[np.sort(rng.choice(len(embeddings), min(IVF_TRAINING_SAMPLE, len(embeddings)), replace=False))]
+        self.centroids = kmeans(sample, list_count, IVF_KMEANS_ITERATIONS, rng)
+        assignments = nearest_centroids(embeddings, self.centroids)
+        self.list_ids = np.argsort(assignments, kind="stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=list_count)))).astype(np.int64)
+
+    def candidates(self, query_embedding: ndarray, nprobe: int | None=None) -> ndarray:
+        # ascending embedding rows of the lists whose centroids are closest to the query
+        nprobe = nprobe if nprobe is not None else self.nprobe
+        probed = top_k_indices(self.centroids @ query_embedding, nprobe)
+        return np.sort(np.concatenate([self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probed.tolist()]))
+
+    def search(self, embeddings: ndarray, query_embedding: ndarray, k: int, nprobe: int | None=None) -> tuple[ndarray, ndarray]:
+        # rows and scores of the k best embeddings; scans every row when there is no index or every list is probed
+        nprobe = nprobe if nprobe is not None else self.nprobe
+        if not self.is_built() or nprobe >= len(self.centroids):
+            scores = embeddings @ query_embedding
+            rows = top_k_indices(scores, k)
+            return rows, scores[rows]
+        rows = self.candidates(query_embedding, nprobe)
+        scores = embeddings[rows] @ query_embedding
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            self.centroids = data["centroids"]
+            self.list_offsets = data["list_offsets"]
+            self.list_ids = data["list_ids"]
+
+
+def nearest_centroids(embeddings: ndarray, centroids: ndarray) -> ndarray:
+    assignments = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), ASSIGNMENT_BATCH_SIZE):
+        batch = embeddings[start:start + ASSIGNMENT_BATCH_SIZE]
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+def kmeans(sample: ndarray, k: int, iterations: int, rng: np.random.Generator) -> ndarray:
+    centroids = sample[rng.choice(len(sample), k, replace=False)]
+    for _ in range(iterations):
+        assignments = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        # an empty list restarts from a random sample point
+        empty = np.flatnonzero(np.bincount(assignments, minlength=k) == 0)
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_embeddings(sums)
+    return centroids
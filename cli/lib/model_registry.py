@@ -0,0 +1,109 @@
+from lib.search_utils import SEMANTIC_MODEL, MULTIMODAL_MODEL, CROSS_ENCODER_MODEL, INFERENCE_BACKENDS, INFERENCE_BACKEND
+
+import time
+import threading
+from functools import cache
+from typing import Any, Callable
+
+
+def quantize_int8(module: Any) -> None:
+    # dynamic int8: Linear weights are stored as int8 and activations quantized per batch, on CPU
+    import torch
+    torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def load_sentence_transformer(name: str, backend: str) -> Any:
+    # imported on first load, so processes that never encode skip the torch import as well
+    from sentence_transformers import SentenceTransformer
+    match backend:
+        case "onnx":
+            # ONNX Runtime runs the transformer modules; CLIP's image and text towers stay in torch
+            return SentenceTransformer(name, backend="onnx")
+        case "int8":
+            model = SentenceTransformer(name, device="cpu")
+            quantize_int8(model)
+            return model
+        case _:
+            return SentenceTransformer(name)
+
+def load_cross_encoder(name: str, backend: str) -> Any:
+    from sentence_transformers import CrossEncoder
+    match backend:
+        case "onnx":
+            return CrossEncoder(name, backend="onnx")
+        case "int8":
+            cross_encoder = CrossEncoder(name, device="cpu")
+            quantize_int8(cross_encoder.model)
+            return cross_encoder
+        case _:
+            return CrossEncoder(name)
+
+
+MODEL_LOADERS: dict[str, Callable[[str, str], Any]] = {
+    "sentence_transformer": load_sentence_transformer,
+    "cross_encoder": load_cross_encoder
+}
+DEFAULT_MODELS = [("sentence_transformer", SEMANTIC_MODEL), ("sentence_transformer", MULTIMODAL_MODEL), ("cross_encoder", CROSS_ENCODER_MODEL)]
+
+
+class ModelRegistry:
+    def __init__(self) -> None:
+        self.models: dict[tuple[str, str, str], Any] = {} # (kind, name, backend) to the loaded model
+        self.load_seconds: dict[tuple[str, str, str], float] = {} # (kind, name, backend) to how long the model took to load
+        self.lock = threading.Lock() # guards models, load_seconds and locks
+        self.locks: dict[tuple[str, str, str], threading.Lock] = {} # one per model, so a model loads once while others load alongside it
+
+    def get(self, kind: str, name: str, backend: str=INFERENCE_BACKEND) -> Any:
+        # the shared instance, loaded on first use; threads asking for a model being loaded wait for it
+        key = (kind, name, backend)
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        if kind not in MODEL_LOADERS:
+            raise ValueError(f"Unknown model kind: {kind}")
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            model = self.models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = MODEL_LOADERS[kind](name, backend)
+                with self.lock:
+                    self.models[key] = model
+                    self.load_seconds[key] = time.perf_counter() - start
+        return model
+
+    def preload(self, models: list[tuple[str, str]]=DEFAULT_MODELS, backend: str=INFERENCE_BACKEND) -> dict[tuple[str, str, str], float]:
+        # loads each (kind, name) up front so the first request does not pay for it
+        for kind, name in models:
+            self.get(kind, name, backend)
+        return {(kind, name, backend): self.load_seconds[(kind, name, backend)] for kind, name in models}
+
+    def is_loaded(self, kind: str, name: str, backend: str=INFERENCE_BACKEND) -> bool:
+        return (kind, name, backend) in self.models
+
+    def unload(self, kind: str | None=None, name: str | None=None, backend: str | None=None) -> int:
+        # drops every loaded model matching kind, name and backend, None matching any; objects still referenced elsewhere stay alive
+        with self.lock:
+            keys = [key for key in self.models if kind in (None, key[0]) and name in (None, key[1]) and backend in (None, key[2])]
+        for key in keys:
+            with self.locks[key], self.lock:
+                self.models.pop(key, None)
+                self.load_seconds.pop(key, None)
+        return len(keys)
+
+
+@cache
+def get_model_registry() -> ModelRegistry:
+    # one registry per process
+    return ModelRegistry()
+
+def get_sentence_transformer(name: str=SEMANTIC_MODEL, backend: str=INFERENCE_BACKEND) -> Any:
+    return get_model_registry().get("sentence_transformer", name, backend)
+
+def get_cross_encoder(name: str=CROSS_ENCODER_MODEL, backend: str=INFERENCE_BACKEND) -> Any:
+    return get_model_registry().get("cross_encoder", name, backend)
+
+def preload_command(backend: str=INFERENCE_BACKEND) -> dict[tuple[str, str, str], float]:
+    return get_model_registry().preload(backend=backend)
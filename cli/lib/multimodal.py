@@ -1,5 +1,6 @@
-from lib.search_utils import LLM_MODEL, MULTIMODAL_MODEL, RESULT_LIMIT, load_movies
-from lib.semantic_search import cosine_similarity
+from lib.search_utils import LLM_MODEL, MULTIMODAL_MODEL, INFERENCE_BACKEND, RESULT_LIMIT, EMBEDDING_QUANTIZATION, load_movies, normalize_embeddings, top_k_indices
+from lib.quantization import QuantizedEmbeddings
+from lib.model_registry import get_sentence_transformer
 
 import os
 import mimetypes
@@ -8,7 +9,6 @@ from numpy import ndarray
 from dotenv import load_dotenv
 from google import genai
 from PIL import Image
-from sentence_transformers import SentenceTransformer
 
 
 load_dotenv()
@@ -16,11 +16,19 @@ api_key = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=api_key)
 
 class MultiModalSearch:
-    def __init__(self, documents: list[dict]=[], model_name: str=MULTIMODAL_MODEL):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, documents: list[dict]=[], model_name: str=MULTIMODAL_MODEL, quantization: str=EMBEDDING_QUANTIZATION, backend: str=INFERENCE_BACKEND):
+        self.model_name = model_name
+        self.backend = backend # inference runtime the model is loaded with, one of INFERENCE_BACKENDS
         self.documents = documents
         self.texts = [f"{doc.get("title", "")}: {doc.get("description", "")}" for doc in documents]
-        self.text_embeddings = self.model.encode(self.texts, show_progress_bar=True)
+        # only the codes are kept when quantized; there is no float32 copy on disk to rescore from
+        self.text_embeddings = QuantizedEmbeddings(quantization) # L2-normalized CLIP text embeddings, one row per document
+        if self.texts:
+            self.text_embeddings.build(self.model.encode(self.texts, show_progress_bar=True))
+
+    @property
+    def model(self) -> Any:
+        return get_sentence_transformer(self.model_name, self.backend)
 
     def embed_image(self, image_path: str) -> ndarray:
         if not os.path.exists(image_path):
@@ -29,20 +37,19 @@ class MultiModalSearch:
         return self.model.encode([image])[0]
     
     def search_with_image(self, image_path: str) -> list[dict]:
-        embedded_image = self.embed_image(image_path)
+        scores = self.text_embeddings.scores(normalize_embeddings(self.embed_image(image_path)))
         results = []
-        for doc, text_embedding in zip(self.documents, self.text_embeddings):
-            similarity = cosine_similarity(text_embedding, embedded_image)
+        for i in top_k_indices(scores, RESULT_LIMIT).tolist():
+            doc = self.documents[i]
             results.append(
                 {
                     "id": doc["id"],
                     "title": doc["title"],
                     "document": doc["description"],
-                    "similarity_score": similarity
+                    "similarity_score": float(scores[i])
                 }
             )
-        results.sort(key=lambda x: x["similarity_score"], reverse=True)
-        return results[:RESULT_LIMIT]
+        return results
     
 
 def verify_image_embedding(image_path: str) -> int:
@@ -50,12 +57,12 @@ def verify_image_embedding(image_path: str) -> int:
     embedded_image = multimodal.embed_image(image_path)
     return embedded_image.shape[0]
 
-def image_search_command(image_path: str) -> list[dict]:
+def image_search_command(image_path: str, quantization: str=EMBEDDING_QUANTIZATION) -> list[dict]:
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
     
     movies = load_movies()
-    multimodal_search = MultiModalSearch(movies)
+    multimodal_search = MultiModalSearch(movies, quantization=quantization)
     return multimodal_search.search_with_image(image_path)
 
 
@@ -0,0 +1,131 @@
+from lib.search_utils import POSTING_BLOCK_SIZE
+
+import numpy as np
+from numpy import ndarray
+
+
+WORD_BITS = 64
+ENCODE_CHUNK_POSTINGS = 1 << 22
+WIDTH_MASKS = (np.uint64(1) << np.arange(WORD_BITS, dtype=np.uint64)) - np.uint64(1) # low-bit mask per bit width
+
+
+def bit_widths(values: ndarray) -> ndarray:
+    # frexp's exponent is the bit length for every integer below 2**53
+    return np.frexp(values.astype(np.float64))[1].astype(np.uint8)
+
+def encode_postings(posting_offsets: ndarray, ordinals: ndarray, frequencies: ndarray, block_size: int=POSTING_BLOCK_SIZE) -> dict[str, ndarray]:
+    # encodes runs of whole terms separately to bound the temporary arrays, then stitches the runs together
+    posting_offsets = np.asarray(posting_offsets, dtype=np.int64)
+    term_count = len(posting_offsets) - 1
+    chunks, term_start = [], 0
+    while term_start < term_count or not chunks:
+        term_end = int(np.searchsorted(posting_offsets, posting_offsets[term_start] + ENCODE_CHUNK_POSTINGS, side="right")) - 1
+        term_end = min(max(term_end, term_start + 1), term_count)
+        first, last = posting_offsets[term_start], posting_offsets[term_end]
+        chunks.append(encode_chunk(posting_offsets[term_start:term_end + 1] - first, ordinals[first:last], frequencies[first:last], block_size))
+        term_start = term_end
+    if len(chunks) == 1:
+        return chunks[0]
+
+    block_offsets, block_posting_offsets, block_bit_offsets = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)], []
+    block_count, posting_count, word_count = 0, 0, 0
+    for chunk in chunks:
+        block_offsets.append(chunk["block_offsets"][1:] + block_count)
+        block_posting_offsets.append(chunk["block_posting_offsets"][1:] + posting_count)
+        # each chunk's bits start on the first word after the previous chunk's words
+        block_bit_offsets.append(chunk["block_bit_offsets"][:-1] + word_count * WORD_BITS)
+        block_count += len(chunk["block_last"])
+        posting_count += int(chunk["block_posting_offsets"][-1])
+        word_count += len(chunk["posting_words"])
+    block_bit_offsets.append(np.array([word_count * WORD_BITS], dtype=np.int64))
+    encoded = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    encoded["block_offsets"] = np.concatenate(block_offsets)
+    encoded["block_posting_offsets"] = np.concatenate(block_posting_offsets)
+    encoded["block_bit_offsets"] = np.concatenate(block_bit_offsets)
+    return encoded
+
+def encode_chunk(posting_offsets: ndarray, ordinals: ndarray, frequencies: ndarray, block_size: int) -> dict[str, ndarray]:
+    # splits each term's postings into blocks of block_size and bit-packs ordinal gaps and frequencies per block
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    frequencies = np.asarray(frequencies, dtype=np.int64)
+    counts = np.diff(posting_offsets)
+    block_offsets = np.concatenate(([0], np.cumsum(-(-counts // block_size)))).astype(np.int64)
+
+    posting_terms = np.repeat(np.arange(len(counts)), counts)
+    in_term = np.arange(len(ordinals)) - posting_offsets[posting_terms]
+    block_starts = np.flatnonzero(in_term % block_size == 0)
+    block_posting_offsets = np.concatenate((block_starts, [len(ordinals)])).astype(np.int64)
+    block_sizes = np.diff(block_posting_offsets)
+    posting_blocks = np.repeat(np.arange(len(block_sizes)), block_sizes)
+    in_block = np.arange(len(ordinals)) - block_posting_offsets[posting_blocks]
+
+    # the first ordinal of a block lives in the skip data, so its gap is 0
+    gaps = np.diff(ordinals, prepend=0)
+    gaps[block_starts] = 0
+    frequency_values = frequencies - 1
+    if len(ordinals):
+        block_widths = np.maximum.reduceat(bit_widths(gaps), block_starts)
+        block_frequency_widths = np.maximum.reduceat(bit_widths(frequency_values), block_starts)
+    else:
+        block_widths = block_frequency_widths = np.empty(0, dtype=np.uint8)
+    block_bits = block_sizes * (block_widths.astype(np.int64) + block_frequency_widths)
+    block_bit_offsets = np.concatenate(([0], np.cumsum(block_bits))).astype(np.int64)
+
+    # spare words let the decoder always read the word after a value's first word
+    words = np.zeros(int(block_bit_offsets[-1]) // WORD_BITS + 2, dtype=np.uint64)
+    gap_positions = block_bit_offsets[posting_blocks] + in_block * block_widths[posting_blocks]
+    pack(words, gaps, gap_positions, block_widths[posting_blocks])
+    frequency_positions = (
+        block_bit_offsets[posting_blocks]
+        + block_sizes[posting_blocks] * block_widths[posting_blocks]
+        + in_block * block_frequency_widths[posting_blocks]
+    )
+    pack(words, frequency_values, frequency_positions, block_frequency_widths[posting_blocks])
+
+    return {
+        "block_offsets": block_offsets,
+        "block_posting_offsets": block_posting_offsets,
+        "block_first": ordinals[block_starts].astype(np.int32),
+        "block_last": ordinals[block_posting_offsets[1:] - 1].astype(np.int32),
+        "block_bit_offsets": block_bit_offsets,
+        "block_widths": block_widths,
+        "block_frequency_widths": block_frequency_widths,
+        "posting_words": words
+    }
+
+def pack(words: ndarray, values: ndarray, positions: ndarray, widths: ndarray) -> None:
+    values = values.astype(np.uint64)
+    word_index = positions >> 6
+    shifts = (positions & 63).astype(np.uint64)
+    np.bitwise_or.at(words, word_index, values << shifts)
+    spill = shifts + widths > WORD_BITS
+    np.bitwise_or.at(words, word_index[spill] + 1, values[spill] >> (np.uint64(WORD_BITS) - shifts[spill]))
+
+def unpack(words: ndarray, positions: ndarray, widths: ndarray) -> ndarray:
+    word_index = positions >> 6
+    shifts = (positions & 63).astype(np.uint64)
+    # shifting by 1 and then 63 - shift moves the next word by 64 - shift without an undefined 64-bit shift
+    values = (words[word_index] >> shifts) | ((words[word_index + 1] << np.uint64(1)) << (np.uint64(WORD_BITS - 1) - shifts))
+    values &= WIDTH_MASKS[widths]
+    return values.view(np.int64)
+
+def decode_blocks(sections: dict[str, ndarray], start: int, end: int) -> tuple[ndarray, ndarray]:
+    # decodes blocks [start, end) into sorted ordinals and their term frequencies
+    offsets = sections["block_posting_offsets"][start:end + 1]
+    block_sizes = np.diff(offsets)
+    posting_count = int(offsets[-1] - offsets[0])
+    block_starts = offsets[:-1] - offsets[0]
+    blocks = np.repeat(np.arange(start, end), block_sizes)
+    in_block = np.arange(posting_count) - np.repeat(block_starts, block_sizes)
+
+    # gaps and frequencies are unpacked together; frequencies follow the gaps inside each block
+    widths = sections["block_widths"][blocks].astype(np.int64)
+    frequency_widths = sections["block_frequency_widths"][blocks].astype(np.int64)
+    bit_offsets = sections["block_bit_offsets"][blocks]
+    positions = np.concatenate((bit_offsets + in_block * widths, bit_offsets + np.repeat(block_sizes, block_sizes) * widths + in_block * frequency_widths))
+    values = unpack(sections["posting_words"], positions, np.concatenate((widths, frequency_widths)))
+    gaps, frequencies = values[:posting_count], values[posting_count:] + 1
+
+    # each block's gaps are summed from its own first ordinal
+    running = np.cumsum(gaps)
+    return np.repeat(sections["block_first"][start:end] - running[block_starts], block_sizes) + running, frequencies
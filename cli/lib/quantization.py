@@ -0,0 +1,147 @@
+from lib.search_utils import PQ_SUBVECTOR_DIMENSIONS, PQ_CENTROIDS, PQ_TRAINING_SAMPLE, PQ_KMEANS_ITERATIONS, RESCORE_MULTIPLIER, normalize_embeddings, top_k_indices
+
+import os
+import numpy as np
+from numpy import ndarray
+
+
+QUANTIZATION_MODES = ["float32", "float16", "int8", "pq"]
+BLOCK_ROWS = 4096 # rows widened per step; small enough that the float32 copy stays in cache
+INT8_LEVELS = 127
+PQ_SEED = 0
+
+
+class QuantizedEmbeddings:
+    def __init__(self, mode: str) -> None:
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.codes: ndarray = np.empty((0, 0), dtype=np.float32) # compressed rows: float16, int8, or one uint8 centroid ID per subvector
+        self.scales: ndarray = np.empty(0, dtype=np.float32) # int8 step size per dimension
+        self.codebooks: ndarray = np.empty((0, 0, 0), dtype=np.float32) # PQ centroids, shaped (subvectors, centroids, subvector dimensions)
+        self.full: ndarray | None = None # full-precision rows for rescoring, usually memory-mapped; None scores on the codes alone
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes + self.codebooks.nbytes
+
+    def build(self, embeddings: ndarray) -> None:
+        # embeddings are normalized block by block, so a memory-mapped matrix is never copied whole
+        if self.mode == "pq":
+            self.codebooks = train_product_quantizer(embeddings)
+        elif self.mode == "int8":
+            max_values = np.zeros(embeddings.shape[1], dtype=np.float32)
+            for start in range(0, len(embeddings), BLOCK_ROWS):
+                np.maximum(max_values, np.abs(normalize_embeddings(embeddings[start:start + BLOCK_ROWS])).max(axis=0), out=max_values)
+            max_values[max_values == 0] = 1
+            self.scales = max_values / INT8_LEVELS
+        blocks = [self.__encode(normalize_embeddings(embeddings[start:start + BLOCK_ROWS])) for start in range(0, len(embeddings), BLOCK_ROWS)]
+        self.codes = np.concatenate(blocks) if blocks else self.__encode(np.empty((0, embeddings.shape[1]), dtype=np.float32))
+
+    def __encode(self, block: ndarray) -> ndarray:
+        match self.mode:
+            case "float32":
+                return block
+            case "float16":
+                return block.astype(np.float16)
+            case "int8":
+                return np.clip(np.rint(block / self.scales), -INT8_LEVELS, INT8_LEVELS).astype(np.int8)
+            case "pq":
+                return encode_product_quantizer(block, self.codebooks)
+
+    def scores(self, query_embedding: ndarray, rows: ndarray | None=None) -> ndarray:
+        # approximate cosine similarities against the codes, for every row or just the given ones
+        codes = self.codes if rows is None else self.codes[rows]
+        if not len(codes):
+            return np.empty(0, dtype=np.float32)
+        if self.mode == "pq":
+            # one table of subvector dot products per query; a row's score sums its entries
+            table = np.einsum("mkd,md->mk", self.codebooks, query_embedding.reshape(len(self.codebooks), -1))
+            subvectors = np.arange(len(self.codebooks))
+            return np.concatenate([table[subvectors, codes[start:start + BLOCK_ROWS]].sum(axis=1) for start in range(0, len(codes), BLOCK_ROWS)])
+        weights = query_embedding * self.scales if self.mode == "int8" else query_embedding
+        if self.mode == "float32":
+            return codes @ weights
+        # float16 and int8 blocks are widened to float32 so the product runs in BLAS
+        return np.concatenate([codes[start:start + BLOCK_ROWS].astype(np.float32) @ weights for start in range(0, len(codes), BLOCK_ROWS)])
+
+    def exact_scores(self, query_embedding: ndarray, rows: ndarray | None=None) -> ndarray:
+        if self.full is None:
+            return self.scores(query_embedding, rows)
+        return full_scores(self.full, query_embedding, rows)
+
+    def search(self, query_embedding: ndarray, k: int, rescore: int=RESCORE_MULTIPLIER) -> tuple[ndarray, ndarray]:
+        # shortlists rescore * k rows on the codes, then reranks the shortlist at full precision
+        shortlist = np.sort(top_k_indices(self.scores(query_embedding), k * rescore))
+        exact = self.exact_scores(query_embedding, shortlist)
+        best = top_k_indices(exact, k)
+        return shortlist[best], exact[best]
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, codes=self.codes, scales=self.scales, codebooks=self.codebooks)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            self.codes = data["codes"]
+            self.scales = data["scales"]
+            self.codebooks = data["codebooks"]
+
+
+def quantized_path(embeddings_path: str, mode: str) -> str:
+    return f"{os.path.splitext(embeddings_path)[0]}.{mode}.npz"
+
+def load_or_build_quantized(embeddings: ndarray, embeddings_path: str, mode: str) -> QuantizedEmbeddings:
+    # codes are cached next to the embeddings and rebuilt when they are missing or older than the embeddings file
+    quantized = QuantizedEmbeddings(mode)
+    path = quantized_path(embeddings_path, mode)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(embeddings_path):
+        quantized.load(path)
+    if len(quantized) != len(embeddings):
+        quantized.build(embeddings)
+        quantized.save(path)
+    quantized.full = embeddings
+    return quantized
+
+def full_scores(embeddings: ndarray, query_embedding: ndarray, rows: ndarray | None=None) -> ndarray:
+    # exact cosine similarities from full-precision rows that may be memory-mapped and unnormalized
+    rows = np.arange(len(embeddings)) if rows is None else rows
+    return np.concatenate([normalize_embeddings(embeddings[rows[start:start + BLOCK_ROWS]]) @ query_embedding for start in range(0, len(rows), BLOCK_ROWS)] or [np.empty(0, dtype=np.float32)])
+
+def train_product_quantizer(embeddings: ndarray, subvector_dimensions: int=PQ_SUBVECTOR_DIMENSIONS, centroids: int=PQ_CENTROIDS) -> ndarray:
+    # k-means per subspace on a sample of the normalized rows
+    if embeddings.shape[1] % subvector_dimensions:
+        raise ValueError(f"{embeddings.shape[1]} dimensions do not split into subvectors of {subvector_dimensions}")
+    subvectors = embeddings.shape[1] // subvector_dimensions
+    rng = np.random.default_rng(PQ_SEED)
+    sample_rows = np.sort(rng.choice(len(embeddings), min(PQ_TRAINING_SAMPLE, len(embeddings)), replace=False))
+    sample = normalize_embeddings(embeddings[sample_rows]).reshape(len(sample_rows), subvectors, -1)
+    return np.stack([euclidean_kmeans(sample[:, m], min(centroids, len(sample_rows)), PQ_KMEANS_ITERATIONS, rng) for m in range(subvectors)])
+
+def encode_product_quantizer(block: ndarray, codebooks: ndarray) -> ndarray:
+    subvectors = block.reshape(len(block), len(codebooks), -1)
+    codes = np.empty((len(block), len(codebooks)), dtype=np.uint8)
+    for m, codebook in enumerate(codebooks):
+        codes[:, m] = nearest_euclidean(subvectors[:, m], codebook)
+    return codes
+
+def nearest_euclidean(points: ndarray, centroids: ndarray) -> ndarray:
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 does not change the argmin
+    return np.argmin((centroids * centroids).sum(axis=1) - 2 * points @ centroids.T, axis=1)
+
+def euclidean_kmeans(points: ndarray, k: int, iterations: int, rng: np.random.Generator) -> ndarray:
+    centroids = points[rng.choice(len(points), k, replace=False)]
+    for _ in range(iterations):
+        assignments = nearest_euclidean(points, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, points)
+        # an empty cluster restarts from a random point
+        empty = counts == 0
+        sums[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+        counts[empty] = 1
+        centroids = sums / counts[:, np.newaxis]
+    return centroids.astype(np.float32)
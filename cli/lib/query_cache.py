@@ -0,0 +1,160 @@
+from lib.search_utils import CACHE, QUERY_CACHE_SIZE, QUERY_DISK_CACHE_SIZE
+from lib.embedding_store import text_fingerprints
+
+import os
+import re
+import fcntl
+import threading
+import numpy as np
+from numpy import ndarray
+from functools import cache
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Callable, Iterator
+
+
+class QueryEmbeddingCache:
+    def __init__(self, model_name: str, size: int=QUERY_CACHE_SIZE, disk_size: int=QUERY_DISK_CACHE_SIZE, path: str | None=None) -> None:
+        self.model_name = model_name
+        self.size = size # embeddings kept in process, least recently used evicted first
+        self.disk_size = disk_size # slots in the on-disk tier; 0 turns it off
+        self.path = path or os.path.join(CACHE, f"query_embeddings_{re.sub(r"[^\w.-]", "_", model_name)}.npy")
+        self.memory: OrderedDict[int, ndarray] = OrderedDict() # fingerprint to embedding, oldest first
+        self.records: ndarray | None = None # memory-mapped disk slots of (key, tick, embedding); tick 0 marks an empty slot
+        self.slots: dict[int, int] = {} # fingerprint to disk slot, as last seen; other processes may have reused a slot since
+        self.lock = threading.Lock() # with an exclusive flock on the lock file, serializes disk reads and writes across threads and processes
+        self.clock = 0 # last tick handed out; the smallest tick is the least recently used slot
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> int:
+        # whitespace runs are collapsed since tokenizers ignore them; case is kept because some encoders are cased
+        return int(text_fingerprints([" ".join(text.split())], self.model_name)[0])
+
+    def get_or_encode(self, text: str, encode: Callable[[str], ndarray]) -> ndarray:
+        key = self.key(text)
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return embedding
+        embedding = self.__disk_get(key)
+        if embedding is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            embedding = np.array(encode(text), dtype=np.float32)
+            self.__disk_put(key, embedding)
+        return self.__remember(key, embedding)
+
+    def get_or_encode_many(self, texts: list[str], encode_many: Callable[[list[str]], ndarray]) -> ndarray:
+        # one encode call for every text missing from both tiers; rows follow texts
+        embeddings = [None] * len(texts)
+        missing: dict[int, list[int]] = {} # key to the positions of texts that need it
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            elif key not in missing and (embedding := self.__disk_get(key)) is not None:
+                self.disk_hits += 1
+                self.__remember(key, embedding)
+            else:
+                missing.setdefault(key, []).append(i)
+                continue
+            embeddings[i] = embedding
+        if missing:
+            self.misses += len(missing)
+            encoded = np.array(encode_many([texts[positions[0]] for positions in missing.values()]), dtype=np.float32)
+            for (key, positions), embedding in zip(missing.items(), encoded):
+                self.__disk_put(key, embedding)
+                embedding = self.__remember(key, embedding.copy())
+                for i in positions:
+                    embeddings[i] = embedding
+        return np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+    def __remember(self, key: int, embedding: ndarray) -> ndarray:
+        # callers share the cached array, so it must not change under them
+        embedding.flags.writeable = False
+        self.memory[key] = embedding
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+        return embedding
+
+    def __open(self, dimensions: int | None) -> bool:
+        # maps the disk tier on first use; a file of another shape is replaced once the dimensions are known
+        if self.records is not None:
+            return True
+        if not self.disk_size:
+            return False
+        if os.path.exists(self.path):
+            records = np.load(self.path, mmap_mode="r+")
+            if records.shape == (self.disk_size,) and (dimensions is None or records.dtype["embedding"].shape == (dimensions,)):
+                self.records = records
+        if self.records is None:
+            if dimensions is None:
+                return False
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            dtype = np.dtype([("key", np.uint64), ("tick", np.int64), ("embedding", np.float32, (dimensions,))])
+            self.records = np.lib.format.open_memmap(self.path, mode="w+", dtype=dtype, shape=(self.disk_size,))
+        used = np.flatnonzero(self.records["tick"])
+        self.slots = dict(zip(self.records["key"][used].tolist(), used.tolist()))
+        self.clock = int(self.records["tick"].max(initial=0))
+        return True
+
+    @contextmanager
+    def __disk_lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def __slot(self, key: int) -> int | None:
+        # the slot is trusted only while it still holds key; otherwise the file is searched and the stale entry dropped
+        slot = self.slots.get(key)
+        if slot is not None and int(self.records["key"][slot]) == key and self.records["tick"][slot]:
+            return slot
+        self.slots.pop(key, None)
+        found = np.flatnonzero((self.records["key"] == key) & (self.records["tick"] > 0))
+        if not len(found):
+            return None
+        self.slots[key] = int(found[0])
+        return self.slots[key]
+
+    def __disk_get(self, key: int) -> ndarray | None:
+        if not self.disk_size:
+            return None
+        with self.__disk_lock():
+            if not self.__open(None):
+                return None
+            slot = self.__slot(key)
+            if slot is None:
+                return None
+            # ticks from other processes count too, so the newest tick in the file is the clock
+            self.clock = max(self.clock, int(self.records["tick"].max())) + 1
+            self.records["tick"][slot] = self.clock
+            return np.array(self.records["embedding"][slot])
+
+    def __disk_put(self, key: int, embedding: ndarray) -> None:
+        if not self.disk_size:
+            return
+        with self.__disk_lock():
+            # opening under the lock keeps two processes from both creating the file
+            if not self.__open(len(embedding)) or self.records.dtype["embedding"].shape != embedding.shape:
+                return
+            slot = self.__slot(key)
+            if slot is None:
+                slot = int(np.argmin(self.records["tick"]))
+                if self.records["tick"][slot]:
+                    self.slots.pop(int(self.records["key"][slot]), None)
+            self.clock = max(self.clock, int(self.records["tick"].max())) + 1
+            self.records[slot] = (key, self.clock, embedding)
+            self.slots[key] = slot
+
+
+@cache
+def get_query_cache(model_name: str) -> QueryEmbeddingCache:
+    # one cache per model and process, shared by every search object using that model
+    return QueryEmbeddingCache(model_name)
@@ -1,8 +1,8 @@
-from lib.hybrid_search import HybridSearch
-from lib.search_utils import load_movies, RRF_K, LLM_MODEL
+from lib.hybrid_search import get_hybrid_search
+from lib.search_utils import RRF_K, LLM_MODEL
 
 import os
-from typing import Any
+from typing import Any, Callable
 from dotenv import load_dotenv
 from google import genai
 
@@ -109,58 +109,31 @@ def generate_question_answer(query: str, documents: list[dict]) -> str:
     )
     return (response.text or "").strip()
 
-def rag_command(query: str, limit: int) -> dict[str, Any]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-
-    results = hybrid_search.rrf_search(query, RRF_K, limit)
-    results.sort(key=lambda x: x["rrf_score"], reverse=True)
+def cached_generation(kind: str, query: str, limit: int, generate: Callable[[str, list[dict]], str]) -> dict[str, Any]:
+    # the search results and the Gemini response are cached together, keyed like the hybrid search results
+    hybrid_search = get_hybrid_search()
 
-    response = generate_answer(query, results[:limit])
+    def search() -> dict[str, Any]:
+        results = hybrid_search.rrf_search(query, RRF_K, limit=limit)
+        results.sort(key=lambda x: x["rrf_score"], reverse=True)
 
-    return {
-        "results": results[:limit],
-        "response": response
-    }
+        response = generate(query, results[:limit])
 
-def summarize_command(query: str, limit: int) -> dict[str, Any]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
+        return {
+            "results": results[:limit],
+            "response": response
+        }
 
-    results = hybrid_search.rrf_search(query, RRF_K, limit)
-    results.sort(key=lambda x: x["rrf_score"], reverse=True)
+    return hybrid_search.cached_search(kind, query, {"k": RRF_K, "limit": limit, "model": LLM_MODEL}, search)
 
-    response = generate_summarization(query, results[:limit])
+def rag_command(query: str, limit: int) -> dict[str, Any]:
+    return cached_generation("rag", query, limit, generate_answer)
 
-    return {
-        "results": results[:limit],
-        "response": response
-    }
+def summarize_command(query: str, limit: int) -> dict[str, Any]:
+    return cached_generation("summarize", query, limit, generate_summarization)
 
 def citations_command(query: str, limit: int) -> dict[str, Any]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-
-    results = hybrid_search.rrf_search(query, RRF_K, limit)
-    results.sort(key=lambda x: x["rrf_score"], reverse=True)
-
-    response = generate_citations(query, results[:limit])
-
-    return {
-        "results": results[:limit],
-        "response": response
-    }
+    return cached_generation("citations", query, limit, generate_citations)
 
 def question_comand(query: str, limit: int) -> dict[str, Any]:
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-
-    results = hybrid_search.rrf_search(query, RRF_K, limit)
-    results.sort(key=lambda x: x["rrf_score"], reverse=True)
-
-    response = generate_question_answer(query, results[:limit])
-
-    return {
-        "results": results[:limit],
-        "response": response
-    }
\ No newline at end of file
+    return cached_generation("question", query, limit, generate_question_answer)
@@ -1,11 +1,11 @@
 from lib.search_utils import LLM_MODEL, CROSS_ENCODER_MODEL
+from lib.model_registry import get_cross_encoder
 
 import os
 import time
 import json
 from dotenv import load_dotenv
 from google import genai
-from sentence_transformers import CrossEncoder
 
 
 load_dotenv()
@@ -73,11 +73,11 @@ def rerank_batch(query: str, documents: list[dict]) -> list[dict]:
 
 def rerank_cross_encoder(query: str, documents: list[dict]) -> list[dict]:
     pairs = [[query, f"{doc.get("title", "")} - {doc.get("document", "")}"] for doc in documents]
-    cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL)
+    cross_encoder = get_cross_encoder(CROSS_ENCODER_MODEL)
     scores = cross_encoder.predict(pairs)
     scored_docs = []
     for doc, score in zip(documents, scores):
-        scored_docs.append({**doc, "cross_encoder_score": score})
+        scored_docs.append({**doc, "cross_encoder_score": float(score)})
     scored_docs.sort(key=lambda x: x["cross_encoder_score"], reverse=True)
     return scored_docs
 
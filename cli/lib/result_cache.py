@@ -0,0 +1,136 @@
+from lib.search_utils import CACHE, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_DISK_CACHE_SIZE
+
+import os
+import json
+import time
+import hashlib
+from contextlib import suppress
+from functools import cache
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class ResultCache:
+    def __init__(self, size: int=RESULT_CACHE_SIZE, ttl: float | None=RESULT_CACHE_TTL, disk_size: int=RESULT_DISK_CACHE_SIZE, path: str | None=None) -> None:
+        self.size = size # results kept in process, least recently used evicted first
+        self.ttl = ttl # seconds an entry stays valid in either tier; None keeps it until evicted
+        self.disk_size = disk_size # files in the on-disk tier; 0 turns it off
+        self.path = path or os.path.join(CACHE, "results")
+        self.memory: OrderedDict[str, tuple[float, str]] = OrderedDict() # key to (expiry, JSON text), oldest first
+        self.disk_count: int | None = None # files in path, counted on the first write
+        self.memory_hits = 0 # hit and miss counters cover this process only; cache_benchmark reports them from the process serving its queries
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, kind: str, query: str, fingerprint: str, params: dict[str, Any]) -> str:
+        # whitespace runs are collapsed as in the query embedding cache; the fingerprint names the index the results came from
+        text = json.dumps([kind, " ".join(query.split()), fingerprint, params], sort_keys=True)
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        # a fresh copy on every hit, since callers sort and annotate the results they get
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None and entry[0] > now:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return json.loads(entry[1])
+        if entry is not None:
+            del self.memory[key]
+        entry = self.__disk_get(key, now)
+        if entry is not None:
+            self.disk_hits += 1
+            self.__remember(key, *entry)
+            return json.loads(entry[1])
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        # a value JSON cannot hold, or a disk tier that cannot be written, only costs the entry; the caller still has its results
+        expiry = time.time() + self.ttl if self.ttl is not None else float("inf")
+        try:
+            text = json.dumps(value)
+        except (TypeError, ValueError):
+            return
+        self.__remember(key, expiry, text)
+        with suppress(OSError):
+            self.__disk_put(key, expiry, text)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.__disk_files())
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        for name in self.__disk_files():
+            os.remove(os.path.join(self.path, name))
+        self.disk_count = 0
+
+    def __remember(self, key: str, expiry: float, text: str) -> None:
+        self.memory[key] = (expiry, text)
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def __disk_files(self) -> list[str]:
+        return [name for name in os.listdir(self.path) if name.endswith(".json")] if os.path.isdir(self.path) else []
+
+    def __disk_get(self, key: str, now: float) -> tuple[float, str] | None:
+        if not self.disk_size:
+            return None
+        file_path = os.path.join(self.path, f"{key}.json")
+        try:
+            with open(file_path, "r") as f:
+                expiry, text = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if expiry <= now:
+            with suppress(FileNotFoundError):
+                os.remove(file_path)
+            return None
+        return expiry, text
+
+    def __disk_put(self, key: str, expiry: float, text: str) -> None:
+        # written beside the entry and renamed over it, so processes sharing the directory never read half an entry
+        if not self.disk_size:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        if self.disk_count is None:
+            self.disk_count = len(self.__disk_files())
+        file_path = os.path.join(self.path, f"{key}.json")
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump([expiry, text], f)
+        self.disk_count += not os.path.exists(file_path)
+        os.replace(temp_path, file_path)
+        if self.disk_count > self.disk_size:
+            self.__evict_disk()
+
+    def __evict_disk(self) -> None:
+        # the oldest writes go first, down to nine tenths of disk_size so the directory is not listed on every write
+        files = sorted(self.__disk_files(), key=lambda name: os.stat(os.path.join(self.path, name)).st_mtime_ns)
+        keep = self.disk_size * 9 // 10
+        for name in files[:max(len(files) - keep, 0)]:
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(self.path, name))
+        self.disk_count = min(len(files), keep)
+
+
+@cache
+def get_result_cache() -> ResultCache:
+    # one cache per process, shared by hybrid search and the RAG commands
+    return ResultCache()
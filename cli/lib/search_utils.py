@@ -1,11 +1,44 @@
 import os
 import json
 import string
+import numpy as np
+from numpy import ndarray
+from functools import cache, lru_cache
+from typing import Iterable
 from nltk.stem import PorterStemmer
 
 RESULT_LIMIT = 5
 BM25_K1 = 1.5
 BM25_B = 0.75
+STEM_CACHE_SIZE = 100_000
+BUILD_SHARDS_PER_WORKER = 4
+SEGMENT_ALIGNMENT = 64
+PRUNING_TOLERANCE = 1e-9
+MERGE_FACTOR = 4
+POSTING_BLOCK_SIZE = 128
+IVF_MIN_CHUNKS = 10_000
+IVF_LIST_FACTOR = 1
+IVF_NPROBE = 8
+IVF_KMEANS_ITERATIONS = 10
+IVF_TRAINING_SAMPLE = 50_000
+EMBEDDING_QUANTIZATION = "float32"
+RESCORE_MULTIPLIER = 10
+PQ_SUBVECTOR_DIMENSIONS = 8
+PQ_CENTROIDS = 256
+PQ_TRAINING_SAMPLE = 20_000
+PQ_KMEANS_ITERATIONS = 10
+QUERY_CACHE_SIZE = 1024
+QUERY_DISK_CACHE_SIZE = 10_000
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL: float | None = 3600.0
+RESULT_DISK_CACHE_SIZE = 10_000
+QUERY_BATCH_SIZE = 32
+EMBEDDING_BATCH_SIZE = 256
+CHECKPOINT_INTERVAL = 16
+POOLING_METHODS = ["max", "mean", "top_n_sum", "softmax"]
+CHUNK_POOLING = "max"
+POOLING_TOP_N = 2
+POOLING_TEMPERATURE = 0.05
 CHUNK_SIZE = 200
 WORD_OVERLAP = 0
 SENTENCE_OVERLAP = 1
@@ -14,12 +47,40 @@ SCORE_PRECISION = 3
 DOCUMENT_PREVIEW_LENGTH = 100
 ALPHA = 0.5
 LIMIT_MULTIPLIER = 500
+CANDIDATE_DEPTH_START = 10
+CANDIDATE_DEPTH_GROWTH = 4
+HYBRID_CONCURRENT = False
+LEG_TIMEOUT: float | None = None
+LEG_WORKERS = 4
 RRF_K = 60
+FUSION_STRATEGIES = ["rrf", "weighted", "combsum", "combmnz"]
+NORMALIZATIONS = ["minmax", "zscore"]
 SEMANTIC_MODEL = "all-MiniLM-L6-v2"
 LLM_MODEL = "gemini-2.5-flash"
 CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-TinyBERT-L2-v2"
 MULTIMODAL_MODEL = "clip-ViT-B-32"
+INFERENCE_BACKENDS = ["torch", "onnx", "int8"]
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
 SEARCH_MULTIPLIER = 5
+BENCHMARK_DOC_COUNTS = [5_000, 50_000, 250_000, 1_000_000]
+BENCHMARK_QUERIES = 20
+BENCHMARK_LEGACY_MAX_DOCS = 10_000
+BENCHMARK_LEGACY_QUERIES = 3
+BENCHMARK_SEED = 42
+BENCHMARK_WORKERS = [1, 2, 4, 8]
+BENCHMARK_POSTING_DOCS = [1_000_000]
+BENCHMARK_SET_SAMPLE_TERMS = 10
+BENCHMARK_CHUNK_COUNTS = [10_000, 100_000, 1_000_000]
+BENCHMARK_LEGACY_MAX_CHUNKS = 100_000
+BENCHMARK_NPROBES = [1, 2, 4, 8, 16, 32, 64]
+BENCHMARK_QUANTIZATION_CHUNKS = 200_000
+BENCHMARK_BATCH_QUERIES = 256
+BENCHMARK_POOLING_CHUNKS = [10_000, 100_000]
+BENCHMARK_BACKEND_TEXTS = 512
+BENCHMARK_HYBRID_DOCS = 5_000
+BENCHMARK_LEG_TIMEOUT = 0.005
+BENCHMARK_FUSION_CANDIDATES = 5_000
+BENCHMARK_CACHE_LOOKUPS = 1_000
 
 ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA = os.path.join(ROOT_PATH, "data", "movies.json")
@@ -41,12 +102,68 @@ def load_golden_dataset() -> list[dict]:
 def get_stop_words() -> list[str]:
     with open(STOP_WORDS, "r") as f:
         return f.read().splitlines()
-    
-    
+
+
+class Analyzer:
+    def __init__(self, stop_words: Iterable[str] | None=None, cache_size: int=STEM_CACHE_SIZE) -> None:
+        self.stop_words = frozenset(stop_words if stop_words is not None else get_stop_words())
+        self.punctuation_table = str.maketrans("", "", string.punctuation)
+        self.stem = lru_cache(maxsize=cache_size)(PorterStemmer().stem) # memoized stems, bounded LRU
+
+    def analyze(self, text: str) -> list[str]:
+        words = text.lower().translate(self.punctuation_table).split()
+        stop_words, stem = self.stop_words, self.stem
+        return [stem(word) for word in words if word not in stop_words]
+
+    def analyze_many(self, texts: Iterable[str]) -> list[list[str]]:
+        return [self.analyze(text) for text in texts]
+
+
+@cache
+def get_analyzer() -> Analyzer:
+    return Analyzer()
+
 def tokenize_text(text: str) -> list[str]:
-    text = text.lower()
-    text = text.translate(str.maketrans("", "", string.punctuation))
-    stop_words = get_stop_words()
-    filtered_words = [word for word in text.split() if word not in stop_words]
-    stemmer = PorterStemmer()
-    return [stemmer.stem(token) for token in filtered_words]
\ No newline at end of file
+    return get_analyzer().analyze(text)
+
+def top_k_indices(scores: ndarray, k: int) -> ndarray:
+    # indices of the k highest scores, best first, ties broken by lowest index like a stable sort
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > kth_score)
+    ties = np.flatnonzero(scores == kth_score)[:k - len(above)]
+    candidates = np.concatenate((above, ties))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+def pool_scores(scores: ndarray, starts: ndarray, pooling: str=CHUNK_POOLING, top_n: int=POOLING_TOP_N, temperature: float=POOLING_TEMPERATURE) -> ndarray:
+    # one score per run of the last axis, where runs begin at starts, as used to turn chunk scores into movie scores
+    counts = np.diff(np.append(starts, scores.shape[-1]))
+    match pooling:
+        case "max":
+            return np.maximum.reduceat(scores, starts, axis=-1)
+        case "mean":
+            return np.add.reduceat(scores, starts, axis=-1) / counts.astype(scores.dtype)
+        case "top_n_sum":
+            # each run is shifted past the range of the run before it, so one sort orders every run best first
+            runs = np.repeat(np.arange(len(starts)), counts)
+            span = 2 * float(np.abs(scores).max(initial=0)) + 1
+            order = np.argsort(runs * span - scores, axis=-1, kind="stable")
+            ranks = np.arange(scores.shape[-1]) - np.repeat(starts, counts)
+            return np.add.reduceat(np.where(ranks < top_n, np.take_along_axis(scores, order, axis=-1), 0), starts, axis=-1)
+        case "softmax":
+            # softmax-weighted mean of the run, between the mean and the max depending on temperature
+            best = np.repeat(np.maximum.reduceat(scores, starts, axis=-1), counts, axis=-1)
+            weights = np.exp((scores - best) / temperature)
+            return np.add.reduceat(weights * scores, starts, axis=-1) / np.add.reduceat(weights, starts, axis=-1)
+        case _:
+            raise ValueError(f"Unknown pooling method: {pooling}")
+
+def normalize_embeddings(embeddings: ndarray) -> ndarray:
+    # contiguous float32 rows scaled to unit length, so a dot product is the cosine similarity; zero rows stay zero
+    normalized = np.array(embeddings, dtype=np.float32, order="C")
+    norms = np.linalg.norm(normalized, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized /= norms
+    return normalized
@@ -1,75 +1,130 @@
-from lib.search_utils import SEMANTIC_MODEL, CACHE, MAX_CHUNK_SIZE, SENTENCE_OVERLAP, load_movies
+from lib.search_utils import SEMANTIC_MODEL, INFERENCE_BACKEND, CACHE, MAX_CHUNK_SIZE, SENTENCE_OVERLAP, EMBEDDING_QUANTIZATION, QUERY_BATCH_SIZE, load_movies, normalize_embeddings, top_k_indices
+from lib.quantization import QuantizedEmbeddings, load_or_build_quantized
+from lib.query_cache import QueryEmbeddingCache, get_query_cache
+from lib.embedding_store import save_array, open_embeddings, text_fingerprints, load_fingerprints, reuse_embeddings
+from lib.model_registry import get_model_registry, get_sentence_transformer
 
 import os
 import re
 import numpy as np
 from numpy import ndarray
-from sentence_transformers import SentenceTransformer
+from typing import Any
 
 
 
 class SemanticSearch:
-    def __init__(self, model_name: str=SEMANTIC_MODEL) -> None:
-        self.model = SentenceTransformer(model_name)
-        self.embeddings: ndarray[ndarray] | None = None # array of embedded documents
+    def __init__(self, model_name: str=SEMANTIC_MODEL, quantization: str=EMBEDDING_QUANTIZATION, backend: str=INFERENCE_BACKEND) -> None:
+        self.model_name = model_name
+        self.backend = backend # inference runtime the model is loaded with, one of INFERENCE_BACKENDS
+        # other backends produce slightly different vectors, so their queries are cached apart from torch's
+        self.query_cache: QueryEmbeddingCache = get_query_cache(model_name if backend == "torch" else f"{model_name}:{backend}") # query embeddings by text, in process and on disk
+        self.quantization = quantization # "float32" searches embeddings directly; other modes search codes and rescore a shortlist
+        self.embeddings: ndarray | None = None # L2-normalized float32 matrix of embedded documents, one row per document; memory-mapped once saved
+        self.quantized: QuantizedEmbeddings | None = None # compressed copy of embeddings, None in float32 mode
+        self.fingerprints: ndarray = np.empty(0, dtype=np.uint64) # content hash of the text behind each embedding
+        self.reused_count = 0 # embeddings copied from the previous build instead of encoded
+        self.encoded_count = 0 # embeddings encoded by the last build
         self.documents: list[dict] | None = None # list of documents
         self.docmap: dict[int, dict] = {} # mapping document IDs to document objects
         self.embeddings_path = os.path.join(CACHE, "movie_embeddings.npy")
+        self.fingerprints_path = os.path.join(CACHE, "movie_embeddings_fingerprints.npy")
+
+    @property
+    def model(self) -> Any:
+        # shared through the model registry and only loaded once something needs encoding
+        return get_sentence_transformer(self.model_name, self.backend)
 
     def generate_embedding(self, text: str) -> ndarray:
         if not text.strip():
             raise ValueError("Text empty or contains only whitespace")
-        return self.model.encode([text])[0]
+        return self.query_cache.get_or_encode(text, lambda text: self.model.encode([text])[0])
     
+    def encode_texts(self, texts: list[str]) -> ndarray:
+        return self.model.encode(texts, show_progress_bar=True)
+
     def build_embeddings(self, documents: list[dict]) -> ndarray[ndarray]:
+        # texts whose fingerprint is already saved keep their stored vector; only new or edited ones are encoded
         self.documents = documents
         doc_texts = []
         for doc in self.documents:
             self.docmap[doc["id"]] = doc
             doc_texts.append(f"{doc["title"]}: {doc["description"]}")
-        self.embeddings = self.model.encode(doc_texts, show_progress_bar=True)
+        fingerprints = text_fingerprints(doc_texts, self.model_name)
+        previous = open_embeddings(self.embeddings_path) if os.path.exists(self.embeddings_path) else None
+        self.embeddings, self.reused_count = reuse_embeddings(doc_texts, fingerprints, previous, load_fingerprints(self.fingerprints_path), self.encode_texts)
+        self.encoded_count = len(doc_texts) - self.reused_count
+        self.fingerprints = fingerprints
         self.save()
+        self.load()
         return self.embeddings
     
     def load_or_create_embeddings(self, documents: list[dict]) -> ndarray[ndarray]:
         self.documents = documents
+        doc_texts = []
         for doc in self.documents:
             self.docmap[doc["id"]] = doc
+            doc_texts.append(f"{doc["title"]}: {doc["description"]}")
         if os.path.exists(self.embeddings_path):
             self.load()
-            if len(self.embeddings) == len(self.documents):
+            if np.array_equal(self.fingerprints, text_fingerprints(doc_texts, self.model_name)):
                 return self.embeddings
         return self.build_embeddings(documents)
     
+    def generate_query_embedding(self, query: str) -> ndarray:
+        return normalize_embeddings(self.generate_embedding(query))
+
+    def generate_query_embeddings(self, queries: list[str]) -> ndarray:
+        # one model.encode call for every query the cache has not seen
+        for query in queries:
+            if not query.strip():
+                raise ValueError("Text empty or contains only whitespace")
+        return normalize_embeddings(self.query_cache.get_or_encode_many(queries, self.model.encode))
+    
     def search(self, query, limit) -> list[dict]:
+        return self.search_many([query], limit)[0]
+
+    def search_many(self, queries: list[str], limit: int) -> list[list[dict]]:
+        # top-k per query; each batch of queries is scored with one matrix-matrix product
         if self.embeddings is None:
             raise ValueError("No embeddings loaded. Call `load_or_create_embeddings` first.")
-        query_embedding = self.generate_embedding(query)
-        score_docs = []
-        for doc_embedding, doc in zip(self.embeddings, self.documents):
-            score = cosine_similarity(query_embedding, doc_embedding)
-            score_docs.append((score, doc))
-        score_docs.sort(key=lambda x: x[0], reverse=True)
+        query_embeddings = self.generate_query_embeddings(queries)
         results = []
-        for score, doc in score_docs[:limit]:
-            results.append({"score": score,
-                            "title": doc["title"],
-                            "description": doc["description"]})
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            batch = query_embeddings[start:start + QUERY_BATCH_SIZE]
+            if self.quantized is not None:
+                matches = [self.quantized.search(query_embedding, limit) for query_embedding in batch]
+            else:
+                matches = []
+                for scores in batch @ self.embeddings.T:
+                    rows = top_k_indices(scores, limit)
+                    matches.append((rows, scores[rows]))
+            for rows, scores in matches:
+                query_results = []
+                for i, score in zip(rows.tolist(), scores.tolist()):
+                    doc = self.documents[i]
+                    query_results.append({"score": score,
+                                          "title": doc["title"],
+                                          "description": doc["description"]})
+                results.append(query_results)
         return results
         
 
     def save(self) -> None:
         os.makedirs(CACHE, exist_ok=True)
-        with open(self.embeddings_path, "wb") as f:
-            np.save(f, self.embeddings)
+        save_array(self.embeddings_path, self.embeddings)
+        save_array(self.fingerprints_path, self.fingerprints)
 
     def load(self) -> None:
-        with open(self.embeddings_path, "rb") as f:
-            self.embeddings = np.load(f)
+        self.embeddings = open_embeddings(self.embeddings_path)
+        self.fingerprints = load_fingerprints(self.fingerprints_path)
+        if self.quantization != "float32":
+            # the codes are searched in memory; the float32 rows are only touched for rescoring
+            self.quantized = load_or_build_quantized(self.embeddings, self.embeddings_path, self.quantization)
 
 def verify_model() -> None:
     semantic_search = SemanticSearch()
     print(f"Model loaded: {semantic_search.model}")
+    print(f"Load time ({semantic_search.backend}): {get_model_registry().load_seconds[("sentence_transformer", semantic_search.model_name, semantic_search.backend)]:.2f} s")
     print(f"Max sequence length: {semantic_search.model.max_seq_length}")
 
 def embed_text(text: str) -> None:
@@ -83,6 +138,8 @@ def verify_embeddings() -> None:
     semantic_search = SemanticSearch()
     movies = load_movies()
     embeddings = semantic_search.load_or_create_embeddings(movies)
+    if semantic_search.reused_count or semantic_search.encoded_count:
+        print(f"Reused {semantic_search.reused_count} embeddings, encoded {semantic_search.encoded_count}")
     print(f"Number of docs: {len(movies)}")
     print(f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
 
@@ -101,8 +158,8 @@ def cosine_similarity(vec1: ndarray, vec2: ndarray) -> float:
         return 0
     return dot_product / (norm1 * norm2)
 
-def search_command(query: str, limit: int) -> None:
-    semantic_search = SemanticSearch()
+def search_command(query: str, limit: int, quantization: str=EMBEDDING_QUANTIZATION) -> None:
+    semantic_search = SemanticSearch(quantization=quantization)
     movies = load_movies()
     semantic_search.load_or_create_embeddings(movies)
     results = semantic_search.search(query, limit)
@@ -1,5 +1,6 @@
 from lib.multimodal import verify_image_embedding, image_search_command
-from lib.search_utils import DOCUMENT_PREVIEW_LENGTH
+from lib.quantization import QUANTIZATION_MODES
+from lib.search_utils import DOCUMENT_PREVIEW_LENGTH, EMBEDDING_QUANTIZATION
 
 import argparse
 
@@ -13,6 +14,7 @@ def main():
 
     image_search_parser = subparser.add_parser("image_search", help="Search movies using image path")
     image_search_parser.add_argument("image_path", type=str, help="Path location of image")
+    image_search_parser.add_argument("--quantization", type=str, choices=QUANTIZATION_MODES, default=EMBEDDING_QUANTIZATION, help="Keep the text embeddings compressed and score on the codes")
 
     args = parser.parse_args()
 
@@ -21,7 +23,7 @@ def main():
             dimensions = verify_image_embedding(args.image)
             print(f"Embedding shape: {dimensions} dimensions")
         case "image_search":
-            results = image_search_command(args.image_path)
+            results = image_search_command(args.image_path, args.quantization)
             for i, result in enumerate(results, 1):
                 print(f"{i}. {result["title"]} (similarity: {result["similarity_score"]:.3f})")
                 print(f"{result["document"][:DOCUMENT_PREVIEW_LENGTH]}...\n")
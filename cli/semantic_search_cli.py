@@ -2,7 +2,9 @@
 
 from lib.semantic_search import verify_model, embed_text, verify_embeddings, embed_query_text, search_command, chunk_text, semantic_chunk_text
 from lib.chunked_semantic_search import embed_chunks, search_chunked_command
-from lib.search_utils import RESULT_LIMIT, CHUNK_SIZE, WORD_OVERLAP, SENTENCE_OVERLAP, MAX_CHUNK_SIZE
+from lib.model_registry import preload_command
+from lib.quantization import QUANTIZATION_MODES
+from lib.search_utils import RESULT_LIMIT, CHUNK_SIZE, WORD_OVERLAP, SENTENCE_OVERLAP, MAX_CHUNK_SIZE, IVF_NPROBE, EMBEDDING_QUANTIZATION, POOLING_METHODS, CHUNK_POOLING, INFERENCE_BACKENDS, INFERENCE_BACKEND
 
 import argparse
 
@@ -13,6 +15,9 @@ def main() -> None:
 
     subparsers.add_parser("verify", help="Print model informaition")
 
+    preload_parser = subparsers.add_parser("preload", help="Load the semantic, multimodal and cross-encoder models and report load times")
+    preload_parser.add_argument("--backend", type=str, choices=INFERENCE_BACKENDS, default=INFERENCE_BACKEND, help="Inference runtime to load the models with")
+
     embed_text_parser = subparsers.add_parser("embed_text", help="Embed given text into vector")
     embed_text_parser.add_argument("text", type=str, help="Text to embed into vector")
 
@@ -24,6 +29,7 @@ def main() -> None:
     search_parser = subparsers.add_parser("search", help="Search movies using semantic search")
     search_parser.add_argument("query", type=str, help="Search query")
     search_parser.add_argument("--limit", type=int, nargs="?", default=RESULT_LIMIT, help="Set the result limit")
+    search_parser.add_argument("--quantization", type=str, choices=QUANTIZATION_MODES, default=EMBEDDING_QUANTIZATION, help="Search compressed embeddings, then rescore a shortlist at full precision")
 
     chunk_parser = subparsers.add_parser("chunk", help="Split long text into smaller pieces for embedding")
     chunk_parser.add_argument("text", help="text to chunk")
@@ -40,6 +46,10 @@ def main() -> None:
     search_chunked = subparsers.add_parser("search_chunked", help="Search movies using chunked semantic search")
     search_chunked.add_argument("query", type=str, help="Search query")
     search_chunked.add_argument("--limit", type=int, nargs="?", default=RESULT_LIMIT, help="Set the result limit")
+    search_chunked.add_argument("--nprobe", type=int, default=IVF_NPROBE, help="Number of IVF lists to scan; more is slower but finds more true neighbours")
+    search_chunked.add_argument("--exact", action="store_true", default=False, help="Scan every chunk instead of the IVF lists")
+    search_chunked.add_argument("--quantization", type=str, choices=QUANTIZATION_MODES, default=EMBEDDING_QUANTIZATION, help="Search compressed embeddings, then rescore a shortlist at full precision")
+    search_chunked.add_argument("--pooling", type=str, choices=POOLING_METHODS, default=CHUNK_POOLING, help="How a movie's chunk scores combine into its score")
 
     args = parser.parse_args()
 
@@ -47,6 +57,9 @@ def main() -> None:
         case "verify":
             print("Loading model...")
             verify_model()
+        case "preload":
+            for (kind, name, backend), seconds in preload_command(args.backend).items():
+                print(f"{name} ({kind}, {backend}): loaded in {seconds:.2f} s")
         case "embed_text":
             print("Embedding text...")
             embed_text(args.text)
@@ -57,7 +70,7 @@ def main() -> None:
             print("Embeding query...")
             embed_query_text(args.query)
         case "search":
-            search_command(args.query, args.limit)
+            search_command(args.query, args.limit, args.quantization)
         case "chunk":
             print(f"Chunking {len(args.text)} characters")
             chunk_text(args.text, args.chunk_size, args.overlap)
@@ -67,7 +80,7 @@ def main() -> None:
         case "embed_chunks":
             embed_chunks()
         case "search_chunked":
-            results = search_chunked_command(args.query, args.limit)
+            results = search_chunked_command(args.query, args.limit, args.nprobe, args.exact, args.quantization, args.pooling)
             for i, result in enumerate(results, 1):
                 print(f"\n{i}. {result["title"]} (score: {result["score"]:.4f})")
                 print(f"    {result["document"]}...")
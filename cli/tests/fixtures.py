@@ -0,0 +1,23 @@
+from lib import search_utils
+from lib.search_utils import get_analyzer
+
+import unittest
+from unittest import mock
+
+
+MOVIES = [
+    {"id": 1, "title": "Romeo and Juliet", "description": "Two young lovers in Verona."},
+    {"id": 2, "title": "Space Odyssey", "description": "An astronaut and a computer travel to Jupiter."},
+    {"id": 3, "title": "Romeo Must Die", "description": "A former cop avenges his brother."}
+]
+
+STOP_WORDS = ["a", "an", "and", "his", "in", "must", "the", "to", "two"]
+
+
+def use_stop_words() -> None:
+    # data/stopwords.txt is not part of the repository, so the analyzer gets a fixed list for the module's tests
+    unittest.addModuleCleanup(get_analyzer.cache_clear)
+    patcher = mock.patch.object(search_utils, "get_stop_words", lambda: STOP_WORDS)
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+    get_analyzer.cache_clear()
@@ -0,0 +1,47 @@
+import unittest
+
+from lib.boolean_query import parse_query, keyword_query
+from lib.inverted_index import InvertedIndex
+from fixtures import MOVIES, use_stop_words
+
+
+def setUpModule() -> None:
+    use_stop_words()
+
+
+class MalformedQueryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = InvertedIndex()
+        self.index.build(MOVIES)
+
+    def ids(self, query: str) -> list[int]:
+        return [result["id"] for result in self.index.boolean_search(query, 10)]
+
+    def test_parse_query_rejects_malformed_queries(self) -> None:
+        for query in ["romeo AND", "romeo )", "( romeo", "AND romeo", "NOT"]:
+            with self.assertRaises(ValueError):
+                parse_query(query)
+
+    def test_keyword_query_ors_the_terms(self) -> None:
+        self.assertEqual(keyword_query("romeo AND"), ("term", "romeo"))
+        self.assertEqual(keyword_query("( romeo OR ) space"), ("or", [("term", "romeo"), ("term", "space")]))
+        with self.assertRaises(ValueError):
+            keyword_query("AND ( )")
+
+    def test_malformed_queries_fall_back_to_keywords(self) -> None:
+        self.assertEqual(self.ids("romeo AND"), [1, 3])
+        self.assertEqual(self.ids("romeo )"), [1, 3])
+        self.assertEqual(self.ids(") space ( romeo"), [1, 2, 3])
+
+    def test_well_formed_queries_still_use_operators(self) -> None:
+        self.assertEqual(self.ids("romeo AND verona"), [1])
+        self.assertEqual(self.ids("romeo NOT verona"), [3])
+
+    def test_queries_without_terms_raise(self) -> None:
+        for query in ["", "AND", "( )"]:
+            with self.assertRaises(ValueError):
+                self.index.boolean_search(query, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from lib.fusion import Fusion
+from lib.search_utils import FUSION_STRATEGIES, NORMALIZATIONS, top_k_indices
+
+
+def random_legs(rng: np.random.Generator, doc_count: int, depth: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    # two rankings of the top depth docs out of doc_count, best first, that agree on a shared relevance up to noise
+    relevance = rng.gamma(1.0, 1.0, doc_count)
+    legs = []
+    for scale in (12.0, 1.0):
+        scores = scale * (relevance + rng.normal(0, 0.3, doc_count))
+        doc_ids = np.argsort(-scores)[:depth]
+        legs.append((doc_ids, scores[doc_ids]))
+    return legs
+
+
+class AdaptiveDepthTest(unittest.TestCase):
+    def test_final_prefix_matches_full_fusion(self) -> None:
+        # whenever is_final stops at a prefix depth, that prefix's top limit must be the full rankings' top limit
+        rng = np.random.default_rng(0)
+        limit, depths = 5, [10, 40, 160, 400]
+        stopped_early = 0
+        for strategy in FUSION_STRATEGIES:
+            for normalization in NORMALIZATIONS:
+                fusion = Fusion(strategy, normalization)
+                for _ in range(20):
+                    legs = random_legs(rng, 600, depths[-1])
+                    references = [scores for _, scores in legs]
+                    full_ids, _, _, full_fused = fusion.fuse(legs, references)
+                    full_top = top_k_indices(full_fused, limit)
+                    for depth in depths:
+                        doc_ids, ranks, _, fused = fusion.fuse([(ids[:depth], scores[:depth]) for ids, scores in legs], references)
+                        top = top_k_indices(fused, limit)
+                        if fusion.is_final(ranks, fused, top, references, depth, limit):
+                            break
+                    self.assertEqual(set(doc_ids[top].tolist()), set(full_ids[full_top].tolist()), (strategy, normalization, depth))
+                    np.testing.assert_allclose(fused[top], full_fused[full_top])
+                    stopped_early += depth < depths[-1]
+        self.assertGreater(stopped_early, 0)
+
+    def test_full_depth_is_final(self) -> None:
+        legs = random_legs(np.random.default_rng(1), 100, 30)
+        references = [scores for _, scores in legs]
+        for strategy in FUSION_STRATEGIES:
+            fusion = Fusion(strategy)
+            doc_ids, ranks, _, fused = fusion.fuse(legs, references)
+            self.assertTrue(fusion.is_final(ranks, fused, top_k_indices(fused, 5), references, 30, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import json
+import random
+import tempfile
+import unittest
+
+from lib.inverted_index import InvertedIndex
+from fixtures import MOVIES, use_stop_words
+
+
+def setUpModule() -> None:
+    use_stop_words()
+
+
+class DeletedDocumentTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = InvertedIndex()
+        self.index.build(MOVIES)
+        self.index.delete_document(2)
+
+    def test_query_without_matches_after_delete(self) -> None:
+        results = self.index.bm25_search("zebra", 10)
+        self.assertEqual([result["id"] for result in results], [1, 3])
+        self.assertEqual([result["score"] for result in results], [0, 0])
+        doc_ids, scores = self.index.bm25_ranking("zebra", 10)
+        self.assertEqual(doc_ids.tolist(), [1, 3])
+        self.assertEqual(scores.tolist(), [0, 0])
+
+
+WORDS = ["space", "robot", "love", "war", "ship", "river", "ghost", "king", "city", "night", "storm", "heist"]
+QUERIES = ["space robot", "love war ship", "ghost king", "river", "storm heist city night", "zebra"]
+
+
+def movie(doc_id: int, rng: random.Random) -> dict:
+    return {"id": doc_id, "title": " ".join(rng.choices(WORDS, k=2)), "description": " ".join(rng.choices(WORDS, k=rng.randint(3, 12)))}
+
+
+class IncrementalIndexTest(unittest.TestCase):
+    # an index built up by adds, updates, deletes, saves and merges must answer like one rebuilt from the final documents
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        rng = random.Random(0)
+        self.movies = {doc_id: movie(doc_id, rng) for doc_id in range(1, 41)}
+        self.index = self.new_index()
+        self.index.build([self.movies[doc_id] for doc_id in range(1, 21)])
+        self.index.save()
+        # single-document saves fill a size tier until save() merges it
+        for doc_id in range(21, 27):
+            self.index.add_document(self.movies[doc_id])
+            self.index.save()
+        self.movies[3] = movie(3, rng)
+        self.index.update_document(self.movies[3])
+        self.index.delete_document(5)
+        del self.movies[5]
+        self.index.save()
+        # several unsaved segments, folded together by the next save
+        self.index.add_documents([self.movies[doc_id] for doc_id in range(27, 41)])
+        self.movies[21] = movie(21, rng)
+        self.index.update_document(self.movies[21])
+        self.index.delete_document(30)
+        del self.movies[30]
+        self.index.delete_document(12)
+        del self.movies[12]
+
+    def new_index(self) -> InvertedIndex:
+        index = InvertedIndex()
+        index.manifest_path = os.path.join(self.directory.name, "index_manifest.json")
+        return index
+
+    def rebuilt(self) -> InvertedIndex:
+        index = InvertedIndex()
+        index.build(list(self.movies.values()))
+        return index
+
+    def assertSameAnswers(self, index: InvertedIndex, expected: InvertedIndex) -> None:
+        self.assertEqual(index.doc_count, expected.doc_count)
+        self.assertAlmostEqual(index.avg_doc_length, expected.avg_doc_length)
+        self.assertEqual(sorted(index.docmap), sorted(self.movies))
+        self.assertEqual({doc_id: index.docmap[doc_id] for doc_id in index.docmap}, self.movies)
+        for query in QUERIES:
+            # ties rank in ordinal order, which differs between the two, so scores are compared per document
+            results = {result["id"]: result["score"] for result in index.bm25_search(query, len(self.movies))}
+            expected_results = {result["id"]: result["score"] for result in expected.bm25_search(query, len(self.movies))}
+            self.assertEqual(results.keys(), expected_results.keys())
+            for doc_id, score in expected_results.items():
+                self.assertAlmostEqual(results[doc_id], score, places=3)
+            doc_ids, scores = index.bm25_ranking(query, len(self.movies))
+            self.assertEqual(sorted(scores.tolist(), reverse=True), scores.tolist())
+            self.assertEqual(set(doc_ids.tolist()), set(self.movies))
+            self.assertEqual(sorted(result["id"] for result in index.boolean_search(query, 100)), sorted(result["id"] for result in expected.boolean_search(query, 100)))
+        for term in ["space", "ghost"]:
+            self.assertEqual(sorted(index.get_documents(term)), sorted(expected.get_documents(term)))
+            self.assertAlmostEqual(index.get_bm25_idf(term), expected.get_bm25_idf(term))
+
+    def test_unsaved_changes_match_rebuild(self) -> None:
+        self.assertSameAnswers(self.index, self.rebuilt())
+
+    def test_saved_and_loaded_index_matches_rebuild(self) -> None:
+        self.index.save()
+        loaded = self.new_index()
+        loaded.load()
+        self.assertLess(len(loaded.segments), 9)
+        self.assertSameAnswers(loaded, self.rebuilt())
+
+    def test_merge_matches_rebuild(self) -> None:
+        self.index.merge()
+        self.assertEqual(len(self.index.segments), 1)
+        self.assertIsNone(self.index.live)
+        self.assertSameAnswers(self.index, self.rebuilt())
+
+    def test_save_removes_replaced_segments(self) -> None:
+        self.index.save()
+        with open(self.index.manifest_path, "r") as f:
+            names = json.load(f)["segments"]
+        files = sorted(name for name in os.listdir(self.directory.name) if name.endswith(".seg"))
+        self.assertEqual(files, sorted(names))
+
+    def test_deleted_and_replaced_documents_are_gone(self) -> None:
+        for doc_id in [5, 12, 30]:
+            self.assertNotIn(doc_id, self.index.docmap)
+            with self.assertRaises(KeyError):
+                self.index.delete_document(doc_id)
+        with self.assertRaises(ValueError):
+            self.index.add_document(self.movies[1])
+
+    def test_query_without_matches_after_changes(self) -> None:
+        self.index.save()
+        loaded = self.new_index()
+        loaded.load()
+        doc_ids, scores = loaded.bm25_ranking("zebra", len(self.movies))
+        self.assertEqual(set(doc_ids.tolist()), set(self.movies))
+        self.assertEqual(set(scores.tolist()), {0})
+
+
+if __name__ == "__main__":
+    unittest.main()